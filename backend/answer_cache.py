@@ -0,0 +1,223 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from cache import make_store
+
+load_dotenv()
+
+# Semantic answer cache for /rag/ask: answers are reused for new questions whose
+# embedding has cosine similarity >= ANSWER_CACHE_THRESHOLD with a previous one
+# asked with the same background and retrieval filters. Entries expire after
+# ANSWER_CACHE_TTL_HOURS and are dropped when the collection is re-ingested:
+# ingest bumps a generation marker in the shared cache store (CACHE_BACKEND),
+# which workers check every ANSWER_CACHE_GENERATION_CHECK_SECONDS. Without a
+# shared store (CACHE_BACKEND=memory, the default) a CLI ingest could not
+# reach the API workers, so the answer cache stays off.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24"))
+ANSWER_CACHE_GENERATION_CHECK_SECONDS = float(os.getenv("ANSWER_CACHE_GENERATION_CHECK_SECONDS", "5"))
+
+GENERATION_KEY = "generation"
+
+def answer_scope(background: Optional[str], chapter: Optional[str] = None, section: Optional[str] = None,
+                 score_threshold: Optional[float] = None) -> str:
+    """Requests only share answers within a scope: same background and retrieval filters"""
+    return f"{(background or 'General').strip().lower()}|{chapter or ''}|{section or ''}|{score_threshold}"
+
+class SemanticAnswerCache:
+    """
+    Answers indexed by normalized query embedding, one numpy matrix per scope,
+    searched by brute-force cosine similarity. Bounded to max_entries (oldest
+    first out). Thread-safe.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_HOURS * 3600, generation_store=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation_store = generation_store
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # Bumped on every clear, so answers generated from before one are not added after it
+        self.epoch = 0
+        # scope -> entries, and the scope's vectors stacked (None until the next lookup after a change)
+        self._entries: Dict[str, List[Dict]] = {}
+        self._matrices: Dict[str, Optional[np.ndarray]] = {}
+        # entry id -> scope, oldest first
+        self._order: "OrderedDict[int, str]" = OrderedDict()
+        self._local_generation = 0
+        self._generation = None
+        self._generation_checked = 0.0
+        self.counters = {"hits": 0, "misses": 0, "skipped": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        self._miss_seconds = 0.0
+        self._miss_samples = 0
+        self._hit_seconds = 0.0
+        self._saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        # The all-zero vector is what get_embedding returns without an API key or on errors
+        return array / norm if norm > 0 else None
+
+    def _read_shared_generation(self) -> Optional[str]:
+        if self.generation_store is None:
+            return None
+        try:
+            found = self.generation_store.get(GENERATION_KEY)
+            return found[0] if found else None
+        except Exception as e:
+            print(f"Answer cache generation read failed: {e}")
+            return self._generation[1] if self._generation else None
+
+    def _clear_locked(self):
+        self.epoch += 1
+        self._entries.clear()
+        self._matrices.clear()
+        self._order.clear()
+
+    def _check_generation(self):
+        now = time.monotonic()
+        if self._generation is not None and now - self._generation_checked < ANSWER_CACHE_GENERATION_CHECK_SECONDS:
+            return
+        generation = (self._local_generation, self._read_shared_generation())
+        with self._lock:
+            self._generation_checked = now
+            if self._generation is not None and generation != self._generation:
+                self._clear_locked()
+                self.counters["invalidations"] += 1
+            self._generation = generation
+
+    def invalidate(self):
+        """Drop every answer, here and (through the shared marker) in the other workers"""
+        if self.generation_store is not None:
+            try:
+                self.generation_store.set(GENERATION_KEY, str(time.time_ns()), time.time() + 10 * 365 * 86400)
+            except Exception as e:
+                print(f"Answer cache generation write failed: {e}")
+        with self._lock:
+            self._local_generation += 1
+            self._clear_locked()
+            self.counters["invalidations"] += 1
+            # Re-read on the next lookup, including the marker just written
+            self._generation = None
+
+    def _remove(self, entry_id: int):
+        scope = self._order.pop(entry_id)
+        self._entries[scope] = [e for e in self._entries[scope] if e["id"] != entry_id]
+        self._matrices[scope] = None
+        if not self._entries[scope]:
+            del self._entries[scope]
+            del self._matrices[scope]
+
+    def lookup(self, vector, scope: str) -> Optional[Dict]:
+        """The closest cached entry in scope at or above the threshold, with its similarity"""
+        query = self._normalize(vector)
+        if query is None:
+            self.counters["skipped"] += 1
+            return None
+        self._check_generation()
+        with self._lock:
+            now = time.time()
+            for entry in [e for e in self._entries.get(scope, []) if e["expires_at"] <= now]:
+                self._remove(entry["id"])
+                self.counters["expirations"] += 1
+            entries = self._entries.get(scope)
+            if entries:
+                if self._matrices[scope] is None:
+                    self._matrices[scope] = np.stack([e["vector"] for e in entries])
+                similarities = self._matrices[scope] @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.counters["hits"] += 1
+                    hit = {k: v for k, v in entries[best].items() if k != "vector"}
+                    return {**hit, "similarity": float(similarities[best])}
+            self.counters["misses"] += 1
+            return None
+
+    def add(self, vector, scope: str, query: str, answer: str, context: list, latency: float = None,
+            epoch: int = None):
+        """
+        Cache an answer; latency is how long retrieval and generation took, and
+        epoch the cache's epoch before retrieval started (None: don't check).
+        """
+        normalized = self._normalize(vector)
+        if normalized is None:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            entry = {
+                "id": self._next_id,
+                "vector": normalized,
+                "query": query,
+                "answer": answer,
+                "context": context,
+                "expires_at": time.time() + self.ttl_seconds
+            }
+            self._next_id += 1
+            self._entries.setdefault(scope, []).append(entry)
+            self._matrices[scope] = None
+            self._order[entry["id"]] = scope
+            while len(self._order) > self.max_entries:
+                self._remove(next(iter(self._order)))
+                self.counters["evictions"] += 1
+            if latency is not None:
+                self._miss_seconds += latency
+                self._miss_samples += 1
+
+    def record_hit(self, latency: float):
+        """Account a hit's latency against the average miss latency"""
+        with self._lock:
+            self._hit_seconds += latency
+            if self._miss_samples:
+                self._saved_seconds += max(0.0, self._miss_seconds / self._miss_samples - latency)
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses = self.counters["hits"], self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "entries": len(self._order),
+                "scopes": len(self._entries),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "avg_miss_latency_ms": round(self._miss_seconds / self._miss_samples * 1000, 1) if self._miss_samples else None,
+                "avg_hit_latency_ms": round(self._hit_seconds / hits * 1000, 1) if hits else None,
+                "saved_seconds": round(self._saved_seconds, 3),
+                "shared_generation": type(self.generation_store).__name__ if self.generation_store is not None else None
+            }
+
+def shared_generation_available(generation_store) -> bool:
+    """Whether re-ingestion by another process can invalidate the cache"""
+    return generation_store is not None
+
+ANSWER_CACHE = SemanticAnswerCache(
+    generation_store=make_store(
+        os.getenv("CACHE_BACKEND", "memory"), "answer_cache_meta",
+        os.getenv("CACHE_PATH", "cache.db"), os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    )
+)
+# Why the cache is off although ANSWER_CACHE_ENABLED is set; the API logs it at startup
+ANSWER_CACHE_DISABLED_REASON = None
+if ANSWER_CACHE_ENABLED and not shared_generation_available(ANSWER_CACHE.generation_store):
+    ANSWER_CACHE_ENABLED = False
+    ANSWER_CACHE_DISABLED_REASON = ("it needs a shared CACHE_BACKEND (sqlite or redis) "
+                                    "to be invalidated when the collection is re-ingested")
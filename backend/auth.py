@@ -3,9 +3,42 @@ from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import os
 from dotenv import load_dotenv
+from cache import TTLCache
+
+try:
+    import jwt
+except ImportError:
+    jwt = None
 
 load_dotenv()
 
+# Access tokens are verified locally with PyJWT[crypto] (in requirements.txt)
+# instead of with a Supabase round trip per request. HS256 tokens are checked
+# against SUPABASE_JWT_SECRET (Project Settings > API > JWT secret); tokens
+# signed with asymmetric keys are checked against the project's JWKS, fetched
+# once and kept for JWKS_CACHE_SECONDS. Both get the same claim checks. Tokens
+# there is no secret or key for fall back to supabase.auth.get_user. A locally verified token stays valid
+# until it expires, even if the session is revoked before then.
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{os.getenv('SUPABASE_URL').rstrip('/')}/auth/v1/.well-known/jwks.json" if os.getenv("SUPABASE_URL") else None
+)
+JWKS_CACHE_SECONDS = int(os.getenv("JWKS_CACHE_SECONDS", "3600"))
+JWT_LEEWAY_SECONDS = int(os.getenv("JWT_LEEWAY_SECONDS", "30"))
+
+# Profiles read by /auth/me, per worker and kept briefly: update_user_profile
+# drops the entry in its own worker, other workers may serve the old profile
+# for up to PROFILE_CACHE_TTL_SECONDS. Not written to the shared cache store.
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+PROFILE_CACHE = TTLCache(
+    max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=16 * 1024 * 1024,
+    ttl_seconds=PROFILE_CACHE_TTL_SECONDS
+)
+
+TOKEN_STATS = {"local": 0, "remote": 0, "rejected": 0}
+
 class User(BaseModel):
     email: str
     password: str
@@ -117,6 +150,7 @@ def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
             return None
         
         profile = profile_response.data[0]
+        PROFILE_CACHE.set(user_id, profile)
         
         return {
             "id": profile["id"],
@@ -135,7 +169,11 @@ def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
         return None
 
 def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
-    """Get user profile by ID"""
+    """Get user profile by ID, from the profile cache when possible"""
+    cached = PROFILE_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+
     if not supabase:
         init_supabase()
     
@@ -145,7 +183,9 @@ def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
         if profile_response.data is None or len(profile_response.data) == 0:
             return None
         
-        return profile_response.data[0]
+        profile = profile_response.data[0]
+        PROFILE_CACHE.set(user_id, profile)
+        return profile
         
     except Exception as e:
         print(f"Error getting user profile: {e}")
@@ -158,6 +198,7 @@ def update_user_profile(user_id: str, profile_data: Dict[str, Any]) -> bool:
     
     try:
         profile_response = supabase.table("profiles").update(profile_data).eq("id", user_id).execute()
+        PROFILE_CACHE.delete(user_id)
         
         return profile_response.data is not None
         
@@ -165,13 +206,77 @@ def update_user_profile(user_id: str, profile_data: Dict[str, Any]) -> bool:
         print(f"Error updating user profile: {e}")
         return False
 
+class InvalidToken(Exception):
+    pass
+
+_jwks_client = None
+
+def _jwks_signing_key(token: str):
+    """Signing key for token from the project's JWKS, None if it can't be fetched"""
+    global _jwks_client
+    if jwt is None or not SUPABASE_JWKS_URL:
+        return None
+    try:
+        if _jwks_client is None:
+            _jwks_client = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=JWKS_CACHE_SECONDS)
+        return _jwks_client.get_signing_key_from_jwt(token).key
+    except jwt.PyJWKClientError as e:
+        print(f"JWKS unavailable, verifying tokens remotely: {e}")
+        return None
+
+def decode_access_token(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Claims of a locally verified access token, or None if it can't be verified
+    locally (no secret or key for its algorithm). Raises InvalidToken if it is
+    malformed, badly signed, expired or meant for another audience.
+    """
+    if jwt is None:
+        return None
+    try:
+        algorithm = jwt.get_unverified_header(token).get("alg")
+    except jwt.InvalidTokenError as e:
+        raise InvalidToken(f"malformed token: {e}")
+
+    if algorithm == "HS256":
+        key = SUPABASE_JWT_SECRET
+    elif algorithm in ("RS256", "ES256", "EdDSA"):
+        key = _jwks_signing_key(token)
+    else:
+        raise InvalidToken(f"unsupported algorithm: {algorithm}")
+    if not key:
+        return None
+
+    try:
+        claims = jwt.decode(token, key, algorithms=[algorithm], audience=SUPABASE_JWT_AUDIENCE,
+                            leeway=JWT_LEEWAY_SECONDS, options={"require": ["exp", "sub"]})
+    except jwt.InvalidTokenError as e:
+        raise InvalidToken(str(e))
+    if not claims["sub"]:
+        raise InvalidToken("no subject")
+    return claims
+
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
     """Verify JWT token and get user info"""
+    try:
+        claims = decode_access_token(token)
+    except InvalidToken as e:
+        TOKEN_STATS["rejected"] += 1
+        print(f"Rejected token: {e}")
+        return None
+    if claims is not None:
+        TOKEN_STATS["local"] += 1
+        return {
+            "id": claims["sub"],
+            "email": claims.get("email"),
+            "aud": claims.get("aud")
+        }
+
     if not supabase:
         init_supabase()
     
     try:
         # Verify token with Supabase Auth
+        TOKEN_STATS["remote"] += 1
         user_response = supabase.auth.get_user(token)
         
         if user_response.user is None:
@@ -187,5 +292,16 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
         print(f"Error verifying token: {e}")
         return None
 
+def get_auth_cache_stats() -> Dict[str, Any]:
+    """How tokens were verified, and profile cache statistics"""
+    return {
+        "tokens": {
+            **TOKEN_STATS,
+            "hs256_secret": bool(SUPABASE_JWT_SECRET),
+            "jwks": bool(jwt is not None and SUPABASE_JWKS_URL)
+        },
+        "profiles": PROFILE_CACHE.stats()
+    }
+
 # Initialize Supabase on module import
 init_supabase()
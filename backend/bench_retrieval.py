@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Retrieval benchmark: recall@k and latency of rag.search_context on the ingested textbook.
+
+Each sampled chunk is turned into a query (its first sentence) and counts as a hit
+when that same chunk comes back in the top-k. ANN recall is measured separately
+against an exact (brute-force) Qdrant search with the same query vector.
+
+Usage: python bench_retrieval.py --samples 50 --k 5
+"""
+
+import sys
+import os
+import re
+import time
+import asyncio
+import random
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from qdrant_client.models import SearchParams
+from db import qdrant_client
+from rag import search_context, get_embedding, COLLECTION_NAME
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def load_chunks():
+    """Scroll every point payload out of the collection"""
+    payloads = []
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=COLLECTION_NAME,
+            limit=256,
+            offset=offset,
+            with_payload=True
+        )
+        payloads.extend(p.payload for p in points if p.payload)
+        if offset is None:
+            return payloads
+
+def make_query(text: str) -> str:
+    """Use the first sentence of a chunk as a query for it"""
+    sentence = re.split(r'(?<=[.!?])\s', text.strip(), maxsplit=1)[0]
+    return ' '.join(sentence.split()[:30])
+
+def same_chunk(a: dict, b: dict) -> bool:
+    return a.get('filepath') == b.get('filepath') and a.get('chunk_index') == b.get('chunk_index')
+
+async def run(samples: int, k: int):
+    if not qdrant_client:
+        print("Error: Qdrant client not initialized")
+        return 1
+
+    chunks = load_chunks()
+    if not chunks:
+        print(f"Collection '{COLLECTION_NAME}' is empty. Please run ingest.py first.")
+        return 1
+
+    sample = random.sample(chunks, min(samples, len(chunks)))
+    hits = 0
+    ann_overlap = 0.0
+    search_latencies = []
+    ann_latencies = []
+
+    for chunk in sample:
+        query = make_query(chunk.get('text', ''))
+
+        start = time.perf_counter()
+        results = await search_context(query, limit=k)
+        search_latencies.append((time.perf_counter() - start) * 1000)
+        if any(same_chunk(r, chunk) for r in results):
+            hits += 1
+
+        vector = await get_embedding(query)
+        start = time.perf_counter()
+        approx = qdrant_client.query_points(COLLECTION_NAME, query=vector, limit=k).points
+        ann_latencies.append((time.perf_counter() - start) * 1000)
+        exact = qdrant_client.query_points(
+            COLLECTION_NAME, query=vector, limit=k, search_params=SearchParams(exact=True)
+        ).points
+        exact_ids = {p.id for p in exact}
+        if exact_ids:
+            ann_overlap += len(exact_ids & {p.id for p in approx}) / len(exact_ids)
+
+    n = len(sample)
+    print("=" * 60)
+    print(f"RETRIEVAL BENCHMARK ({n} queries over {len(chunks)} chunks, k={k})")
+    print("=" * 60)
+    print(f"recall@{k} (source chunk in top-k): {hits / n:.3f}")
+    print(f"ANN recall@{k} vs exact search:     {ann_overlap / n:.3f}")
+    print(f"search_context latency  p50: {percentile(search_latencies, 50):.1f} ms  p99: {percentile(search_latencies, 99):.1f} ms")
+    print(f"Qdrant ANN query latency p50: {percentile(ann_latencies, 50):.1f} ms  p99: {percentile(ann_latencies, 99):.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=50, help="number of chunks to query")
+    parser.add_argument("--k", type=int, default=5, help="top-k results per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    sys.exit(asyncio.run(run(args.samples, args.k)))
@@ -0,0 +1,319 @@
+import json
+import time
+import heapq
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+def approx_size(value: Any) -> int:
+    """Approximate memory footprint of a JSON-like value in bytes"""
+    if isinstance(value, str):
+        return 49 + len(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return 33 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(approx_size(v) for v in value)
+    return 28
+
+class SQLiteStore:
+    """
+    Persistent key/value store for cache entries, one table per cache.
+    Values are JSON-encoded; expired rows are skipped on read and purged on write.
+    The file is opened in WAL mode, so several uvicorn workers on one host can
+    share it as an L2 cache.
+    """
+
+    def __init__(self, path: str, table: str):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+        self._conn.commit()
+
+    def load(self, limit: int) -> Iterator[Tuple[str, Any, float]]:
+        """Unexpired entries, newest last, at most `limit` of them"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value, expires_at FROM {self.table} WHERE expires_at > ? ORDER BY expires_at DESC LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        for key, value, expires_at in reversed(rows):
+            yield key, json.loads(value), expires_at
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, expires_at) if the key is present and unexpired"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+class RedisStore:
+    """
+    Shared cache store on a Redis-compatible server (Redis, Valkey, KeyDB, ...),
+    for workers on several hosts. Keys are namespaced by `prefix` and expire
+    server-side. Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str):
+        if redis is None:
+            raise RuntimeError("The redis package is not installed (pip install redis)")
+        self.prefix = f"{prefix}:"
+        self._client = redis.Redis.from_url(url)
+        self._client.ping()
+
+    def load(self, limit: int) -> Iterator[Tuple[str, Any, float]]:
+        # Entries are read through on demand instead of preloaded
+        return iter(())
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._client.pipeline() as pipe:
+            value, ttl_ms = pipe.get(self.prefix + key).pttl(self.prefix + key).execute()
+        if value is None or ttl_ms <= 0:
+            return None
+        return json.loads(value), time.time() + ttl_ms / 1000
+
+    def set(self, key: str, value: Any, expires_at: float):
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self._client.set(self.prefix + key, json.dumps(value), px=ttl_ms)
+
+    def delete(self, key: str):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + "*", count=1000):
+            self._client.delete(key)
+
+def make_store(backend: str, table: str, path: str = None, redis_url: str = None):
+    """
+    Build the shared store for a cache from configuration:
+    "sqlite" (a WAL file shared by workers on one host), "redis", or
+    "memory"/"" for none. Falls back to no store if the backend is unavailable.
+    """
+    backend = (backend or "memory").lower()
+    try:
+        if backend == "sqlite":
+            return SQLiteStore(path, table)
+        if backend == "redis":
+            return RedisStore(redis_url, table)
+    except Exception as e:
+        print(f"Cache backend '{backend}' unavailable for {table}, using in-process cache only: {e}")
+        return None
+    if backend != "memory":
+        print(f"Unknown cache backend '{backend}' for {table}, using in-process cache only")
+    return None
+
+# Sentinel for an L1 miss
+_MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a fixed TTL, bounded by entry count and an
+    approximate memory budget. Expired entries are evicted, not just skipped,
+    and every operation including stats() is O(log n) amortized.
+
+    With a `store`, this cache is the L1 tier in front of a shared L2: writes go
+    through to the store, L1 misses are read through from it, and a restarted
+    worker starts warm. Clearing only drops other workers' L1 entries when
+    they expire. Async callers use get_async()/set_async(), which do the store
+    I/O in a worker thread instead of on the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 24 * 3600, store: Optional[SQLiteStore] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        # key -> (value, expires_at, size), least recently used first
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        # (expires_at, key) min-heap. Entries read from the store keep their own
+        # expiry, so insertion order is not expiry order. Removed or replaced
+        # entries leave stale items behind, skipped when popped.
+        self._expiry: List[Tuple[float, str]] = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "l2_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        if store is not None:
+            try:
+                for key, value, expires_at in store.load(max_entries):
+                    with self._lock:
+                        self._insert(key, value, expires_at)
+            except Exception as e:
+                print(f"Cache store preload failed: {e}")
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _purge_expired(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+                self.counters["expirations"] += 1
+
+    def _insert(self, key: str, value: Any, expires_at: float):
+        if key in self._entries:
+            self._remove(key)
+        size = approx_size(key) + approx_size(value)
+        self._entries[key] = (value, expires_at, size)
+        heapq.heappush(self._expiry, (expires_at, key))
+        self._bytes += size
+        if len(self._expiry) > 2 * len(self._entries) + 64:
+            # Drop stale heap items left by removals and overwrites
+            self._expiry = [(entry[1], k) for k, entry in self._entries.items()]
+            heapq.heapify(self._expiry)
+        self._purge_expired(time.time())
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _get_local(self, key: str) -> Any:
+        """The L1 value, or _MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._remove(key)
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def _get_shared(self, key: str) -> Optional[Any]:
+        """Read an L1 miss through from the store"""
+        shared = None
+        if self.store is not None:
+            try:
+                shared = self.store.get(key)
+            except Exception as e:
+                print(f"Cache store read failed: {e}")
+        with self._lock:
+            if shared is None:
+                self.counters["misses"] += 1
+                return None
+            value, expires_at = shared
+            self._insert(key, value, expires_at)
+            self.counters["l2_hits"] += 1
+            return value
+
+    def _set_shared(self, key: str, value: Any, expires_at: float):
+        try:
+            self.store.set(key, value, expires_at)
+        except Exception as e:
+            print(f"Cache store write failed: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._get_local(key)
+        return self._get_shared(key) if value is _MISSING else value
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """get() for the event loop: an L1 miss is read from the store in a worker thread"""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+        if self.store is None:
+            return self._get_shared(key)
+        return await asyncio.to_thread(self._get_shared, key)
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(key, value, expires_at)
+        if self.store is not None:
+            self._set_shared(key, value, expires_at)
+
+    async def set_async(self, key: str, value: Any):
+        """set() for the event loop: the write-through to the store runs in a worker thread"""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(key, value, expires_at)
+        if self.store is not None:
+            await asyncio.to_thread(self._set_shared, key, value, expires_at)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            self._bytes = 0
+        if self.store is not None:
+            self.store.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.time()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            # Entries found expired now, before they are evicted
+            expirations = self.counters["expirations"]
+            self._purge_expired(time.time())
+            expired = self.counters["expirations"] - expirations
+            hits = self.counters["hits"] + self.counters["l2_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "expired_entries": expired,
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "shared_backend": type(self.store).__name__ if self.store is not None else None
+            }
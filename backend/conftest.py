@@ -0,0 +1,10 @@
+"""
+Test setup: the module-level translation memory and embedding cache stay in
+memory instead of creating SQLite files next to the code. Tests that need a
+store pass tmp_path to their own instances.
+"""
+
+import os
+
+os.environ["TRANSLATION_MEMORY_PATH"] = ""
+os.environ["EMBEDDING_CACHE_PATH"] = ""
@@ -1,4 +1,10 @@
 import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Callable, Dict, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -17,20 +23,285 @@ if QDRANT_URL and QDRANT_API_KEY:
 # Neon Postgres Setup
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Connection pool: up to DB_POOL_MAX_SIZE connections are kept open and reused,
+# so requests skip the TCP, TLS and auth setup and bursts can't exceed the
+# server's connection limit; callers beyond it wait up to
+# DB_POOL_ACQUIRE_TIMEOUT seconds. Connections idle for longer than
+# DB_POOL_HEALTH_CHECK_SECONDS are checked with SELECT 1 before reuse, since
+# Neon closes idle connections when it scales to zero.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+DB_POOL_HEALTH_CHECK_SECONDS = float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", "30"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections made by `connect`, between
+    min_size and max_size of them. Idle connections are reused most recently
+    used first; broken ones are closed and replaced.
+    """
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = DB_POOL_MIN_SIZE,
+                 max_size: int = DB_POOL_MAX_SIZE, acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+                 health_check_seconds: float = DB_POOL_HEALTH_CHECK_SECONDS):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_seconds = health_check_seconds
+        self._cond = threading.Condition()
+        # (connection, released at), most recently released last
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self.counters = {"acquired": 0, "created": 0, "closed": 0, "timeouts": 0, "health_check_failures": 0}
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        for _ in range(min(min_size, self.max_size)):
+            try:
+                self._idle.append((self._create(), time.monotonic()))
+                self._size += 1
+            except Exception as e:
+                print(f"Error opening pooled database connection: {e}")
+                break
+
+    def _create(self):
+        conn = self.connect()
+        with self._cond:
+            self.counters["created"] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.counters["closed"] += 1
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None):
+        """A connection for exclusive use until release(); raises PoolTimeout if none frees up in time"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.max_size:
+                        if self._closed:
+                            raise RuntimeError("Connection pool is closed")
+                        remaining = start + timeout - time.monotonic()
+                        if remaining <= 0:
+                            self.counters["timeouts"] += 1
+                            raise PoolTimeout(f"No database connection available after {timeout}s")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    self._size += 1
+                self._in_use += 1
+
+            if idle is None:
+                try:
+                    conn = self._create()
+                except Exception:
+                    self._discard_slot()
+                    raise
+            else:
+                conn, released_at = idle
+                stale = time.monotonic() - released_at >= self.health_check_seconds
+                if getattr(conn, "closed", False) or (stale and not self._is_healthy(conn)):
+                    with self._cond:
+                        self.counters["health_check_failures"] += 1
+                    self._close(conn)
+                    self._discard_slot()
+                    continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self.counters["acquired"] += 1
+                self._wait_seconds += waited
+                self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            return conn
+
+    def _discard_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._cond.notify()
+
+    def release(self, conn, discard: bool = False):
+        """Return a connection; it is closed instead if discard, broken or the pool is closed"""
+        if not discard and not getattr(conn, "closed", False):
+            try:
+                # Ends any transaction the caller left open
+                conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._in_use -= 1
+            self._cond.notify()
+        if discard or self._closed:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """with pool.connection() as conn: ... - committing is up to the caller"""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+    @asynccontextmanager
+    async def connection_async(self, timeout: Optional[float] = None):
+        """
+        Async variant for FastAPI handlers: waiting for a connection doesn't
+        block the event loop. Run queries with asyncio.to_thread or run_db.
+        """
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.acquire, timeout))
+        try:
+            conn = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The worker thread still gets a connection: hand it back when it does
+            acquiring.add_done_callback(self._release_abandoned)
+            raise
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            await asyncio.to_thread(self.release, conn, discard)
+
+    def _release_abandoned(self, acquiring: asyncio.Future):
+        if acquiring.cancelled() or acquiring.exception() is not None:
+            return
+        acquiring.get_loop().run_in_executor(None, self.release, acquiring.result())
+
+    async def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = None):
+        """fn(conn) on a pooled connection in a worker thread"""
+        def call():
+            with self.connection(timeout) as conn:
+                return fn(conn)
+        return await asyncio.to_thread(call)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            acquired = self.counters["acquired"]
+            return {
+                **self.counters,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "avg_wait_ms": round(self._wait_seconds / acquired * 1000, 2) if acquired else 0.0,
+                "max_wait_ms": round(self._max_wait_seconds * 1000, 2),
+                "closed": self._closed
+            }
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> Optional[ConnectionPool]:
+    """The process-wide pool, created on first use; None without DATABASE_URL"""
+    global _pool
+    if not DATABASE_URL:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(lambda: psycopg2.connect(
+                DATABASE_URL, cursor_factory=RealDictCursor, connect_timeout=DB_CONNECT_TIMEOUT
+            ))
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def db_connection(timeout: Optional[float] = None):
+    """A pooled connection, or None without DATABASE_URL"""
+    pool = get_pool()
+    if pool is None:
+        yield None
+        return
+    with pool.connection(timeout) as conn:
+        yield conn
+
+async def run_db(fn: Callable[[Any], Any], timeout: Optional[float] = None):
+    """fn(conn) on a pooled connection without blocking the event loop; None without DATABASE_URL"""
+    pool = get_pool()
+    if pool is None:
+        return None
+    return await pool.run(fn, timeout)
+
+def get_db_pool_stats() -> Dict:
+    pool = _pool
+    return pool.stats() if pool is not None else {"configured": bool(DATABASE_URL), "size": 0}
+
 def get_db_connection():
+    """A new unpooled connection, for one-off scripts; use db_connection() or run_db() in the app"""
     if not DATABASE_URL:
         return None
     try:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor, connect_timeout=DB_CONNECT_TIMEOUT)
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
 
-def init_db():
-    conn = get_db_connection()
-    if conn:
-        try:
+def init_db() -> bool:
+    """Create or migrate the tables; False if the database is unavailable or that failed"""
+    try:
+        with db_connection() as conn:
+            if conn is None:
+                return False
             cur = conn.cursor()
             # Users table with extended profile
             cur.execute("""
@@ -57,10 +328,35 @@ def init_db():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
+            # Progress and throughput of jobs started through POST /ingest (ingest_jobs.py)
+            cur.execute("""
+                ALTER TABLE ingest_jobs
+                    ADD COLUMN IF NOT EXISTS options JSONB,
+                    ADD COLUMN IF NOT EXISTS files_parsed INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS chunks_total INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS chunks_skipped INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS chunks_embedded INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS embedding_requests INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS embedding_cache_hits INTEGER DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS elapsed_seconds REAL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS chunks_per_second REAL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS embeddings_per_second REAL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS started_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status_idx ON ingest_jobs (status, updated_at)")
+            # At most one running job, enforced by the database so workers can't both claim one
+            cur.execute("""
+                UPDATE ingest_jobs SET status = 'failed', error_message = 'Superseded by a newer running job'
+                WHERE status = 'running' AND id < (SELECT MAX(id) FROM ingest_jobs WHERE status = 'running')
+            """)
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ingest_jobs_one_running ON ingest_jobs ((true)) WHERE status = 'running'")
             
             conn.commit()
             cur.close()
-            conn.close()
             print("Database initialized with extended schema.")
-        except Exception as e:
-            print(f"Error initializing database: {e}")
+            return True
+    except Exception as e:
+        print(f"Error initializing database: {e}")
+        return False
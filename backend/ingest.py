@@ -1,12 +1,29 @@
 import os
-import glob
+import re
+import json
+import fnmatch
+import time
+import random
+import argparse
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import requests
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, PayloadSchemaType, PointIdsList,
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+)
 import hashlib
 from dotenv import load_dotenv
+from rag import invalidate_collection_cache
+from embedding_cache import get_cache
+from answer_cache import ANSWER_CACHE
+import markdown_chunks
+from markdown_chunks import CHUNK_MAX_TOKENS, chunk_markdown, strip_mdx
 
 # Load environment variables
 load_dotenv()
@@ -19,19 +36,60 @@ EMBEDDING_MODEL = os.getenv("OPENROUTER_EMBEDDING_MODEL", "openai/text-embedding
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "physical_ai_textbook"
-DOCS_DIR = "../textbook/docs"
+# The textbook docs; by default the repo checkout next to this backend,
+# whatever the working directory (see the Dockerfile for containers)
+DOCS_DIR = os.getenv("DOCS_DIR", os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "textbook", "docs")))
+# Docs are found recursively under DOCS_DIR. INGEST_INCLUDE and INGEST_EXCLUDE
+# are comma-separated glob patterns matched against paths relative to DOCS_DIR;
+# patterns without a "/" match a file name (include) or any file or directory
+# name (exclude). By default .md and .mdx files are included and Docusaurus
+# partials ("_" prefix) and hidden directories excluded.
+INGEST_INCLUDE = [p.strip() for p in os.getenv("INGEST_INCLUDE", "*.md,*.mdx").split(",") if p.strip()]
+INGEST_EXCLUDE = [p.strip() for p in os.getenv("INGEST_EXCLUDE", "_*,.*,node_modules").split(",") if p.strip()]
+# Per-chunk content hashes from the last ingest, used by --incremental
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", ".ingest_manifest.json")
 
 # Initialize clients
 qdrant_client = None
 if QDRANT_URL and QDRANT_API_KEY:
     qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
 
-def get_embedding(text: str) -> List[float]:
-    """Generate embedding for text using OpenRouter"""
-    if not OPENROUTER_API_KEY:
-        print("Warning: No OpenRouter API key, using mock embeddings")
-        return [0.0] * 1536
-    
+# Embedding batches: at most EMBEDDING_BATCH_SIZE inputs and roughly
+# EMBEDDING_BATCH_TOKENS tokens per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", "1.0"))
+EMBEDDING_BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+UPSERT_BATCH_SIZE = 256
+
+# Reuse one keep-alive connection for all embedding requests
+http_session = requests.Session()
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English)"""
+    return len(text) // 4 + 1
+
+def make_batches(texts: List[str], batch_size: int, max_tokens: int) -> List[List[int]]:
+    """Group text indices into batches bounded by count and estimated tokens"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def request_embeddings(inputs: List[str]) -> List[List[float]]:
+    """Embed one batch, retrying with exponential backoff on 429/5xx and connection errors"""
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
@@ -41,73 +99,156 @@ def get_embedding(text: str) -> List[float]:
     
     payload = {
         "model": EMBEDDING_MODEL,
-        "input": text
+        "input": inputs
     }
     
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            response = http_session.post(
+                f"{OPENROUTER_BASE_URL}/embeddings",
+                headers=headers,
+                json=payload,
+                timeout=60
+            )
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                data = response.json()["data"]
+                if len(data) != len(inputs):
+                    raise ValueError(f"Expected {len(inputs)} embeddings, got {len(data)}")
+                # The API may return items out of order; "index" maps them back to inputs
+                return [item["embedding"] for item in sorted(data, key=lambda item: item["index"])]
+            error = requests.HTTPError(f"{response.status_code} - {response.text[:200]}", response=response)
+            retry_after = response.headers.get("Retry-After")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        
+        if attempt == EMBEDDING_MAX_RETRIES:
+            raise error
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(EMBEDDING_BACKOFF_MAX_SECONDS, EMBEDDING_BACKOFF_SECONDS * 2 ** attempt)
+            delay *= random.uniform(0.5, 1.0)
+        print(f"Embedding request failed ({error}), retrying in {delay:.1f}s...")
+        time.sleep(delay)
+
+def embed_batch(texts: List[str]):
+    """
+    Embed texts with at most one request, skipping texts already in the embedding cache.
+    Returns (vectors, cache_hits).
+    """
+    cache = get_cache()
+    vectors = cache.get_many(EMBEDDING_MODEL, texts) if cache else [None] * len(texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        fetched = request_embeddings([texts[i] for i in missing])
+        if cache:
+            cache.put_many(EMBEDDING_MODEL, [texts[i] for i in missing], fetched)
+        for i, vector in zip(missing, fetched):
+            vectors[i] = vector
+    return vectors, len(texts) - len(missing)
+
+def get_embeddings_batch(texts: List[str], batch_size: int = None, max_tokens: int = None) -> List[List[float]]:
+    """Generate embeddings for many texts in as few requests as possible, in input order"""
+    if not OPENROUTER_API_KEY:
+        print("Warning: No OpenRouter API key, using mock embeddings")
+        return [[0.0] * 1536 for _ in texts]
+    
+    embeddings = [None] * len(texts)
+    for batch in make_batches(texts, batch_size or EMBEDDING_BATCH_SIZE, max_tokens or EMBEDDING_BATCH_TOKENS):
+        vectors, _ = embed_batch([texts[i] for i in batch])
+        for i, vector in zip(batch, vectors):
+            embeddings[i] = vector
+    return embeddings
+
+def get_embedding(text: str) -> List[float]:
+    """Generate embedding for text using OpenRouter"""
     try:
-        response = requests.post(
-            f"{OPENROUTER_BASE_URL}/embeddings",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["data"][0]["embedding"]
+        return get_embeddings_batch([text])[0]
     except Exception as e:
         print(f"Embedding error: {e}")
         return [0.0] * 1536
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
-    """Split text into overlapping chunks"""
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        if len(chunk.strip()) > 50:  # Minimum chunk size
-            chunks.append(chunk)
-    
-    return chunks
+def _matches(rel_path: str, pattern: str, any_part: bool) -> bool:
+    if "/" in pattern:
+        return fnmatch.fnmatchcase(rel_path, pattern)
+    parts = rel_path.split("/")
+    return any(fnmatch.fnmatchcase(part, pattern) for part in (parts if any_part else parts[-1:]))
+
+def discover_docs(docs_dir: str = DOCS_DIR, include: List[str] = None, exclude: List[str] = None) -> List[str]:
+    """Paths (under docs_dir) of the docs to ingest, sorted"""
+    include = INGEST_INCLUDE if include is None else include
+    exclude = INGEST_EXCLUDE if exclude is None else exclude
+    found = []
+    for root, dirs, files in os.walk(docs_dir):
+        rel_root = os.path.relpath(root, docs_dir).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        # Excluded directories are not walked at all
+        dirs[:] = [d for d in dirs if not any(_matches(rel_root + d, p, True) for p in exclude)]
+        for name in files:
+            rel_path = rel_root + name
+            if any(_matches(rel_path, p, False) for p in include) and \
+                    not any(_matches(rel_path, p, True) for p in exclude):
+                found.append(os.path.join(docs_dir, *rel_path.split("/")))
+    return sorted(found)
+
+def chunk_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[str]:
+    """Split markdown into chunks of whole blocks under its headings (see markdown_chunks)"""
+    return [chunk['text'] for chunk in chunk_markdown(text, max_tokens)]
 
 def extract_metadata(filepath: str, content: str) -> Dict:
     """Extract metadata from markdown file"""
     filename = os.path.basename(filepath)
+    stem = os.path.splitext(filename)[0]
+    # Docs in a module directory ("module-01-ros2/index.md") belong to its chapter
+    module = next((part for part in reversed(Path(filepath).parts[:-1]) if re.match(r'(?:module|chapter)-\d+', part)), None)
+    heading = re.search(r'^#[ \t]+(.+?)[ \t#]*$', content, re.MULTILINE)
     
     # Extract chapter number and title
     if filename.startswith('chapter-'):
-        parts = filename.replace('.md', '').split('-')
+        parts = stem.split('-')
         chapter_num = parts[1] if len(parts) > 1 else '0'
         title = ' '.join(parts[2:]).title() if len(parts) > 2 else 'Unknown'
     elif filename == 'intro.md':
         chapter_num = '0'
         title = 'Introduction'
+    elif module:
+        chapter_num = module.split('-')[1]
+        title = markdown_chunks.heading_title(heading.group(1)) if heading else ' '.join(module.split('-')[2:]).title()
     else:
         chapter_num = '99'
-        title = filename.replace('.md', '').replace('-', ' ').title()
-    
-    # Extract first heading as section
-    lines = content.split('\n')
-    section = 'General'
-    for line in lines:
-        if line.startswith('##'):
-            section = line.replace('#', '').strip()
-            break
+        title = markdown_chunks.heading_title(heading.group(1)) if heading else stem.replace('-', ' ').title()
     
+    # The section is per chunk (process_markdown_file)
     return {
         'filename': filename,
         'chapter': chapter_num,
         'title': title,
-        'section': section,
         'filepath': filepath
     }
 
-def process_markdown_file(filepath: str) -> List[Dict]:
+def chunk_id(filepath: str, chunk: Dict, seen: Dict[str, int]) -> str:
+    """
+    Point id of a chunk, from its file, headings and text rather than its
+    position, so inserting or removing a chunk leaves the others' ids alone.
+    The file is taken relative to DOCS_DIR, so ids don't depend on where the
+    docs are checked out or mounted. seen counts repeats of identical chunks
+    in the file, which get their own ids.
+    """
+    doc_path = os.path.relpath(filepath, DOCS_DIR).replace(os.sep, "/")
+    key = json.dumps([doc_path, chunk['heading_path'], chunk['text']], ensure_ascii=False)
+    repeat = seen.get(key, 0)
+    seen[key] = repeat + 1
+    return hashlib.md5(f"{key}_{repeat}".encode()).hexdigest()
+
+def process_markdown_file(filepath: str, content: str = None) -> List[Dict]:
     """Process a single markdown file into chunks with metadata"""
     print(f"Processing: {filepath}")
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
+    if content is None:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
     
     # Remove frontmatter
     if content.startswith('---'):
@@ -115,21 +256,28 @@ def process_markdown_file(filepath: str) -> List[Dict]:
         if len(parts) >= 3:
             content = parts[2]
     
+    # Remove MDX imports/exports, JSX tags and comments, admonition fences
+    content = strip_mdx(content)
+    
     # Extract metadata
     metadata = extract_metadata(filepath, content)
     
-    # Chunk the content
-    chunks = chunk_text(content)
+    # Chunk the content by headings; each chunk records the headings it is under
+    chunks = chunk_markdown(content)
     
     # Create documents
     documents = []
+    seen = {}
     for i, chunk in enumerate(chunks):
-        doc_id = hashlib.md5(f"{filepath}_{i}".encode()).hexdigest()
+        doc_id = chunk_id(filepath, chunk, seen)
         documents.append({
             'id': doc_id,
-            'text': chunk,
+            'text': chunk['text'],
             'metadata': {
                 **metadata,
+                'section': chunk['section'],
+                'heading_path': chunk['heading_path'],
+                'tokens': chunk['tokens'],
                 'chunk_index': i,
                 'total_chunks': len(chunks)
             }
@@ -137,7 +285,7 @@ def process_markdown_file(filepath: str) -> List[Dict]:
     
     return documents
 
-def create_collection():
+def create_collection(collection_name: str = COLLECTION_NAME):
     """Create or recreate Qdrant collection"""
     if not qdrant_client:
         print("Error: Qdrant client not initialized")
@@ -146,25 +294,466 @@ def create_collection():
     try:
         # Delete existing collection
         try:
-            qdrant_client.delete_collection(COLLECTION_NAME)
-            print(f"Deleted existing collection: {COLLECTION_NAME}")
+            if qdrant_client.collection_exists(collection_name):
+                qdrant_client.delete_collection(collection_name)
+                print(f"Deleted existing collection: {collection_name}")
         except:
             pass
         
         # Create new collection
         qdrant_client.create_collection(
-            collection_name=COLLECTION_NAME,
+            collection_name=collection_name,
             vectors_config=VectorParams(size=1536, distance=Distance.COSINE)
         )
-        print(f"Created collection: {COLLECTION_NAME}")
+        
+        # Index the fields search_context filters on
+        for field in ('chapter', 'section'):
+            qdrant_client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=PayloadSchemaType.KEYWORD
+            )
+        invalidate_collection_cache()
+        print(f"Created collection: {collection_name}")
         return True
     
     except Exception as e:
         print(f"Error creating collection: {e}")
         return False
 
-def ingest_documents():
-    """Main ingestion function"""
+# Blue/green rebuilds: each full rebuild goes into COLLECTION_NAME_v<timestamp>
+# and COLLECTION_NAME becomes an alias that is switched atomically once the new
+# version is populated. KEEP_PREVIOUS_VERSIONS older versions are kept for rollback.
+KEEP_PREVIOUS_VERSIONS = int(os.getenv("KEEP_PREVIOUS_VERSIONS", "1"))
+VERSION_PREFIX = f"{COLLECTION_NAME}_v"
+
+def new_version_name() -> str:
+    name = f"{VERSION_PREFIX}{time.strftime('%Y%m%d%H%M%S', time.gmtime())}"
+    versions = list_versions()
+    # Never reuse or sort before an existing version (e.g. two rebuilds in one second)
+    if versions and name <= versions[-1]:
+        name = f"{versions[-1]}_1"
+    return name
+
+def list_versions() -> List[str]:
+    """Versioned collections, oldest first"""
+    names = [c.name for c in qdrant_client.get_collections().collections]
+    return sorted(name for name in names if name.startswith(VERSION_PREFIX))
+
+def resolve_alias() -> Optional[str]:
+    """Collection the COLLECTION_NAME alias points to, or None if it is not an alias"""
+    for alias in qdrant_client.get_aliases().aliases:
+        if alias.alias_name == COLLECTION_NAME:
+            return alias.collection_name
+    return None
+
+def point_alias(collection_name: str):
+    """Atomically point the COLLECTION_NAME alias at collection_name"""
+    operations = []
+    if resolve_alias() is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=COLLECTION_NAME)))
+    elif qdrant_client.collection_exists(COLLECTION_NAME):
+        # One-time migration: a plain collection holds the name the alias needs
+        print(f"Replacing plain collection '{COLLECTION_NAME}' with an alias (one-time migration)")
+        qdrant_client.delete_collection(COLLECTION_NAME)
+    operations.append(CreateAliasOperation(
+        create_alias=CreateAlias(collection_name=collection_name, alias_name=COLLECTION_NAME)
+    ))
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+    invalidate_collection_cache()
+    print(f"Alias '{COLLECTION_NAME}' -> '{collection_name}'")
+
+def prune_versions(previous: Optional[str] = None, keep: int = KEEP_PREVIOUS_VERSIONS):
+    """
+    Delete old versioned collections. The live version and `previous` (the one
+    live before the last swap, i.e. the rollback target) are always kept, plus
+    the newest others up to `keep` non-live versions in total.
+    """
+    live = resolve_alias()
+    versions = list_versions()
+    protected = {live}
+    if keep > 0 and previous in versions:
+        protected.add(previous)
+    candidates = [name for name in versions if name not in protected]
+    keep_others = max(0, keep - (len(protected) - 1))
+    for name in candidates[:len(candidates) - keep_others]:
+        qdrant_client.delete_collection(name)
+        print(f"Deleted old version: {name}")
+
+def rollback():
+    """Point the alias back at the newest version older than the live one"""
+    if not qdrant_client:
+        print("Error: Qdrant client not initialized")
+        return False
+    live = resolve_alias()
+    versions = list_versions()
+    older = versions[:versions.index(live)] if live in versions else []
+    if not older:
+        print("No previous version to roll back to")
+        return False
+    point_alias(older[-1])
+    ANSWER_CACHE.invalidate()
+    return True
+
+def live_collection() -> Optional[str]:
+    """Physical collection currently served under COLLECTION_NAME, if any"""
+    target = resolve_alias()
+    if target is not None:
+        return target
+    return COLLECTION_NAME if qdrant_client.collection_exists(COLLECTION_NAME) else None
+
+def is_manifest_usable(manifest: Optional[Dict]) -> bool:
+    """A manifest is only trusted if it describes the live collection and embedding model"""
+    if not manifest or manifest.get('embedding_model') != EMBEDDING_MODEL:
+        return False
+    try:
+        return manifest.get('collection') == live_collection()
+    except Exception as e:
+        print(f"Error checking collection: {e}")
+        return False
+
+def document_payload(doc: Dict) -> Dict:
+    """Qdrant payload stored with a chunk"""
+    return {
+        'text': doc['text'],
+        'content_hash': hashlib.sha256(doc['text'].encode()).hexdigest(),
+        **doc['metadata']
+    }
+
+def manifest_entry(doc: Dict) -> Dict:
+    """Hashes used to decide whether a chunk needs re-embedding or only a payload update"""
+    payload = document_payload(doc)
+    return {
+        'text_hash': payload['content_hash'],
+        'payload_hash': hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    }
+
+def load_manifest() -> Optional[Dict]:
+    """Load the manifest written by the last successful ingest, if any"""
+    try:
+        with open(INGEST_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest {INGEST_MANIFEST_PATH}: {e}")
+        return None
+
+def save_manifest(documents: List[Dict], collection_name: str, carried_chunks: Dict = None,
+                  files: Dict = None):
+    """
+    Record the chunks now in the collection (written atomically): those of
+    documents, plus carried_chunks entries for files that were not re-parsed.
+    files maps each doc to its size, mtime, content hash and chunk ids.
+    """
+    manifest = {
+        'collection': collection_name,
+        'embedding_model': EMBEDDING_MODEL,
+        'parser': parser_fingerprint(),
+        'files': files or {},
+        'chunks': {**(carried_chunks or {}), **{doc['id']: manifest_entry(doc) for doc in documents}}
+    }
+    tmp_path = f"{INGEST_MANIFEST_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, INGEST_MANIFEST_PATH)
+
+# File-level skip list: with --incremental, docs whose size and mtime (or, if
+# only the mtime changed, content hash) match the manifest are not read, parsed
+# or chunked again; their chunks are carried over from the manifest. Bump
+# PARSER_VERSION when parsing or chunking changes, to re-parse every doc once.
+PARSER_VERSION = 3
+READ_WORKERS = int(os.getenv("INGEST_READ_WORKERS", "16"))
+
+def parser_fingerprint() -> str:
+    return json.dumps([PARSER_VERSION, markdown_chunks.CHUNK_MAX_TOKENS, markdown_chunks.CHUNK_MIN_TOKENS,
+                       markdown_chunks.CHUNK_BLOCK_MAX_TOKENS, markdown_chunks.tokenizer_name()])
+
+def file_hash(filepath: str) -> str:
+    with open(filepath, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def plan_files(files: List[str], previous_files: Optional[Dict],
+               workers: int = READ_WORKERS) -> Tuple[List[str], Dict]:
+    """
+    Split files into those to parse and those unchanged since the manifest's
+    files entries were recorded. Returns (to_parse, unchanged entries by path).
+    """
+    if not previous_files:
+        return list(files), {}
+    to_parse, unchanged, to_hash = [], {}, []
+    for filepath in files:
+        entry = previous_files.get(filepath)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            entry = None
+        if entry is None or entry.get('size') != stat.st_size:
+            to_parse.append(filepath)
+        elif entry.get('mtime_ns') == stat.st_mtime_ns:
+            unchanged[filepath] = entry
+        else:
+            to_hash.append((filepath, stat.st_mtime_ns))
+    # Touched but possibly unchanged: compare content hashes, reading concurrently
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        hashes = executor.map(file_hash, [filepath for filepath, _ in to_hash])
+        for (filepath, mtime_ns), digest in zip(to_hash, hashes):
+            if digest == previous_files[filepath].get('sha256'):
+                unchanged[filepath] = {**previous_files[filepath], 'mtime_ns': mtime_ns}
+            else:
+                to_parse.append(filepath)
+    return sorted(to_parse), unchanged
+
+def classify_chunk(manifest_chunks: Optional[Dict], doc: Dict) -> str:
+    """'embed' for new/changed text, 'payload' for metadata-only changes, else 'unchanged'"""
+    if manifest_chunks is None:
+        return 'embed'
+    previous = manifest_chunks.get(doc['id'])
+    current = manifest_entry(doc)
+    if previous is None or previous.get('text_hash') != current['text_hash']:
+        return 'embed'
+    if previous.get('payload_hash') != current['payload_hash']:
+        return 'payload'
+    return 'unchanged'
+
+def plan_incremental(manifest_chunks: Dict, documents: List[Dict]):
+    """
+    Compare current chunks against the manifest.
+    Returns (to_embed, to_update_payload, stale_ids).
+    """
+    to_embed = []
+    to_update_payload = []
+    for doc in documents:
+        kind = classify_chunk(manifest_chunks, doc)
+        if kind == 'embed':
+            to_embed.append(doc)
+        elif kind == 'payload':
+            to_update_payload.append(doc)
+    current_ids = {doc['id'] for doc in documents}
+    stale_ids = [point_id for point_id in manifest_chunks if point_id not in current_ids]
+    return to_embed, to_update_payload, stale_ids
+
+# Pipeline: files are parsed in a process pool, chunks are embedded by a pool of
+# threads and upserted by a background writer. Stages are connected by bounded
+# queues, so a slow stage makes the ones before it wait instead of buffering
+# the whole book in memory.
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(8, os.cpu_count() or 1))))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+PIPELINE_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "8"))
+
+class IngestMetrics:
+    """Thread-safe progress counters for one ingest run"""
+    
+    def __init__(self, on_progress: Callable[[Dict], None] = None):
+        self.started_at = time.monotonic()
+        self.on_progress = on_progress
+        self.counts = {
+            'files_parsed': 0,
+            'files_skipped': 0,
+            'chunks_total': 0,
+            'chunks_skipped': 0,
+            'chunks_embedded': 0,
+            'chunks_indexed': 0,
+            'embedding_requests': 0,
+            'embedding_cache_hits': 0,
+            'embed_queue_depth': 0,
+            'upsert_queue_depth': 0
+        }
+        self._lock = threading.Lock()
+    
+    def add(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+    
+    def set(self, **values):
+        with self._lock:
+            self.counts.update(values)
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            return {
+                **self.counts,
+                'elapsed_seconds': round(elapsed, 2),
+                'chunks_per_second': round(self.counts['chunks_indexed'] / elapsed, 2) if elapsed else 0.0,
+                'embeddings_per_second': round(self.counts['chunks_embedded'] / elapsed, 2) if elapsed else 0.0
+            }
+    
+    def report(self):
+        snapshot = self.snapshot()
+        print(f"Progress: {snapshot['chunks_indexed']} indexed / {snapshot['chunks_embedded']} embedded / "
+              f"{snapshot['chunks_total']} chunks from {snapshot['files_parsed']} files "
+              f"({snapshot['chunks_per_second']} chunks/s, {snapshot['embeddings_per_second']} embeddings/s, "
+              f"queues {snapshot['embed_queue_depth']}/{snapshot['upsert_queue_depth']})")
+        if self.on_progress:
+            self.on_progress(snapshot)
+
+def parse_file(filepath: str) -> Tuple[str, Dict, List[Dict]]:
+    """(filepath, its manifest files entry, its chunks)"""
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    docs = process_markdown_file(filepath, raw.decode('utf-8'))
+    return filepath, {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': hashlib.sha256(raw).hexdigest(),
+        'chunks': [doc['id'] for doc in docs]
+    }, docs
+
+def parse_files(files: List[str], workers: int = PARSE_WORKERS) -> Iterator[Tuple[str, Dict, List[Dict]]]:
+    """Yield parse_file results in file order, reading and parsing files in a process pool"""
+    if workers <= 1 or len(files) <= 1:
+        yield from map(parse_file, files)
+        return
+    # Spawned, not forked: jobs started through the API run this from a thread of a
+    # uvicorn worker, whose event loop, client threads and held locks fork can't copy safely
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Several files per task, so thousands of small docs don't cost one round trip each
+        yield from executor.map(parse_file, files, chunksize=max(1, len(files) // (workers * 8)))
+
+def run_pipeline(files: List[str], collection_name: str, manifest_chunks: Optional[Dict] = None,
+                 batch_size: int = None, max_tokens: int = None,
+                 embed_workers: int = EMBED_WORKERS, metrics: IngestMetrics = None):
+    """
+    Parse, embed and upsert as concurrent stages.
+    Chunks that the manifest says are unchanged are not embedded.
+    Returns (all_documents, to_update_payload, files entries by path).
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    max_tokens = max_tokens or EMBEDDING_BATCH_TOKENS
+    metrics = metrics or IngestMetrics()
+    if not OPENROUTER_API_KEY:
+        print("Warning: No OpenRouter API key, using mock embeddings")
+    embed_queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    upsert_queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    failed = threading.Event()
+    errors = []
+    
+    def put(q: queue.Queue, item):
+        # Blocking put (backpressure) that gives up once another stage has failed
+        while not failed.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def embed_worker():
+        while True:
+            batch = embed_queue.get()
+            if batch is None:
+                return
+            if failed.is_set():
+                continue
+            try:
+                # Batches are already sized below, so this is at most one request
+                if OPENROUTER_API_KEY:
+                    vectors, cache_hits = embed_batch([doc['text'] for doc in batch])
+                else:
+                    vectors, cache_hits = [[0.0] * 1536 for _ in batch], 0
+                metrics.add(
+                    chunks_embedded=len(batch),
+                    embedding_cache_hits=cache_hits,
+                    embedding_requests=1 if cache_hits < len(batch) else 0
+                )
+                put(upsert_queue, list(zip(batch, vectors)))
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+    
+    def upsert_worker():
+        pending = []
+        
+        def flush(points, wait):
+            qdrant_client.upsert(collection_name=collection_name, points=points, wait=wait)
+            metrics.add(chunks_indexed=len(points))
+            metrics.set(embed_queue_depth=embed_queue.qsize(), upsert_queue_depth=upsert_queue.qsize())
+            metrics.report()
+        
+        try:
+            while True:
+                item = upsert_queue.get()
+                if item is None:
+                    break
+                if failed.is_set():
+                    continue
+                pending.extend(
+                    PointStruct(id=doc['id'], vector=vector, payload=document_payload(doc))
+                    for doc, vector in item
+                )
+                # Always hold back at least one point so the final upsert below exists
+                while len(pending) > UPSERT_BATCH_SIZE:
+                    flush(pending[:UPSERT_BATCH_SIZE], wait=False)
+                    pending = pending[UPSERT_BATCH_SIZE:]
+            if pending and not failed.is_set():
+                # Qdrant applies updates in order, so waiting on the last one
+                # confirms every earlier wait=False upsert too
+                flush(pending, wait=True)
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+            # Keep draining so embed workers blocked on put() can exit
+            while upsert_queue.get() is not None:
+                pass
+    
+    embedders = [threading.Thread(target=embed_worker, daemon=True) for _ in range(embed_workers)]
+    writer = threading.Thread(target=upsert_worker, daemon=True)
+    for thread in embedders + [writer]:
+        thread.start()
+    
+    all_documents = []
+    to_update_payload = []
+    parsed_files = {}
+    batch = []
+    batch_tokens = 0
+    try:
+        for filepath, file_entry, docs in parse_files(files):
+            parsed_files[filepath] = file_entry
+            metrics.add(files_parsed=1, chunks_total=len(docs))
+            all_documents.extend(docs)
+            for doc in docs:
+                kind = classify_chunk(manifest_chunks, doc)
+                if kind == 'payload':
+                    to_update_payload.append(doc)
+                if kind != 'embed':
+                    metrics.add(chunks_skipped=1)
+                    continue
+                tokens = estimate_tokens(doc['text'])
+                if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_tokens):
+                    put(embed_queue, batch)
+                    batch, batch_tokens = [], 0
+                batch.append(doc)
+                batch_tokens += tokens
+            if failed.is_set():
+                break
+        if batch:
+            put(embed_queue, batch)
+    finally:
+        for _ in embedders:
+            embed_queue.put(None)
+        for thread in embedders:
+            thread.join()
+        upsert_queue.put(None)
+        writer.join()
+    
+    if errors:
+        raise errors[0]
+    return all_documents, to_update_payload, parsed_files
+
+def ingest_documents(batch_size: int = None, max_tokens: int = None, incremental: bool = False,
+                     blue_green: bool = False, embed_workers: int = EMBED_WORKERS,
+                     on_progress: Callable[[Dict], None] = None):
+    """
+    Main ingestion function.
+    With incremental=True, only new or changed chunks are embedded and stale
+    chunks are deleted, based on the manifest from the previous run.
+    With blue_green=True, a full rebuild is built into a new versioned
+    collection and the COLLECTION_NAME alias is switched to it at the end,
+    so search keeps serving the old version during the rebuild.
+    on_progress receives IngestMetrics snapshots as batches are indexed.
+    """
     print("=" * 60)
     print("Starting document ingestion...")
     print("=" * 60)
@@ -175,60 +764,107 @@ def ingest_documents():
         print(f"Error: Docs directory not found: {DOCS_DIR}")
         return
     
-    md_files = list(docs_path.glob("*.md"))
+    md_files = discover_docs(DOCS_DIR)
     print(f"\nFound {len(md_files)} markdown files")
     
-    # Process all files
-    all_documents = []
-    for filepath in md_files:
-        docs = process_markdown_file(str(filepath))
-        all_documents.extend(docs)
+    manifest = load_manifest() if incremental else None
+    if incremental and not is_manifest_usable(manifest):
+        print("No usable manifest for the current collection, falling back to a full rebuild")
+        manifest = None
     
-    print(f"\nTotal chunks created: {len(all_documents)}")
+    if manifest is not None:
+        target = manifest['collection']
+    else:
+        # Once COLLECTION_NAME is an alias, full rebuilds must go through a new version
+        if not blue_green and qdrant_client and resolve_alias() is not None:
+            print(f"'{COLLECTION_NAME}' is an alias, using a blue/green rebuild")
+            blue_green = True
+        target = new_version_name() if blue_green else COLLECTION_NAME
+        # Create collection
+        if not create_collection(target):
+            return
     
-    # Create collection
-    if not create_collection():
-        return
+    # Files unchanged since the last run keep their chunks without being parsed
+    carried_chunks, unchanged_files = {}, {}
+    to_parse = md_files
+    if manifest is not None and manifest.get('parser') == parser_fingerprint():
+        to_parse, unchanged_files = plan_files(md_files, manifest.get('files'))
+        for filepath, entry in list(unchanged_files.items()):
+            if all(chunk_id in manifest['chunks'] for chunk_id in entry['chunks']):
+                carried_chunks.update({chunk_id: manifest['chunks'][chunk_id] for chunk_id in entry['chunks']})
+            else:
+                del unchanged_files[filepath]
+                to_parse.append(filepath)
+        print(f"{len(unchanged_files)} files unchanged since the last ingest, parsing {len(to_parse)}")
     
-    # Generate embeddings and upload
-    print("\nGenerating embeddings and uploading to Qdrant...")
-    points = []
+    # Parse, embed and upload concurrently
+    print("\nParsing, embedding and uploading to Qdrant...")
+    metrics = IngestMetrics(on_progress)
+    metrics.add(files_skipped=len(unchanged_files), chunks_skipped=len(carried_chunks))
+    all_documents, to_update_payload, parsed_files = run_pipeline(
+        to_parse,
+        target,
+        manifest['chunks'] if manifest else None,
+        batch_size,
+        max_tokens,
+        embed_workers,
+        metrics
+    )
     
-    for i, doc in enumerate(all_documents):
-        if i % 10 == 0:
-            print(f"Processing {i}/{len(all_documents)}...")
-        
-        embedding = get_embedding(doc['text'])
-        
-        point = PointStruct(
-            id=doc['id'],
-            vector=embedding,
-            payload={
-                'text': doc['text'],
-                **doc['metadata']
-            }
+    for doc in to_update_payload:
+        qdrant_client.overwrite_payload(
+            collection_name=target,
+            payload=document_payload(doc),
+            points=[doc['id']]
         )
-        points.append(point)
-        
-        # Upload in batches of 100
-        if len(points) >= 100:
-            qdrant_client.upsert(
-                collection_name=COLLECTION_NAME,
-                points=points
+    
+    if manifest is not None:
+        current_ids = {doc['id'] for doc in all_documents} | set(carried_chunks)
+        stale_ids = [point_id for point_id in manifest['chunks'] if point_id not in current_ids]
+        if stale_ids:
+            qdrant_client.delete(
+                collection_name=target,
+                points_selector=PointIdsList(points=stale_ids)
             )
-            points = []
+        snapshot = metrics.snapshot()
+        print(f"\nIncremental: {snapshot['chunks_embedded']} new/changed, {len(to_update_payload)} payload-only, "
+              f"{len(stale_ids)} stale, {snapshot['chunks_skipped'] - len(to_update_payload)} unchanged")
     
-    # Upload remaining points
-    if points:
-        qdrant_client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points
-        )
+    if manifest is None and blue_green:
+        previous = resolve_alias()
+        point_alias(target)
+        prune_versions(previous)
     
+    save_manifest(all_documents, target, carried_chunks, {**unchanged_files, **parsed_files})
+    
+    snapshot = metrics.snapshot()
+    if manifest is None or snapshot['chunks_embedded'] or to_update_payload or stale_ids:
+        # Cached answers may cite chunks that changed
+        ANSWER_CACHE.invalidate()
     print("\n" + "=" * 60)
     print("✅ Ingestion complete!")
-    print(f"Total documents indexed: {len(all_documents)}")
+    print(f"Total documents indexed: {len(all_documents) + len(carried_chunks)} ({snapshot['chunks_embedded']} embedded)")
+    print(f"Elapsed: {snapshot['elapsed_seconds']}s, {snapshot['embedding_requests']} embedding requests, "
+          f"{snapshot['embedding_cache_hits']} embedding cache hits, {snapshot['embeddings_per_second']} embeddings/s")
     print("=" * 60)
+    return snapshot
 
 if __name__ == "__main__":
-    ingest_documents()
+    parser = argparse.ArgumentParser(description="Index the textbook docs into Qdrant")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="max texts per embedding request")
+    parser.add_argument("--batch-tokens", type=int, default=EMBEDDING_BATCH_TOKENS, help="approx. max tokens per embedding request")
+    parser.add_argument("--incremental", action="store_true", help="only re-embed new or changed chunks")
+    parser.add_argument("--blue-green", action="store_true", help="rebuild into a new version and switch the alias when done")
+    parser.add_argument("--embed-workers", type=int, default=EMBED_WORKERS, help="concurrent embedding requests")
+    parser.add_argument("--rollback", action="store_true", help="point the alias back at the previous version and exit")
+    args = parser.parse_args()
+    if args.rollback:
+        rollback()
+    else:
+        ingest_documents(
+            batch_size=args.batch_size,
+            max_tokens=args.batch_tokens,
+            incremental=args.incremental,
+            blue_green=args.blue_green,
+            embed_workers=args.embed_workers
+        )
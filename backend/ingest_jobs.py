@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import hmac
+import itertools
+import threading
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+import db
+import ingest
+
+load_dotenv()
+
+# Ingestion started through the API runs as a background job in the worker
+# that received the request. Its status, progress and throughput are kept in
+# memory for that worker and written to the ingest_jobs table (Postgres,
+# DATABASE_URL) at most every INGEST_JOB_PROGRESS_SECONDS, so any worker can
+# report them. A running job blocks new ones until it finishes or has not
+# reported for INGEST_JOB_STALE_SECONDS; across workers this is enforced by a
+# unique index on running rows (db.init_db), so two claims can't both succeed.
+# The API is disabled unless INGEST_API_TOKEN is set; callers send it as a
+# Bearer token.
+INGEST_API_TOKEN = os.getenv("INGEST_API_TOKEN")
+INGEST_JOB_PROGRESS_SECONDS = float(os.getenv("INGEST_JOB_PROGRESS_SECONDS", "2"))
+INGEST_JOB_STALE_SECONDS = float(os.getenv("INGEST_JOB_STALE_SECONDS", "900"))
+
+PROGRESS_FIELDS = (
+    "files_parsed", "chunks_total", "chunks_skipped", "chunks_embedded", "chunks_indexed",
+    "embedding_requests", "embedding_cache_hits", "elapsed_seconds", "chunks_per_second", "embeddings_per_second"
+)
+
+# started_at is a TIMESTAMP written with NOW() in the session time zone;
+# started_epoch is the same instant in seconds since the epoch, which jobs
+# kept in memory record too, so rows and local jobs sort together
+JOB_COLUMNS = "*, EXTRACT(EPOCH FROM started_at::timestamptz) AS started_epoch"
+
+# job id -> job, for jobs started by this worker
+_jobs: Dict[int, Dict] = {}
+_jobs_lock = threading.Lock()
+_running: Optional[int] = None
+_schema_ready = False
+# Ids for jobs that could not be recorded in the database
+_local_ids = itertools.count(1)
+
+def is_authorized(authorization: Optional[str]) -> bool:
+    if not INGEST_API_TOKEN or not authorization or not authorization.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(authorization[len("Bearer "):].encode(), INGEST_API_TOKEN.encode())
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+def _execute(sql: str, params: tuple = (), fetch: bool = False, before: List[tuple] = ()):
+    """
+    Run a statement, after the (sql, params) statements in before, in one
+    transaction on a pooled connection; None without DATABASE_URL or on errors
+    """
+    global _schema_ready
+    try:
+        if not _schema_ready and db.DATABASE_URL:
+            # Retried on the next call if the database was unavailable
+            _schema_ready = db.init_db()
+        with db.db_connection() as conn:
+            if conn is None:
+                return None
+            cur = conn.cursor()
+            for statement in before:
+                cur.execute(*statement)
+            cur.execute(sql, params)
+            rows = cur.fetchall() if fetch else []
+            conn.commit()
+            cur.close()
+            return rows
+    except Exception as e:
+        print(f"Error recording ingest job: {e}")
+        return None
+
+def _update_job(job_id: int, fields: Dict, finished: bool = False):
+    assignments = "".join(f"{column} = %s, " for column in fields)
+    if finished:
+        assignments += "finished_at = NOW(), "
+    _execute(
+        f"UPDATE ingest_jobs SET {assignments}updated_at = NOW() WHERE id = %s",
+        (*fields.values(), job_id)
+    )
+
+def _claim(options: Dict) -> Optional[List]:
+    """
+    Record a running job: [{"id": ...}], [] if another job is running, None if
+    it could not be recorded. A job that stopped reporting is marked failed first.
+    """
+    expire_stale = (
+        "UPDATE ingest_jobs SET status = 'failed', error_message = 'No progress reported', "
+        "finished_at = NOW(), updated_at = NOW() "
+        "WHERE status = 'running' AND updated_at <= NOW() - make_interval(secs => %s)",
+        (INGEST_JOB_STALE_SECONDS,)
+    )
+    return _execute(
+        "INSERT INTO ingest_jobs (status, options, started_at, updated_at) VALUES ('running', %s, NOW(), NOW()) "
+        "ON CONFLICT DO NOTHING RETURNING id",
+        (json.dumps(options),), fetch=True, before=[expire_stale]
+    )
+
+def start_job(options: Dict) -> Optional[Dict]:
+    """Start ingest.ingest_documents(**options) in the background; None if a job is already running"""
+    global _running
+    with _jobs_lock:
+        if _running is not None:
+            return None
+        _running = 0
+    try:
+        rows = _claim(options)
+        if rows == []:
+            with _jobs_lock:
+                _running = None
+            return None
+        job_id = rows[0]["id"] if rows else -next(_local_ids)
+        job = {
+            "id": job_id,
+            "status": "running",
+            "options": options,
+            "started_at": _now(),
+            "started_epoch": time.time(),
+            "finished_at": None,
+            "error_message": None,
+            "persisted": bool(rows),
+            **{field: 0 for field in PROGRESS_FIELDS}
+        }
+        with _jobs_lock:
+            _jobs[job_id] = dict(job)
+            _running = job_id
+    except Exception:
+        with _jobs_lock:
+            _running = None
+        raise
+    threading.Thread(target=run_job, args=(job_id, options), name=f"ingest-job-{job_id}", daemon=True).start()
+    return job
+
+def run_job(job_id: int, options: Dict):
+    global _running
+    persisted = _jobs[job_id]["persisted"]
+    last_write = [time.monotonic()]
+
+    def on_progress(snapshot: Dict):
+        progress = {field: snapshot[field] for field in PROGRESS_FIELDS if field in snapshot}
+        with _jobs_lock:
+            _jobs[job_id].update(progress)
+        now = time.monotonic()
+        if persisted and now - last_write[0] >= INGEST_JOB_PROGRESS_SECONDS:
+            last_write[0] = now
+            _update_job(job_id, progress)
+
+    result = {}
+    try:
+        snapshot = ingest.ingest_documents(on_progress=on_progress, **options)
+        if snapshot is None:
+            result = {"status": "failed", "error_message": "Ingestion did not start: docs directory or collection unavailable"}
+        else:
+            result = {"status": "completed", **{field: snapshot[field] for field in PROGRESS_FIELDS if field in snapshot}}
+    except Exception as e:
+        print(f"Ingest job {job_id} failed: {e}")
+        result = {"status": "failed", "error_message": f"{type(e).__name__}: {e}"}
+    finally:
+        with _jobs_lock:
+            _jobs[job_id].update(result, finished_at=_now())
+            _running = None
+        if persisted:
+            _update_job(job_id, result, finished=True)
+
+def get_job(job_id: int) -> Optional[Dict]:
+    """A job's status and progress: live if this worker runs it, else as last recorded"""
+    with _jobs_lock:
+        if job_id in _jobs:
+            return dict(_jobs[job_id])
+    rows = _execute(f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE id = %s", (job_id,), fetch=True)
+    return dict(rows[0]) if rows else None
+
+def list_jobs(limit: int = 20) -> List[Dict]:
+    """Most recent jobs first"""
+    rows = _execute(f"SELECT {JOB_COLUMNS} FROM ingest_jobs ORDER BY id DESC LIMIT %s", (limit,), fetch=True) or []
+    jobs = {row["id"]: dict(row) for row in rows}
+    with _jobs_lock:
+        jobs.update({job_id: dict(job) for job_id, job in _jobs.items()})
+    return sorted(jobs.values(), key=lambda job: float(job.get("started_epoch") or 0), reverse=True)[:limit]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Load test for /rag/ask: throughput at increasing numbers of in-flight requests.
+
+With non-blocking handlers, throughput should grow roughly linearly with
+concurrency until the upstream or the connection pool saturates. With blocking
+handlers it stays flat at about 1 / upstream latency.
+
+By default the app runs in-process and OpenRouter is replaced by a mock that
+answers after --upstream-latency seconds, so no API credits are spent. Pass
+--url to load a running server instead.
+
+Usage: python loadtest_ask.py --concurrency 1 4 16 64 --requests 64
+       python loadtest_ask.py --url http://localhost:8000
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+def mock_openrouter(latency: float) -> httpx.MockTransport:
+    """Transport that answers chat completions and embeddings after a fixed delay"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json={"data": [{"index": 0, "embedding": [0.0] * 1536}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "mock answer"}}]})
+    return httpx.MockTransport(handler)
+
+def in_process_client(latency: float) -> httpx.AsyncClient:
+    import openrouter
+    import rag
+    rag.OPENROUTER_API_KEY = "loadtest"
+    openrouter.set_transport(mock_openrouter(latency))
+    from main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest")
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int):
+    """Send `total` requests with at most `concurrency` in flight; return (req/s, latencies)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/rag/ask", json={"query": f"What is ROS 2? ({i})"}, timeout=120)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - start), sorted(latencies)
+
+async def main(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=httpx.Limits(max_connections=max(args.concurrency)))
+        print(f"Target: {args.url}")
+    else:
+        client = in_process_client(args.upstream_latency)
+        print(f"Target: in-process app, mock upstream latency {args.upstream_latency * 1000:.0f} ms")
+
+    print("=" * 60)
+    print(f"{'in-flight':>10} {'requests':>10} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    async with client:
+        for concurrency in args.concurrency:
+            total = max(args.requests, concurrency)
+            throughput, latencies = await run_level(client, concurrency, total)
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            print(f"{concurrency:>10} {total:>10} {throughput:>10.1f} {p50:>10.0f} {p99:>10.0f}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server (default: in-process app)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--upstream-latency", type=float, default=0.5, help="mock OpenRouter latency in seconds")
+    asyncio.run(main(parser.parse_args()))
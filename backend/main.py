@@ -1,13 +1,29 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-import os
+from contextlib import asynccontextmanager
+import json
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Physical AI RAG Backend")
+import openrouter
+import db
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from answer_cache import ANSWER_CACHE_DISABLED_REASON
+    if ANSWER_CACHE_DISABLED_REASON:
+        print(f"Answer cache disabled: {ANSWER_CACHE_DISABLED_REASON}")
+    yield
+    # Release pooled keep-alive connections to OpenRouter and Postgres
+    await openrouter.close_client()
+    db.close_pool()
+
+app = FastAPI(title="Physical AI RAG Backend", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -20,29 +36,113 @@ app.add_middleware(
 
 from pydantic import BaseModel
 from typing import List, Optional
-from rag import search_context, generate_answer, get_embedding, personalize_text, translate_text
+from rag import (
+    generate_answer,
+    personalize_text,
+    get_collection_cache_stats,
+    stream_personalized_text,
+    get_personalize_cache_stats,
+    clear_personalize_cache,
+    answer_query,
+    prepare_answer_stream,
+    get_answer_cache_stats,
+    clear_answer_cache,
+    PERSONALIZE_FLIGHTS
+)
 from translation import (
     translate_text_enhanced, 
     translate_multiple_texts, 
     get_supported_languages,
     translate_technical_content,
     translate_with_context,
+    stream_translation,
     get_cache_stats,
-    clear_translation_cache
+    clear_translation_cache,
+    TRANSLATION_FLIGHTS
 )
-from db import init_db, get_db_connection
+from pretranslate import load_translated_doc
+from prewarm_personalize import LEVELS, load_doc_body
+from db import get_db_pool_stats
+import ingest_jobs
+from embedding_cache import get_cache as get_embedding_cache
+
+def ndjson_stream(deltas, first_events: list = None) -> StreamingResponse:
+    """
+    Stream completion deltas as newline-delimited JSON events:
+    any first_events, then {"type": "delta", "content": ...} per delta,
+    then {"type": "done"} or {"type": "error", "error": ...}.
+    """
+    async def events():
+        for event in first_events or []:
+            yield json.dumps(event) + "\n"
+        try:
+            async for delta in deltas:
+                yield json.dumps({"type": "delta", "content": delta}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+    # X-Accel-Buffering stops reverse proxies from holding back the stream
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
 
 # Models
 class ChatRequest(BaseModel):
     query: str
     history: Optional[List[dict]] = []
     background: Optional[str] = "General" # software, hardware, etc.
+    chapter: Optional[str] = None # restrict retrieval to one chapter
+    section: Optional[str] = None # restrict retrieval to one section
+    score_threshold: Optional[float] = None
 
 @app.post("/rag/ask")
 async def ask_question(request: ChatRequest):
-    context = search_context(request.query)
-    answer = generate_answer(request.query, context, user_background=request.background)
-    return {"answer": answer, "context": context}
+    return await answer_query(
+        request.query,
+        user_background=request.background,
+        chapter=request.chapter,
+        section=request.section,
+        score_threshold=request.score_threshold
+    )
+
+@app.post("/rag/ask/stream")
+async def ask_question_stream(request: ChatRequest):
+    context, deltas, meta = await prepare_answer_stream(
+        request.query,
+        user_background=request.background,
+        chapter=request.chapter,
+        section=request.section,
+        score_threshold=request.score_threshold
+    )
+    return ndjson_stream(
+        deltas,
+        first_events=[{"type": "context", "context": context}, {"type": "meta", "meta": meta}]
+    )
+
+@app.get("/rag/ask/cache")
+async def get_answer_cache_stats_endpoint():
+    return {"stats": get_answer_cache_stats()}
+
+@app.delete("/rag/ask/cache")
+async def clear_answer_cache_endpoint():
+    clear_answer_cache()
+    return {"message": "Answer cache cleared"}
+
+@app.get("/rag/collection/cache")
+async def get_collection_cache_stats_endpoint():
+    return {"stats": get_collection_cache_stats()}
+
+@app.get("/rag/embeddings/cache")
+async def get_embedding_cache_stats_endpoint():
+    cache = get_embedding_cache()
+    return {"stats": cache.get_stats() if cache else {"enabled": False}}
+
+@app.get("/rag/singleflight")
+async def get_single_flight_stats_endpoint():
+    """Upstream calls started (originated) vs. joined while identical ones were in flight (coalesced)"""
+    return {"stats": {
+        "translation": TRANSLATION_FLIGHTS.stats(),
+        "personalize": PERSONALIZE_FLIGHTS.stats()
+    }}
 
 class SelectionRequest(BaseModel):
     query: str
@@ -51,13 +151,18 @@ class SelectionRequest(BaseModel):
 @app.post("/rag/ask-selection")
 async def ask_selection(request: SelectionRequest):
     context = [{"text": request.selected_text, "source": "User Selection"}]
-    answer = generate_answer(request.query, context)
+    answer = await generate_answer(request.query, context)
     return {"answer": answer, "context": context}
 
 class PersonalizeRequest(BaseModel):
+    # For a whole doc use /rag/personalize/doc, which shares the pre-warmed cache
     text: str
     level: str # beginner, intermediate, expert
 
+class PersonalizeDocRequest(BaseModel):
+    doc_path: str # e.g. "module-01-ros2" or "module-01-ros2/index.md"
+    level: str
+
 class TranslateRequest(BaseModel):
     text: str
     target_language: str = "Urdu"
@@ -80,32 +185,81 @@ class TranslateWithContextRequest(BaseModel):
 
 @app.post("/rag/personalize")
 async def personalize_content(request: PersonalizeRequest):
-    personalized_text = personalize_text(request.text, request.level)
+    personalized_text = await personalize_text(request.text, request.level)
     return {
         "personalized_markdown": personalized_text,
         "meta": {"level": request.level}
     }
 
+@app.post("/rag/personalize/doc")
+async def personalize_doc(request: PersonalizeDocRequest):
+    """Personalize a whole doc, read on the server exactly as prewarm_personalize.py caches it"""
+    level = request.level.strip().lower()
+    if level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unknown level '{request.level}'. Supported: {LEVELS}")
+    text = load_doc_body(request.doc_path)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"No doc '{request.doc_path}'")
+    personalized_text = await personalize_text(text, level)
+    return {
+        "personalized_markdown": personalized_text,
+        "meta": {"level": level, "doc_path": request.doc_path}
+    }
+
+@app.post("/rag/personalize/stream")
+async def personalize_content_stream(request: PersonalizeRequest):
+    return ndjson_stream(
+        stream_personalized_text(request.text, request.level),
+        first_events=[{"type": "meta", "meta": {"level": request.level}}]
+    )
+
+@app.get("/rag/personalize/cache")
+async def get_personalize_cache_stats_endpoint():
+    return {"stats": get_personalize_cache_stats()}
+
+@app.delete("/rag/personalize/cache")
+async def clear_personalize_cache_endpoint():
+    clear_personalize_cache()
+    return {"message": "Personalization cache cleared"}
+
 @app.post("/rag/translate")
 async def translate_content(request: TranslateRequest):
-    result = translate_text_enhanced(request.text, request.target_language, request.source_language)
+    result = await translate_text_enhanced(request.text, request.target_language, request.source_language)
     return result
 
+@app.post("/rag/translate/stream")
+async def translate_content_stream(request: TranslateRequest):
+    return ndjson_stream(
+        stream_translation(request.text, request.target_language, request.source_language),
+        first_events=[{"type": "meta", "meta": {"source_lang": request.source_language, "target_lang": request.target_language}}]
+    )
+
 @app.post("/rag/translate/batch")
 async def translate_batch_content(request: TranslateBatchRequest):
-    results = translate_multiple_texts(request.texts, request.target_language, request.source_language)
+    results = await translate_multiple_texts(request.texts, request.target_language, request.source_language)
     return {"results": results}
 
 @app.post("/rag/translate/technical")
 async def translate_technical_content_endpoint(request: TranslateTechnicalRequest):
-    result = translate_technical_content(request.text, request.target_language, request.domain)
+    result = await translate_technical_content(request.text, request.target_language, request.domain)
     return result
 
 @app.post("/rag/translate/context")
 async def translate_with_context_endpoint(request: TranslateWithContextRequest):
-    result = translate_with_context(request.text, request.target_language, request.context)
+    result = await translate_with_context(request.text, request.target_language, request.context)
     return result
 
+@app.get("/rag/translate/doc/{target_language}/{doc_path:path}")
+async def get_translated_doc_endpoint(target_language: str, doc_path: str):
+    """
+    Serve a doc pre-translated by pretranslate.py, e.g. /rag/translate/doc/ur/module-01-ros2.
+    content is markdown without frontmatter or MDX; render it as markdown.
+    """
+    content = load_translated_doc(doc_path, target_language)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"No pre-translated '{doc_path}' for language '{target_language}'")
+    return {"success": True, "doc_path": doc_path, "target_lang": target_language, "format": "markdown", "content": content}
+
 @app.get("/rag/translate/languages")
 async def get_supported_languages_endpoint():
     return {"languages": get_supported_languages()}
@@ -119,7 +273,7 @@ async def clear_cache_endpoint():
     clear_translation_cache()
     return {"message": "Translation cache cleared"}
 
-from auth import create_user, authenticate_user, User, verify_token
+from auth import create_user, authenticate_user, User, verify_token, get_user_profile, get_auth_cache_stats
 
 class SignupRequest(User):
     pass
@@ -158,7 +312,7 @@ async def signin(creds: SigninRequest):
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 @app.get("/auth/me")
-async def get_current_user(authorization: str = None):
+async def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
@@ -168,7 +322,6 @@ async def get_current_user(authorization: str = None):
     if not user_data:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    from auth import get_user_profile
     profile = get_user_profile(user_data['id'])
     
     if not profile:
@@ -176,4 +329,51 @@ async def get_current_user(authorization: str = None):
     
     return profile
 
+class IngestRequest(BaseModel):
+    incremental: bool = False
+    blue_green: bool = False
+    batch_size: Optional[int] = None
+    max_tokens: Optional[int] = None
+    embed_workers: Optional[int] = None
+
+def require_ingest_token(authorization: Optional[str]):
+    if not ingest_jobs.INGEST_API_TOKEN:
+        raise HTTPException(status_code=503, detail="Ingest API disabled: INGEST_API_TOKEN is not set")
+    if not ingest_jobs.is_authorized(authorization):
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+
+@app.post("/ingest", status_code=202)
+async def start_ingest(request: IngestRequest, authorization: Optional[str] = Header(None)):
+    """Start re-indexing the docs in the background; poll GET /ingest/{job_id} for progress"""
+    require_ingest_token(authorization)
+    options = request.model_dump(exclude_none=True)
+    job = await asyncio.to_thread(ingest_jobs.start_job, options)
+    if job is None:
+        raise HTTPException(status_code=409, detail="An ingest job is already running")
+    return job
+
+@app.get("/ingest")
+async def list_ingest_jobs(limit: int = 20, authorization: Optional[str] = Header(None)):
+    require_ingest_token(authorization)
+    return {"jobs": await asyncio.to_thread(ingest_jobs.list_jobs, limit)}
+
+@app.get("/ingest/{job_id}")
+async def get_ingest_job(job_id: int, authorization: Optional[str] = Header(None)):
+    """Status, chunks indexed, throughput (chunks/s, embeddings/s) and error of an ingest job"""
+    require_ingest_token(authorization)
+    job = await asyncio.to_thread(ingest_jobs.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No ingest job {job_id}")
+    return job
+
+@app.get("/db/pool")
+async def db_pool_stats():
+    """Postgres connection pool size, usage and acquire wait times"""
+    return get_db_pool_stats()
+
+@app.get("/auth/cache")
+async def auth_cache_stats():
+    """How access tokens were verified (locally or remotely), and profile cache statistics"""
+    return get_auth_cache_stats()
+
 
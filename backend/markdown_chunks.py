@@ -0,0 +1,278 @@
+import os
+import re
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+from markdown_segments import FENCE, TABLE_ROW, closes_fence, split_frontmatter
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+load_dotenv()
+
+# Markdown-aware chunking for ingestion. A document is split at its headings
+# and each section is packed into chunks of at most CHUNK_MAX_TOKENS from
+# whole blocks - paragraphs, lists, tables and fenced code - so no block is
+# cut unless it alone exceeds the limit (CHUNK_BLOCK_MAX_TOKENS for code and
+# tables, which are then split by lines, each piece keeping its fence or
+# header row). A chunk shorter than CHUNK_MIN_TOKENS, like a heading with one
+# intro sentence, is merged into the next. Tokens are counted with tiktoken's
+# CHUNK_TOKENIZER encoding (tiktoken is in requirements.txt); if it is missing
+# or the encoding can't be loaded, they are estimated at 4 characters each.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "60"))
+CHUNK_BLOCK_MAX_TOKENS = int(os.getenv("CHUNK_BLOCK_MAX_TOKENS", "1000"))
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "cl100k_base")
+# Chunks with less text than this are dropped, as before
+MIN_CHUNK_CHARS = 50
+
+HEADING = re.compile(r"^[ \t]{0,3}(#{1,6})[ \t]+(.+?)(?:[ \t]+#+)?[ \t]*$")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# MDX syntax that is markup rather than content: ESM import/export statements,
+# JSX and HTML comments, JSX/HTML tags (their text content is kept) and the
+# ::: fences of Docusaurus admonitions (their title is kept)
+MDX_ESM = re.compile(r"^(?:import|export)\s")
+MDX_COMMENT = re.compile(r"\{/\*.*?\*/\}|<!--.*?-->", re.DOTALL)
+JSX_TAG = re.compile(r"</?[A-Za-z][\w.:-]*(?:\s[^<>]*?)?/?>")
+INLINE_CODE = re.compile(r"(`[^`\n]+`)")
+ADMONITION = re.compile(r"^([ \t]*):::[ \t]*(?:\w+)?(?:\[[^\]]*\])?[ \t]*(.*)$", re.MULTILINE)
+
+Block = Tuple[str, str]
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if tiktoken is not None and _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(CHUNK_TOKENIZER)
+        except Exception as e:
+            print(f"Tokenizer {CHUNK_TOKENIZER} unavailable, estimating tokens: {e}")
+            _encoding = False
+    return _encoding
+
+def tokenizer_name() -> str:
+    """The tokenizer count_tokens uses: CHUNK_TOKENIZER, or "estimate" if it can't be loaded"""
+    return CHUNK_TOKENIZER if _get_encoding() else "estimate"
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def heading_title(text: str) -> str:
+    """Heading text without markup: links, emphasis, inline code and {#custom-id}"""
+    text = re.sub(r"\s*\{#[^}]*\}$", "", text)
+    text = re.sub(r"!?\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    return re.sub(r"[*_`]", "", text).strip()
+
+def _strip_mdx_prose(text: str) -> str:
+    text = MDX_COMMENT.sub("", text)
+    lines, in_esm = [], False
+    for line in text.split("\n"):
+        if in_esm or MDX_ESM.match(line):
+            # A statement ends at its "from '...'" clause, a semicolon or a blank line
+            in_esm = bool(line.strip()) and not line.rstrip().endswith(";") \
+                and not re.search(r"\bfrom\s+['\"]", line)
+            continue
+        lines.append(line)
+    text = ADMONITION.sub(lambda match: match.group(1) + match.group(2), "\n".join(lines))
+    parts = INLINE_CODE.split(text)
+    return "".join(part if i % 2 else JSX_TAG.sub("", part) for i, part in enumerate(parts))
+
+def strip_mdx(content: str) -> str:
+    """Content without MDX/JSX markup; code blocks are left as they are"""
+    out, prose, fence = [], [], None
+    for line in content.split("\n"):
+        opening = FENCE.match(line) if fence is None else None
+        if fence is None and not opening:
+            prose.append(line)
+            continue
+        if opening:
+            out.append(_strip_mdx_prose("\n".join(prose)))
+            prose, fence = [], opening.group(1)
+        elif closes_fence(line, fence):
+            fence = None
+        out.append(line)
+    out.append(_strip_mdx_prose("\n".join(prose)))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(out))
+
+def split_blocks(body: str) -> List[Block]:
+    """(kind, text) blocks - "heading", "code", "table" or "text" - with blank lines dropped"""
+    blocks: List[Block] = []
+    lines = body.splitlines()
+    paragraph: List[str] = []
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append(("text", "\n".join(paragraph)))
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        opening = FENCE.match(line)
+        if opening:
+            end_paragraph()
+            code = [line]
+            i += 1
+            while i < len(lines):
+                code.append(lines[i])
+                i += 1
+                if closes_fence(code[-1], opening.group(1)):
+                    break
+            blocks.append(("code", "\n".join(code)))
+        elif HEADING.match(line):
+            end_paragraph()
+            blocks.append(("heading", line.strip()))
+            i += 1
+        elif TABLE_ROW.match(line):
+            end_paragraph()
+            rows = []
+            while i < len(lines) and TABLE_ROW.match(lines[i]):
+                rows.append(lines[i])
+                i += 1
+            blocks.append(("table", "\n".join(rows)))
+        else:
+            if line.strip():
+                paragraph.append(line)
+            else:
+                end_paragraph()
+            i += 1
+    end_paragraph()
+    return blocks
+
+def split_sections(body: str) -> List[Tuple[List[Tuple[int, str]], List[Block]]]:
+    """(heading path as (level, title) pairs, blocks) per section, in document order"""
+    path: List[Tuple[int, str]] = []
+    sections = [([], [])]
+    for kind, text in split_blocks(body):
+        if kind == "heading":
+            match = HEADING.match(text)
+            level = len(match.group(1))
+            path = [entry for entry in path if entry[0] < level] + [(level, heading_title(match.group(2)))]
+            sections.append((path, []))
+        sections[-1][1].append((kind, text))
+    return [section for section in sections if section[1]]
+
+def pack(units: List[str], max_tokens: int, separator: str, prefix: str = "", suffix: str = "",
+         first_max_tokens: int = None) -> List[str]:
+    """
+    Join units into pieces of at most max_tokens, or first_max_tokens for the
+    first piece (a unit over the limit gets a piece of its own)
+    """
+    overhead = count_tokens(prefix + suffix)
+    budget = (max_tokens if first_max_tokens is None else first_max_tokens) - overhead
+    pieces, current, current_tokens = [], [], 0
+    for unit in units:
+        tokens = count_tokens(unit) + 1
+        if current and current_tokens + tokens > budget:
+            pieces.append(prefix + separator.join(current) + suffix)
+            current, current_tokens = [], 0
+            budget = max_tokens - overhead
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        pieces.append(prefix + separator.join(current) + suffix)
+    return pieces
+
+def split_block(kind: str, text: str, max_tokens: int, first_max_tokens: int = None) -> List[str]:
+    """The block, or pieces of it that fit max_tokens if it doesn't; prose can start with a shorter piece"""
+    if count_tokens(text) <= (max_tokens if first_max_tokens is None else min(max_tokens, first_max_tokens)):
+        return [text]
+    lines = text.split("\n")
+    if kind == "code":
+        fence = FENCE.match(lines[0]).group(1)
+        closed = len(lines) > 1 and closes_fence(lines[-1], fence)
+        body = lines[1:-1] if closed else lines[1:]
+        return pack(body, max_tokens, "\n", lines[0] + "\n", "\n" + (lines[-1] if closed else fence))
+    if kind == "table":
+        has_header = len(lines) > 1 and not re.search(r"[^|:\-\s]", lines[1])
+        header = "\n".join(lines[:2]) + "\n" if has_header else ""
+        return pack(lines[2:] if has_header else lines, max_tokens, "\n", header)
+    units = []
+    for sentence in SENTENCE_END.split(text):
+        units += sentence.split() if count_tokens(sentence) > max_tokens else [sentence]
+    return pack(units, max_tokens, " ", first_max_tokens=first_max_tokens)
+
+def common_path(a: List[Tuple[int, str]], b: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    shared = []
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        shared.append(x)
+    return shared
+
+def chunk_markdown(content: str, max_tokens: int = CHUNK_MAX_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS,
+                   block_max_tokens: int = CHUNK_BLOCK_MAX_TOKENS) -> List[Dict]:
+    """
+    Chunks of a markdown document, in order: {"text", "heading_path", "section",
+    "tokens"}. heading_path lists the titles of the headings the chunk is under
+    (for a chunk merged across sections, the ones they share); section is the
+    first "##" or deeper heading among them, or "General".
+    """
+    _, body = split_frontmatter(content)
+    # (pieces, tokens, heading path, section) per chunk
+    raw: List[Tuple[List[str], int, List[Tuple[int, str]], str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    current_path: List[Tuple[int, str]] = []
+    current_section = None
+
+    def emit():
+        nonlocal current, current_tokens, current_section
+        if current:
+            raw.append((current, current_tokens, current_path, current_section))
+        current, current_tokens, current_section = [], 0, None
+
+    def section_of(path: List[Tuple[int, str]]):
+        return next((title for level, title in path if level >= 2), None)
+
+    for path, blocks in split_sections(body):
+        if current_tokens >= min_tokens:
+            emit()
+        if not current:
+            current_path = path
+        else:
+            # A short chunk carries over into this section: under the headings both
+            # share, or this section's if the chunk is its parent's intro
+            shared = common_path(current_path, path)
+            current_path = path if shared == current_path else (shared or current_path)
+        for kind, text in blocks:
+            limit = block_max_tokens if kind in ("code", "table") else max_tokens
+            # Headings and short intros stay with what follows them: prose is split to
+            # fill the chunk, and a code block or table joins it even if over max_tokens
+            short = current_tokens < min_tokens
+            room = max_tokens - current_tokens if current and short and kind == "text" else None
+            for piece in split_block(kind, text, limit, room):
+                tokens = count_tokens(piece) + 1
+                if current and current_tokens + tokens > max_tokens and current_tokens >= min_tokens:
+                    emit()
+                    current_path = path
+                current_section = current_section or section_of(path)
+                current.append(piece)
+                current_tokens += tokens
+    # A short last chunk goes into the previous one if it fits
+    if raw and current and current_tokens < min_tokens and raw[-1][1] + current_tokens <= max_tokens:
+        pieces, tokens, path, section = raw.pop()
+        current = pieces + current
+        current_tokens += tokens
+        current_path = common_path(path, current_path) or path
+        current_section = section or current_section
+    emit()
+
+    chunks = []
+    for pieces, _, path, section in raw:
+        text = "\n\n".join(pieces)
+        if len(text.strip()) <= MIN_CHUNK_CHARS:
+            continue
+        chunks.append({
+            "text": text,
+            "heading_path": [title for _, title in path],
+            "section": section or "General",
+            "tokens": count_tokens(text)
+        })
+    return chunks
@@ -0,0 +1,157 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# A markdown document split into pieces that concatenate back to the original:
+# (True, text) pieces are prose to translate, (False, text) pieces are kept
+# verbatim - frontmatter, fenced code, block markers such as "## " or "- ",
+# table pipes, MDX import/export lines, JSX/HTML lines and blank lines.
+Segment = Tuple[bool, str]
+
+FRONTMATTER = re.compile(r"\A---[ \t]*\n.*?\n---[ \t]*(?:\n|\Z)", re.DOTALL)
+FENCE = re.compile(r"^[ \t]*(`{3,}|~{3,})")
+# Heading, list, numbered-list and blockquote markers, possibly nested ("> - ")
+BLOCK_MARKER = re.compile(r"^[ \t]*(?:(?:#{1,6}|[-*+]|\d+[.)]|>)[ \t]+)*")
+LITERAL_LINE = re.compile(r"^[ \t]*(?:<|:::|import[ \t]|export[ \t]|\{/\*)")
+TABLE_ROW = re.compile(r"^[ \t]*\|")
+HAS_WORDS = re.compile(r"[^\W\d_]")
+
+# Inline spans that must reach the reader unchanged. Text that already looks
+# like a placeholder is protected too, so restoring is unambiguous.
+PLACEHOLDER = re.compile(r"\{\{(\d+)\}\}")
+INLINE_PROTECTED = re.compile(
+    r"\{\{\d+\}\}"
+    r"|!\[[^\]\n]*\]\([^)\n]*\)"              # images
+    r"|`[^`\n]+`"                            # inline code
+    r"|(?<=\])\([^)\s]+(?:\s+\"[^\"\n]*\")?\)"  # link targets; the link text is prose
+    r"|<https?://[^>\s]+>|https?://[^\s)>\]]*[^\s)>\].,;:!?'\"]"  # URLs, minus trailing punctuation
+)
+
+def split_frontmatter(content: str) -> Tuple[str, str]:
+    """(frontmatter including its --- lines, body); frontmatter is "" if absent"""
+    match = FRONTMATTER.match(content)
+    if not match:
+        return "", content
+    return match.group(0), content[match.end():]
+
+def closes_fence(line: str, fence: str) -> bool:
+    stripped = line.strip()
+    return stripped.startswith(fence) and not stripped.strip(fence[0])
+
+def _split_line(line: str) -> List[Segment]:
+    """Segments of one non-code line (without its newline)"""
+    if not HAS_WORDS.search(line) or LITERAL_LINE.match(line):
+        return [(False, line)]
+    if TABLE_ROW.match(line):
+        segments = []
+        for cell in re.split(r"(\|)", line):
+            if HAS_WORDS.search(cell):
+                stripped = cell.strip()
+                start = cell.index(stripped)
+                segments += [(False, cell[:start]), (True, stripped), (False, cell[start + len(stripped):])]
+            else:
+                segments.append((False, cell))
+        return segments
+    marker = BLOCK_MARKER.match(line).group(0)
+    text = line[len(marker):]
+    stripped = text.rstrip()
+    return [(False, marker), (True, stripped), (False, text[len(stripped):])]
+
+def segment_markdown(content: str) -> List[Segment]:
+    """
+    Split a markdown document into translatable and verbatim segments.
+    Consecutive plain lines of a paragraph (or a list item's continuation lines)
+    form one segment, so sentences wrapped over several lines stay together.
+    "".join(text for _, text in segment_markdown(content)) == content.
+    """
+    frontmatter, body = split_frontmatter(content)
+    segments: List[Segment] = [(False, frontmatter)]
+    fence = None
+    # Whether the previous line ended a paragraph segment that may continue
+    in_paragraph = False
+    for line in body.splitlines(keepends=True):
+        text = line.rstrip("\r\n")
+        newline = line[len(text):]
+        opening = FENCE.match(text)
+        if fence or opening:
+            if fence is None:
+                fence = opening.group(1)
+            elif closes_fence(text, fence):
+                fence = None
+            segments.append((False, line))
+            in_paragraph = False
+            continue
+
+        line_segments = _split_line(text)
+        translatable = any(t for t, _ in line_segments)
+        marker = line_segments[0][1] if translatable else ""
+        is_table = bool(TABLE_ROW.match(text))
+        if in_paragraph and translatable and not is_table and not marker.strip():
+            # Continuation line: fold it into the previous line's prose segment
+            newline_before = segments.pop()[1]
+            trailing_before = segments.pop()[1]
+            previous = segments.pop()[1]
+            content = text.rstrip()
+            segments += [(True, previous + trailing_before + newline_before + content),
+                         (False, text[len(content):]), (False, newline)]
+            continue
+
+        segments.extend(line_segments)
+        segments.append((False, newline))
+        in_paragraph = translatable and not is_table and "#" not in marker
+    return [segment for segment in segments if segment[1]]
+
+def translatable_texts(segments: List[Segment]) -> List[str]:
+    """The unique prose segments, in document order"""
+    return list(dict.fromkeys(text for translatable, text in segments if translatable))
+
+def join_segments(segments: List[Segment], translations: Dict[str, str]) -> str:
+    """Reassemble a document, replacing prose segments found in `translations`"""
+    return "".join(translations.get(text, text) if translatable else text for translatable, text in segments)
+
+def protect_markdown(text: str) -> Tuple[str, List[str]]:
+    """
+    Replace fenced code blocks, inline code, images, link targets and URLs with
+    {{0}}, {{1}}, ... placeholders, so only prose is sent for translation.
+    Returns (protected text, original spans by placeholder number).
+    """
+    placeholders: List[str] = []
+
+    def hold(span: str) -> str:
+        placeholders.append(span)
+        return "{{%d}}" % (len(placeholders) - 1)
+
+    out = []
+    fence, code = None, []
+    for line in text.splitlines(keepends=True):
+        stripped = line.rstrip("\r\n")
+        if fence is None:
+            opening = FENCE.match(stripped)
+            if opening:
+                fence, code = opening.group(1), [line]
+            else:
+                out.append(INLINE_PROTECTED.sub(lambda match: hold(match.group(0)), line))
+            continue
+        code.append(line)
+        if closes_fence(stripped, fence):
+            block = "".join(code)
+            body = block.rstrip("\r\n")
+            out.append(hold(body) + block[len(body):])
+            fence, code = None, []
+    if code:
+        # Unclosed fence: the rest of the text is code
+        out.append(hold("".join(code)))
+    return "".join(out), placeholders
+
+def restore_markdown(text: str, placeholders: List[str]) -> Optional[str]:
+    """
+    Put the protected spans back into a translation, or None unless every
+    placeholder appears exactly once (the model dropped or invented one).
+    """
+    found = sorted(int(number) for number in PLACEHOLDER.findall(text))
+    if found != list(range(len(placeholders))):
+        return None
+    return PLACEHOLDER.sub(lambda match: placeholders[int(match.group(1))], text)
+
+def has_prose(protected: str) -> bool:
+    """Whether protected text has anything left to translate"""
+    return bool(HAS_WORDS.search(PLACEHOLDER.sub("", protected)))
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Connection pool shared by every request in this worker. Keep-alive connections
+# avoid a TCP + TLS handshake per LLM call.
+MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60"))
+
+# Token bucket for batch fan-out (segment translation of whole documents,
+# pretranslate, prewarm), so it stays under the account's rate limit.
+# Interactive requests (/rag/ask, single translations, streams) and ingestion,
+# whose embeddings go through ingest.http_session with its own 429 retries,
+# are not limited. OPENROUTER_RATE_LIMIT=0 disables it.
+RATE_LIMIT_PER_SECOND = float(os.getenv("OPENROUTER_RATE_LIMIT", "10"))
+RATE_LIMIT_BURST = int(os.getenv("OPENROUTER_RATE_LIMIT_BURST", "20"))
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop = None
+_transport = None
+_limiter = None
+_rate_limited: ContextVar[bool] = ContextVar("openrouter_rate_limited", default=False)
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `burst`."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waits = 0
+    
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # Take a token now, going into debt if there is none, and sleep until it
+        # is paid off: waiters are served in FIFO order without holding a lock
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        if self.tokens < 0:
+            self.waits += 1
+            try:
+                await asyncio.sleep(-self.tokens / self.rate)
+            except asyncio.CancelledError:
+                self.tokens += 1
+                raise
+
+def get_limiter() -> TokenBucket:
+    global _limiter
+    if _limiter is None:
+        _limiter = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+    return _limiter
+
+@contextmanager
+def rate_limited():
+    """
+    Rate-limit the OpenRouter requests made inside this block, including by
+    tasks it starts, with the shared token bucket
+    """
+    token = _rate_limited.set(True)
+    try:
+        yield
+    finally:
+        _rate_limited.reset(token)
+
+async def wait_for_rate_limit():
+    if _rate_limited.get():
+        await get_limiter().acquire()
+
+def build_headers(title: str = "Physical AI Textbook RAG") -> dict:
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://physical-ai-textbook.com",
+        "X-Title": title
+    }
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it on first use in the running event loop."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            base_url=OPENROUTER_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            ),
+            transport=_transport
+        )
+        _client_loop = loop
+    return _client
+
+async def close_client():
+    """Close the shared client (called on application shutdown)."""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+def set_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """Route all OpenRouter traffic through a custom transport (tests and load tests)."""
+    global _transport, _client, _client_loop
+    _transport = transport
+    _client = None
+    _client_loop = None
+
+async def chat_completion(messages: list, model: str, timeout: float = 60,
+                          title: str = "Physical AI Textbook RAG") -> str:
+    """Return the content of a chat completion. Raises httpx errors on failure."""
+    await wait_for_rate_limit()
+    response = await get_client().post(
+        "/chat/completions",
+        headers=build_headers(title),
+        json={"model": model, "messages": messages},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    data = response.json()
+    return data["choices"][0]["message"]["content"]
+
+async def stream_chat_completion(messages: list, model: str, timeout: float = 60,
+                                 title: str = "Physical AI Textbook RAG") -> AsyncIterator[str]:
+    """Yield content deltas of a streamed chat completion as they arrive."""
+    await wait_for_rate_limit()
+    async with get_client().stream(
+        "POST",
+        "/chat/completions",
+        headers=build_headers(title),
+        json={"model": model, "messages": messages, "stream": True},
+        timeout=timeout
+    ) as response:
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            # Server-sent events; OpenRouter also sends ": keep-alive" comment lines
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"].get("message", str(chunk["error"])))
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+async def create_embeddings(inputs: List[str], model: str, timeout: float = 30) -> List[List[float]]:
+    """Embed a list of texts, returning vectors in input order. Raises httpx errors on failure."""
+    await wait_for_rate_limit()
+    response = await get_client().post(
+        "/embeddings",
+        headers=build_headers(),
+        json={"model": model, "input": inputs},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    data = response.json()["data"]
+    return [item["embedding"] for item in sorted(data, key=lambda item: item["index"])]
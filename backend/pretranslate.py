@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Pre-translate the textbook docs into every supported language.
+
+Each doc is split into segments (markdown_segments): frontmatter, fenced code
+and markup are kept verbatim and only prose is translated, packed several
+segments per request. Results are written as static artifacts under
+TRANSLATED_DIR/<lang>/<doc path>, served by GET /rag/translate/doc.
+
+The job resumes where it stopped: a doc is written only once all of its
+segments translated, and docs whose source is unchanged since their artifact
+was written are skipped. With CACHE_BACKEND=sqlite, segments translated before
+a failure are not paid for again either.
+
+Usage: python pretranslate.py [--languages ur hi] [--docs module-01-ros2/index.md] [--force]
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import translation
+from translation import SUPPORTED_LANGUAGES, translate_multiple_texts
+from markdown_segments import segment_markdown, translatable_texts, join_segments, split_frontmatter
+from markdown_chunks import strip_mdx
+
+DOCS_DIR = os.getenv("DOCS_DIR", os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "textbook", "docs")))
+DOC_EXTENSIONS = (".md", ".mdx")
+TRANSLATED_DIR = os.getenv("TRANSLATED_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "translated"))
+MANIFEST_NAME = "manifest.json"
+
+def source_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def list_docs(docs_dir: str = DOCS_DIR) -> List[str]:
+    """Doc paths relative to docs_dir, e.g. "module-01-ros2/index.md" """
+    root = Path(docs_dir)
+    return sorted(
+        path.relative_to(root).as_posix()
+        for path in root.rglob("*")
+        if path.suffix in DOC_EXTENSIONS and path.is_file()
+    )
+
+def load_manifest(output_dir: str = TRANSLATED_DIR) -> Dict:
+    """{"<lang>/<doc path>": {"source_hash", "model", "translated_at"}} for written artifacts"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest in {output_dir}: {e}")
+        return {}
+
+def write_atomic(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def save_manifest(manifest: Dict, output_dir: str = TRANSLATED_DIR):
+    write_atomic(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True))
+
+def artifact_path(doc_path: str, target_lang: str, output_dir: str = TRANSLATED_DIR) -> str:
+    return os.path.join(output_dir, target_lang, *doc_path.split("/"))
+
+def is_up_to_date(manifest: Dict, doc_path: str, target_lang: str, content_hash: str,
+                  output_dir: str = TRANSLATED_DIR) -> bool:
+    entry = manifest.get(f"{target_lang}/{doc_path}")
+    return (entry is not None
+            and entry.get("source_hash") == content_hash
+            and entry.get("model") == translation.DEFAULT_MODEL
+            and os.path.exists(artifact_path(doc_path, target_lang, output_dir)))
+
+async def translate_document(content: str, target_lang: str) -> Optional[str]:
+    """The translated document, or None if any prose segment failed to translate"""
+    segments = segment_markdown(content)
+    texts = translatable_texts(segments)
+    if not texts:
+        return content
+    results = await translate_multiple_texts(texts, target_lang)
+    if not all(result.get("success") for result in results):
+        return None
+    return join_segments(segments, {text: result["translation"] for text, result in zip(texts, results)})
+
+async def pretranslate(languages: List[str] = None, docs: List[str] = None, force: bool = False,
+                       docs_dir: str = DOCS_DIR, output_dir: str = TRANSLATED_DIR) -> Dict:
+    """Translate docs into languages, skipping up-to-date artifacts; returns counts"""
+    languages = languages or [lang for lang in SUPPORTED_LANGUAGES if lang != "en"]
+    docs = docs or list_docs(docs_dir)
+    manifest = load_manifest(output_dir)
+    counts = {"translated": 0, "skipped": 0, "failed": 0}
+    start = time.time()
+
+    for target_lang in languages:
+        if target_lang not in SUPPORTED_LANGUAGES:
+            print(f"Skipping unsupported language: {target_lang}")
+            continue
+        for doc_path in docs:
+            with open(os.path.join(docs_dir, doc_path), "r", encoding="utf-8") as f:
+                content = f.read()
+            content_hash = source_hash(content)
+            if not force and is_up_to_date(manifest, doc_path, target_lang, content_hash, output_dir):
+                counts["skipped"] += 1
+                continue
+
+            translated = await translate_document(content, target_lang)
+            if translated is None:
+                print(f"❌ {target_lang}/{doc_path}: some segments failed, will retry on the next run")
+                counts["failed"] += 1
+                continue
+
+            write_atomic(artifact_path(doc_path, target_lang, output_dir), translated)
+            manifest[f"{target_lang}/{doc_path}"] = {
+                "source_hash": content_hash,
+                "model": translation.DEFAULT_MODEL,
+                "translated_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            }
+            # Saved after every doc so an interrupted run resumes from here
+            save_manifest(manifest, output_dir)
+            counts["translated"] += 1
+            print(f"✅ {target_lang}/{doc_path}")
+
+    print(f"\nTranslated {counts['translated']}, skipped {counts['skipped']} up to date, "
+          f"{counts['failed']} failed in {time.time() - start:.1f}s")
+    return counts
+
+def find_doc(doc_path: str, root: str = DOCS_DIR) -> Optional[str]:
+    """
+    Path of a doc under root, accepting "module-01-ros2", "module-01-ros2/index"
+    or "module-01-ros2/index.md". None if missing or outside root.
+    """
+    doc_path = doc_path.strip("/")
+    if not doc_path or ".." in doc_path.split("/"):
+        return None
+    root = os.path.realpath(root)
+    candidates = [doc_path] if doc_path.endswith(DOC_EXTENSIONS) else [
+        f"{doc_path}{ext}" for ext in DOC_EXTENSIONS
+    ] + [f"{doc_path}/index{ext}" for ext in DOC_EXTENSIONS]
+    for candidate in candidates:
+        path = os.path.realpath(os.path.join(root, *candidate.split("/")))
+        if path.startswith(root + os.sep) and os.path.isfile(path):
+            return path
+    return None
+
+def find_translated_doc(doc_path: str, target_lang: str, output_dir: str = TRANSLATED_DIR) -> Optional[str]:
+    """Artifact path for a doc (see find_doc), or None"""
+    if target_lang not in SUPPORTED_LANGUAGES:
+        return None
+    return find_doc(doc_path, os.path.join(output_dir, target_lang))
+
+def load_translated_doc(doc_path: str, target_lang: str, output_dir: str = TRANSLATED_DIR) -> Optional[str]:
+    """
+    A pre-translated doc as plain markdown, ready for a markdown renderer:
+    without its frontmatter or MDX imports and JSX. None if there is none.
+    """
+    path = find_translated_doc(doc_path, target_lang, output_dir)
+    if path is None:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    return strip_mdx(split_frontmatter(content)[1]).strip()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-translate the textbook docs into static artifacts")
+    parser.add_argument("--languages", nargs="+", help="target languages (default: all supported)")
+    parser.add_argument("--docs", nargs="+", help=f"doc paths relative to {DOCS_DIR} (default: all)")
+    parser.add_argument("--force", action="store_true", help="re-translate docs that are up to date")
+    args = parser.parse_args()
+    if not translation.OPENROUTER_API_KEY:
+        print("Error: OPENROUTER_API_KEY is not set")
+        sys.exit(1)
+    counts = asyncio.run(pretranslate(args.languages, args.docs, args.force))
+    sys.exit(1 if counts["failed"] else 0)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Pre-warm the personalization cache: rewrite every textbook doc for every level.
+
+The API workers read the cache through its shared store, so this only helps
+with CACHE_BACKEND=sqlite (same host, same CACHE_PATH) or CACHE_BACKEND=redis.
+Docs already cached for a level are skipped.
+
+Entries are keyed by a hash of the exact text. POST /rag/personalize/doc
+(which the chapter "Personalize" button calls with the page's doc path) reads
+the doc on the server with load_doc_body(), so it hits them; a /rag/personalize
+request only does if its "text" is the doc body exactly as doc_body() returns it.
+
+Usage: python prewarm_personalize.py [--levels beginner expert] [--concurrency 4]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+from typing import Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import rag
+import openrouter
+from markdown_segments import split_frontmatter
+from pretranslate import DOCS_DIR, find_doc, list_docs
+
+LEVELS = ["beginner", "intermediate", "expert"]
+
+def doc_body(content: str) -> str:
+    """The text a doc whose source file is content is personalized as"""
+    return split_frontmatter(content)[1].strip()
+
+def load_doc_body(doc_path: str, docs_dir: str = DOCS_DIR) -> Optional[str]:
+    """doc_body() of a doc by its path (see pretranslate.find_doc), or None if there is none"""
+    path = find_doc(doc_path, docs_dir)
+    if path is None:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return doc_body(f.read())
+
+async def prewarm(levels=None, concurrency: int = 4, docs_dir: str = DOCS_DIR) -> dict:
+    """Personalize every doc at every level not cached yet; returns counts"""
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"generated": 0, "cached": 0, "failed": 0}
+
+    async def warm(doc_path: str, text: str, level: str):
+        if rag.PERSONALIZE_CACHE.get(rag.get_personalize_cache_key(level, text)) is not None:
+            counts["cached"] += 1
+            return
+        async with semaphore:
+            await rag.personalize_text(text, level)
+        # Failures come back as error text and are not cached
+        if rag.PERSONALIZE_CACHE.get(rag.get_personalize_cache_key(level, text)) is not None:
+            counts["generated"] += 1
+            print(f"✅ {level}: {doc_path}")
+        else:
+            counts["failed"] += 1
+            print(f"❌ {level}: {doc_path}")
+
+    jobs = []
+    for doc_path in list_docs(docs_dir):
+        with open(os.path.join(docs_dir, doc_path), "r", encoding="utf-8") as f:
+            text = doc_body(f.read())
+        jobs.extend(warm(doc_path, text, level) for level in levels or LEVELS)
+    with openrouter.rate_limited():
+        await asyncio.gather(*jobs)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the personalization cache for every doc and level")
+    parser.add_argument("--levels", nargs="+", default=LEVELS, help="levels to generate (default: all three)")
+    parser.add_argument("--concurrency", type=int, default=4, help="personalizations in flight")
+    args = parser.parse_args()
+    if not rag.OPENROUTER_API_KEY:
+        print("Error: OPENROUTER_API_KEY is not set")
+        sys.exit(1)
+    if rag.PERSONALIZE_CACHE.store is None:
+        print("Error: the personalization cache has no shared store, so the API would not see the results. "
+              "Set CACHE_BACKEND=sqlite or CACHE_BACKEND=redis.")
+        sys.exit(1)
+    start = time.time()
+    counts = asyncio.run(prewarm(args.levels, args.concurrency))
+    print(f"\nGenerated {counts['generated']}, already cached {counts['cached']}, "
+          f"failed {counts['failed']} in {time.time() - start:.1f}s")
+    sys.exit(1 if counts["failed"] else 0)
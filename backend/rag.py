@@ -1,12 +1,21 @@
 import os
+import time
+import hashlib
+import asyncio
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
-import requests
+import httpx
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import Filter, FieldCondition, MatchValue
 from db import qdrant_client
-
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+import openrouter
+from openrouter import OPENROUTER_API_KEY
+from embedding_cache import get_cache as get_embedding_cache
+from singleflight import SingleFlight, prompt_key
+from cache import TTLCache, make_store
+from answer_cache import ANSWER_CACHE, ANSWER_CACHE_ENABLED, ANSWER_CACHE_DISABLED_REASON, answer_scope
 
 # Default model - you can change this to any model available on OpenRouter
 # Popular options: "meta-llama/llama-3.2-3b-instruct:free", "microsoft/phi-3-mini-128k-instruct:free", "qwen/qwen-2.5-7b-instruct:free"
@@ -15,100 +24,186 @@ EMBEDDING_MODEL = os.getenv("OPENROUTER_EMBEDDING_MODEL", "openai/text-embedding
 
 COLLECTION_NAME = "physical_ai_textbook"
 
-def call_openrouter(messages: list, model: str = None) -> str:
+API_KEY_MISSING = "OpenRouter API Key not found. Please set OPENROUTER_API_KEY in .env."
+
+# Personalized rewrites, keyed by (model, level, hash of the text). Same backends
+# as the translation cache (CACHE_BACKEND=memory|sqlite|redis); a shared backend
+# lets prewarm_personalize.py fill the cache for all workers.
+PERSONALIZE_CACHE_TTL_HOURS = float(os.getenv("PERSONALIZE_CACHE_TTL_HOURS", str(24 * 7)))
+PERSONALIZE_CACHE_MAX_ENTRIES = int(os.getenv("PERSONALIZE_CACHE_MAX_ENTRIES", "5000"))
+PERSONALIZE_CACHE_MAX_MB = float(os.getenv("PERSONALIZE_CACHE_MAX_MB", "64"))
+PERSONALIZE_CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+
+PERSONALIZE_CACHE = TTLCache(
+    max_entries=PERSONALIZE_CACHE_MAX_ENTRIES,
+    max_bytes=int(PERSONALIZE_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=PERSONALIZE_CACHE_TTL_HOURS * 3600,
+    store=make_store(PERSONALIZE_CACHE_BACKEND, "personalizations",
+                     os.getenv("CACHE_PATH", "cache.db"), os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+)
+
+async def call_openrouter(messages: list, model: str = None) -> str:
     """Make a chat completion request to OpenRouter API."""
     if not OPENROUTER_API_KEY:
-        return "OpenRouter API Key not found. Please set OPENROUTER_API_KEY in .env."
+        return API_KEY_MISSING
     
     model = model or DEFAULT_MODEL
     
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://physical-ai-textbook.com",
-        "X-Title": "Physical AI Textbook RAG"
-    }
-    
-    payload = {
-        "model": model,
-        "messages": messages
-    }
-    
     try:
-        response = requests.post(
-            f"{OPENROUTER_BASE_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
-    except requests.exceptions.HTTPError as e:
-        return f"OpenRouter API error: {response.status_code} - {response.text}"
+        return await openrouter.chat_completion(messages, model, timeout=60)
     except Exception as e:
-        return f"Error calling OpenRouter: {str(e)}"
+        return describe_openrouter_error(e)
+
+def describe_openrouter_error(e: Exception) -> str:
+    """The message returned to clients in place of a completion when a request fails"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"OpenRouter API error: {e.response.status_code} - {e.response.text}"
+    return f"Error calling OpenRouter: {str(e)}"
 
-def get_embedding(text: str):
-    """Get embeddings using OpenRouter's embedding endpoint."""
+async def get_embedding(text: str):
+    """Get embeddings using OpenRouter's embedding endpoint, via the persistent embedding cache."""
     if not OPENROUTER_API_KEY:
         return [0.0] * 1536  # Mock embedding if no key (1536 for OpenAI embeddings)
     
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://physical-ai-textbook.com",
-        "X-Title": "Physical AI Textbook RAG"
-    }
-    
-    payload = {
-        "model": EMBEDDING_MODEL,
-        "input": text
-    }
+    cache = get_embedding_cache()
+    if cache:
+        cached = (await asyncio.to_thread(cache.get_many, EMBEDDING_MODEL, [text]))[0]
+        if cached is not None:
+            return cached
     
     try:
-        response = requests.post(
-            f"{OPENROUTER_BASE_URL}/embeddings",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["data"][0]["embedding"]
+        embeddings = await openrouter.create_embeddings([text], EMBEDDING_MODEL, timeout=30)
     except Exception as e:
         print(f"Embedding error: {e}")
         return [0.0] * 1536
+    
+    if cache:
+        await asyncio.to_thread(cache.put_many, EMBEDDING_MODEL, [text], embeddings)
+    return embeddings[0]
+
+# Minimum cosine similarity a chunk needs to be returned as context (unset = no cutoff)
+SCORE_THRESHOLD = float(os.getenv("RAG_SCORE_THRESHOLD")) if os.getenv("RAG_SCORE_THRESHOLD") else None
+
+def build_filter(chapter: str = None, section: str = None):
+    """Build a Qdrant payload filter on chapter/section, or None if neither is given."""
+    conditions = []
+    if chapter:
+        conditions.append(FieldCondition(key="chapter", match=MatchValue(value=chapter)))
+    if section:
+        conditions.append(FieldCondition(key="section", match=MatchValue(value=section)))
+    return Filter(must=conditions) if conditions else None
+
+# Collection metadata cache, so search_context does not pay a get_collection
+# round trip on every request. Misses are cached for a shorter time so a fresh
+# ingest run is picked up quickly.
+COLLECTION_CACHE_TTL = float(os.getenv("COLLECTION_CACHE_TTL", "300"))
+COLLECTION_CACHE_MISSING_TTL = float(os.getenv("COLLECTION_CACHE_MISSING_TTL", "10"))
+_collection_cache = {"info": None, "expires_at": 0.0}
+_collection_cache_lock = threading.Lock()
+COLLECTION_CACHE_STATS = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def is_collection_not_found(error: Exception) -> bool:
+    """True if a Qdrant error means the collection does not exist."""
+    if isinstance(error, UnexpectedResponse) and error.status_code == 404:
+        return True
+    return "not found" in str(error).lower()
 
-def search_context(query: str, limit: int = 5):
+def invalidate_collection_cache():
+    """Drop cached collection metadata (call after creating/deleting the collection)."""
+    with _collection_cache_lock:
+        _collection_cache["info"] = None
+        _collection_cache["expires_at"] = 0.0
+        COLLECTION_CACHE_STATS["invalidations"] += 1
+
+def get_collection_info():
+    """Return cached metadata for COLLECTION_NAME, or None if it does not exist."""
+    now = time.monotonic()
+    with _collection_cache_lock:
+        if now < _collection_cache["expires_at"]:
+            COLLECTION_CACHE_STATS["hits"] += 1
+            return _collection_cache["info"]
+        COLLECTION_CACHE_STATS["misses"] += 1
+    
+    try:
+        collection = qdrant_client.get_collection(COLLECTION_NAME)
+        info = {
+            "name": COLLECTION_NAME,
+            "points_count": collection.points_count,
+            "status": str(collection.status)
+        }
+        ttl = COLLECTION_CACHE_TTL
+    except Exception as e:
+        if not is_collection_not_found(e):
+            # Transient error: don't cache, let the next request retry
+            raise
+        info = None
+        ttl = COLLECTION_CACHE_MISSING_TTL
+    
+    with _collection_cache_lock:
+        _collection_cache["info"] = info
+        _collection_cache["expires_at"] = time.monotonic() + ttl
+    return info
+
+def get_collection_cache_stats():
+    """Get collection metadata cache statistics"""
+    with _collection_cache_lock:
+        lookups = COLLECTION_CACHE_STATS["hits"] + COLLECTION_CACHE_STATS["misses"]
+        return {
+            **COLLECTION_CACHE_STATS,
+            "hit_rate": COLLECTION_CACHE_STATS["hits"] / lookups if lookups else 0.0,
+            "cached": _collection_cache["info"],
+            "ttl_seconds": COLLECTION_CACHE_TTL
+        }
+
+async def search_context(query: str, limit: int = 5, score_threshold: float = None,
+                         chapter: str = None, section: str = None, query_vector: list = None):
+    """
+    Return payloads of the chunks most similar to the query, best match first.
+    Pass query_vector if the query is already embedded.
+    """
     if not qdrant_client:
         return []
     
     # Check if collection exists
     try:
-        collections = qdrant_client.get_collections()
-        collection_exists = any(c.name == COLLECTION_NAME for c in collections.collections)
-        if not collection_exists:
+        if await asyncio.to_thread(get_collection_info) is None:
             print(f"Collection '{COLLECTION_NAME}' does not exist. Please run ingest.py first.")
             return []
     except Exception as e:
         print(f"Error checking collections: {e}")
         return []
     
-    # For now, use scroll to get sample documents (simplified approach)
-    # In a production system, you'd want proper vector search
+    if query_vector is None:
+        query_vector = await get_embedding(query)
+    if score_threshold is None:
+        score_threshold = SCORE_THRESHOLD
+    
     try:
-        points = qdrant_client.scroll(
+        response = await asyncio.to_thread(
+            qdrant_client.query_points,
             collection_name=COLLECTION_NAME,
+            query=query_vector,
+            query_filter=build_filter(chapter, section),
+            score_threshold=score_threshold,
             limit=limit,
             with_payload=True
         )
-        return [point.payload for point in points[0] if point.payload]
+        return [{**point.payload, "score": point.score} for point in response.points if point.payload]
     except Exception as e:
+        if is_collection_not_found(e):
+            invalidate_collection_cache()
         print(f"Error retrieving documents: {e}")
         return []
 
-def generate_answer(query: str, context: list, user_background: str = "General"):
+async def stream_openrouter(messages: list, model: str = None):
+    """Yield completion deltas from OpenRouter as they are generated."""
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError(API_KEY_MISSING)
+    
+    async for delta in openrouter.stream_chat_completion(messages, model or DEFAULT_MODEL, timeout=60):
+        yield delta
+
+def build_answer_messages(query: str, context: list, user_background: str = "General") -> list:
     context_str = "\n\n".join([c.get('text', '') for c in context])
     
     system_prompt = f"""You are an expert AI assistant for a Physical AI & Humanoid Robotics textbook. 
@@ -118,7 +213,7 @@ If the answer is not in the context, use your general knowledge but mention that
 User Background: {user_background}
 (Tailor your answer to this background. If they are 'Software', focus on code/algorithms. If 'Hardware', focus on electronics/actuators.)"""
 
-    messages = [
+    return [
         {
             "role": "system",
             "content": system_prompt
@@ -131,11 +226,93 @@ User Background: {user_background}
 Question: {query}"""
         }
     ]
+
+async def generate_answer(query: str, context: list, user_background: str = "General"):
+    return await call_openrouter(build_answer_messages(query, context, user_background))
+
+def stream_answer(query: str, context: list, user_background: str = "General"):
+    return stream_openrouter(build_answer_messages(query, context, user_background))
+
+async def answer_query(query: str, user_background: str = "General", chapter: str = None,
+                       section: str = None, score_threshold: float = None) -> dict:
+    """
+    Retrieve context and answer the query, reusing the answer to a semantically
+    similar earlier question (answer_cache) when there is one.
+    Returns {"answer", "context", "cached"}, plus "similarity" for a cached answer.
+    Only successful answers grounded in some context are cached.
+    """
+    start = time.perf_counter()
+    query_vector = await get_embedding(query)
+    scope = answer_scope(user_background, chapter, section, score_threshold)
+    if ANSWER_CACHE_ENABLED:
+        # Off the event loop: the lookup may read the shared generation marker
+        hit = await asyncio.to_thread(ANSWER_CACHE.lookup, query_vector, scope)
+        if hit is not None:
+            ANSWER_CACHE.record_hit(time.perf_counter() - start)
+            return {"answer": hit["answer"], "context": hit["context"], "cached": True, "similarity": hit["similarity"]}
+    
+    epoch = ANSWER_CACHE.epoch
+    context = await search_context(query, score_threshold=score_threshold, chapter=chapter,
+                                   section=section, query_vector=query_vector)
+    if not OPENROUTER_API_KEY:
+        return {"answer": API_KEY_MISSING, "context": context, "cached": False}
+    try:
+        answer = await openrouter.chat_completion(
+            build_answer_messages(query, context, user_background), DEFAULT_MODEL, timeout=60
+        )
+    except Exception as e:
+        return {"answer": describe_openrouter_error(e), "context": context, "cached": False}
     
-    return call_openrouter(messages)
+    if ANSWER_CACHE_ENABLED and context:
+        ANSWER_CACHE.add(query_vector, scope, query, answer, context,
+                         latency=time.perf_counter() - start, epoch=epoch)
+    return {"answer": answer, "context": context, "cached": False}
 
-def personalize_text(text: str, level: str):
-    messages = [
+async def prepare_answer_stream(query: str, user_background: str = "General", chapter: str = None,
+                                section: str = None, score_threshold: float = None):
+    """
+    (context, answer deltas, meta) for a streamed answer, through the semantic
+    answer cache like answer_query: a cached answer arrives as a single delta,
+    and a streamed answer is cached once it completes.
+    """
+    start = time.perf_counter()
+    query_vector = await get_embedding(query)
+    scope = answer_scope(user_background, chapter, section, score_threshold)
+    if ANSWER_CACHE_ENABLED:
+        # Off the event loop: the lookup may read the shared generation marker
+        hit = await asyncio.to_thread(ANSWER_CACHE.lookup, query_vector, scope)
+        if hit is not None:
+            ANSWER_CACHE.record_hit(time.perf_counter() - start)
+            
+            async def cached_answer():
+                yield hit["answer"]
+            
+            return hit["context"], cached_answer(), {"cached": True, "similarity": hit["similarity"]}
+    
+    epoch = ANSWER_CACHE.epoch
+    context = await search_context(query, score_threshold=score_threshold, chapter=chapter,
+                                   section=section, query_vector=query_vector)
+    
+    async def streamed_answer():
+        parts = []
+        async for delta in stream_answer(query, context, user_background):
+            parts.append(delta)
+            yield delta
+        if ANSWER_CACHE_ENABLED and context:
+            ANSWER_CACHE.add(query_vector, scope, query, "".join(parts), context,
+                             latency=time.perf_counter() - start, epoch=epoch)
+    
+    return context, streamed_answer(), {"cached": False}
+
+def get_answer_cache_stats():
+    """Get semantic answer cache statistics"""
+    return {"enabled": ANSWER_CACHE_ENABLED, "disabled_reason": ANSWER_CACHE_DISABLED_REASON, **ANSWER_CACHE.stats()}
+
+def clear_answer_cache():
+    ANSWER_CACHE.clear()
+
+def build_personalize_messages(text: str, level: str) -> list:
+    return [
         {
             "role": "system",
             "content": """You are an expert at adapting educational content for different skill levels.
@@ -153,10 +330,58 @@ Content:
 {text}"""
         }
     ]
+
+# Identical personalization requests in flight at the same time share one upstream call
+PERSONALIZE_FLIGHTS = SingleFlight("personalize")
+
+def get_personalize_cache_key(level: str, text: str, model: str = None) -> str:
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model or DEFAULT_MODEL}:{level.strip().lower()}:{text_hash}"
+
+async def personalize_text(text: str, level: str):
+    """Rewrite text for a skill level; cached, and shared with identical requests in flight"""
+    cache_key = get_personalize_cache_key(level, text)
+    cached = await PERSONALIZE_CACHE.get_async(cache_key)
+    if cached is not None:
+        return cached
+    if not OPENROUTER_API_KEY:
+        return API_KEY_MISSING
+    
+    messages = build_personalize_messages(text, level)
     
-    return call_openrouter(messages)
+    async def personalize_and_cache() -> str:
+        personalized = await openrouter.chat_completion(messages, DEFAULT_MODEL, timeout=60)
+        await PERSONALIZE_CACHE.set_async(cache_key, personalized)
+        return personalized
+    
+    try:
+        return await PERSONALIZE_FLIGHTS.do(prompt_key(DEFAULT_MODEL, messages), personalize_and_cache)
+    except Exception as e:
+        # Errors are returned as text, like call_openrouter, and never cached
+        return describe_openrouter_error(e)
+
+async def stream_personalized_text(text: str, level: str):
+    """Stream a personalized rewrite; a cached one is yielded whole, a finished one is cached"""
+    cache_key = get_personalize_cache_key(level, text)
+    cached = await PERSONALIZE_CACHE.get_async(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts = []
+    async for delta in stream_openrouter(build_personalize_messages(text, level)):
+        parts.append(delta)
+        yield delta
+    await PERSONALIZE_CACHE.set_async(cache_key, "".join(parts))
+
+def get_personalize_cache_stats():
+    """Get personalization cache statistics"""
+    return PERSONALIZE_CACHE.stats()
+
+def clear_personalize_cache():
+    PERSONALIZE_CACHE.clear()
 
-def translate_text(text: str, target_language: str):
+async def translate_text(text: str, target_language: str):
     messages = [
         {
             "role": "system",
@@ -171,4 +396,4 @@ Content:
         }
     ]
     
-    return call_openrouter(messages)
+    return await call_openrouter(messages)
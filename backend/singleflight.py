@@ -0,0 +1,55 @@
+import json
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, List, TypeVar
+
+T = TypeVar("T")
+
+def prompt_key(model: str, messages: List[Dict]) -> str:
+    """
+    Key for a chat completion request: the model and the exact messages.
+    Whitespace is not normalized: line breaks and indentation change markdown
+    and code, and a follower gets (and caches) the leader's output.
+    """
+    exact = [[m["role"], m["content"]] for m in messages]
+    return hashlib.sha256(json.dumps([model, exact], ensure_ascii=False).encode()).hexdigest()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    call as a task, and callers arriving while it is in flight await that same
+    task instead of starting their own. The task is shielded, so a caller that
+    disconnects does not cancel it for the others. Results are not kept once
+    the call finishes; that is the caches' job.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.counters = {"originated": 0, "coalesced": 0}
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.counters["originated"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict:
+        calls = self.counters["originated"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "coalesced_rate": self.counters["coalesced"] / calls if calls else 0.0,
+            "in_flight": len(self._calls)
+        }
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for local access-token verification and the profile cache. The Supabase
+client is replaced by an in-process fake (FakeSupabase, monkeypatched over
+auth.supabase), so no HTTP endpoints are involved and no network access is needed.
+"""
+
+import sys
+import os
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+import auth
+from cache import TTLCache
+
+SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+def make_token(key=SECRET, algorithm: str = "HS256", **claims) -> str:
+    claims = {"sub": "user-1", "email": "ada@example.com", "aud": "authenticated",
+              "exp": int(time.time()) + 3600, **claims}
+    return jwt.encode(claims, key, algorithm=algorithm)
+
+class FakeSupabase:
+    """
+    Fake of the parts of the Supabase client auth.py uses (GoTrue get_user and
+    the profiles table), recording calls instead of making requests
+    """
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.calls = []
+        self.auth = SimpleNamespace(get_user=self.get_user)
+
+    def get_user(self, token):
+        self.calls.append(("get_user", token))
+        return SimpleNamespace(user=SimpleNamespace(id="user-1", email="ada@example.com", aud="authenticated"))
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+class FakeQuery:
+    def __init__(self, client, name):
+        self.client, self.name, self.update_data, self.filters = client, name, None, {}
+
+    def select(self, columns):
+        return self
+
+    def update(self, data):
+        self.update_data = data
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def execute(self):
+        self.client.calls.append((self.name, "update" if self.update_data else "select"))
+        rows = [p for p in self.client.profiles if p["id"] == self.filters.get("id")]
+        for row in rows:
+            row.update(self.update_data or {})
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+def with_fake_supabase(monkeypatch, secret=SECRET):
+    fake = FakeSupabase([{"id": "user-1", "email": "ada@example.com", "full_name": "Ada", "ros_level": "beginner"}])
+    monkeypatch.setattr(auth, "supabase", fake)
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", secret)
+    monkeypatch.setattr(auth, "PROFILE_CACHE", TTLCache(ttl_seconds=60))
+    return fake
+
+def test_tokens_are_verified_locally(monkeypatch):
+    """Valid tokens need no round trip; forged, expired or foreign ones are rejected"""
+    fake = with_fake_supabase(monkeypatch)
+    assert auth.verify_token(make_token()) == {"id": "user-1", "email": "ada@example.com", "aud": "authenticated"}
+    assert auth.verify_token(make_token(key="other-secret-also-at-least-32-bytes")) is None
+    assert auth.verify_token(make_token(exp=int(time.time()) - 3600)) is None
+    assert auth.verify_token(make_token(aud="anon")) is None
+    assert auth.verify_token("not-a-token") is None
+    assert auth.verify_token(make_token(exp="tomorrow")) is None
+    assert auth.verify_token(make_token(exp=None)) is None
+    assert auth.verify_token(make_token(nbf=[0])) is None
+    assert fake.calls == []
+
+def test_asymmetric_tokens_get_the_same_claim_checks(monkeypatch):
+    """RS256 tokens verified with the JWKS key are held to the same expiry and audience rules"""
+    fake = with_fake_supabase(monkeypatch, secret=None)
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    monkeypatch.setattr(auth, "_jwks_signing_key", lambda token: private_key.public_key())
+    sign = lambda **claims: make_token(key=private_key, algorithm="RS256", **claims)
+    assert auth.verify_token(sign())["id"] == "user-1"
+    assert auth.verify_token(sign(exp=int(time.time()) - 10)) is not None  # within the leeway
+    assert auth.verify_token(sign(exp=int(time.time()) - 3600)) is None
+    assert auth.verify_token(sign(aud="anon")) is None
+    assert auth.verify_token(sign(sub="")) is None
+    assert fake.calls == []
+
+def test_tokens_fall_back_to_supabase_without_a_secret(monkeypatch):
+    """Without SUPABASE_JWT_SECRET the token is checked with GoTrue, as before"""
+    fake = with_fake_supabase(monkeypatch, secret=None)
+    token = make_token()
+    assert auth.verify_token(token)["id"] == "user-1"
+    assert fake.calls == [("get_user", token)]
+
+def test_profile_cache_is_invalidated_by_updates(monkeypatch):
+    """Profiles are read once, and read again after update_user_profile"""
+    fake = with_fake_supabase(monkeypatch)
+    assert auth.get_user_profile("user-1")["ros_level"] == "beginner"
+    assert auth.get_user_profile("user-1")["ros_level"] == "beginner"
+    assert fake.calls == [("profiles", "select")]
+
+    assert auth.update_user_profile("user-1", {"ros_level": "advanced"})
+    assert auth.get_user_profile("user-1")["ros_level"] == "advanced"
+    assert fake.calls == [("profiles", "select"), ("profiles", "update"), ("profiles", "select")]
+    assert auth.get_user_profile("missing") is None
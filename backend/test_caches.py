@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Tests for the local caches (no network access required)
+"""
+
+import sys
+import os
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cache
+from cache import TTLCache, SQLiteStore
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+def test_embedding_cache_round_trip(tmp_path):
+    """Vectors come back in input order, keyed by model and text"""
+    cache = EmbeddingCache(str(tmp_path / "emb.db"))
+    cache.put_many("model-a", ["alpha", "beta"], [[1.0, 2.0], [3.0, 4.0]])
+    assert cache.get_many("model-a", ["beta", "gamma", "alpha"]) == [[3.0, 4.0], None, [1.0, 2.0]]
+    assert cache.get_many("model-b", ["alpha"]) == [None]
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 2)
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    """Once over max_entries, the least recently used vectors are dropped first"""
+    cache = EmbeddingCache(str(tmp_path / "emb.db"), max_entries=10, touch_seconds=0)
+    texts = [f"text {i}" for i in range(10)]
+    cache.put_many("m", texts, [[float(i)] for i in range(10)])
+    cache.get_many("m", ["text 0"])  # touch the oldest entry
+    cache.put_many("m", ["text 10"], [[10.0]])
+    cached = cache.get_many("m", texts + ["text 10"])
+    assert cached[0] == [0.0]
+    assert cached[10] == [10.0]
+    assert sum(1 for c in cached if c is None) == 2
+    assert cache.get_stats()["entries"] == 9
+
+def test_embedding_cache_hits_only_write_stale_recency(tmp_path):
+    """Hits on recently used vectors are read-only; older ones get last_used bumped"""
+    cache = EmbeddingCache(str(tmp_path / "emb.db"), touch_seconds=60)
+    cache.put_many("m", ["fresh", "old"], [[1.0], [2.0]])
+    cache._conn.execute("UPDATE embeddings SET last_used = last_used - 120 WHERE text_hash = ?",
+                        (embedding_cache.text_hash("old"),))
+    cache._conn.commit()
+    before = dict(cache._conn.execute("SELECT text_hash, last_used FROM embeddings").fetchall())
+    changes = cache._conn.total_changes
+    assert cache.get_many("m", ["fresh", "old"]) == [[1.0], [2.0]]
+    after = dict(cache._conn.execute("SELECT text_hash, last_used FROM embeddings").fetchall())
+    assert cache._conn.total_changes == changes + 1
+    assert after[embedding_cache.text_hash("fresh")] == before[embedding_cache.text_hash("fresh")]
+    assert after[embedding_cache.text_hash("old")] > before[embedding_cache.text_hash("old")]
+    cache.get_many("m", ["fresh", "old"])
+    assert cache._conn.total_changes == changes + 1
+
+def test_embedding_cache_is_shared_between_connections(tmp_path):
+    """A second process (here: a second connection) sees vectors written by the first"""
+    path = str(tmp_path / "emb.db")
+    EmbeddingCache(path).put_many("m", ["shared"], [[0.5]])
+    assert EmbeddingCache(path).get_many("m", ["shared"]) == [[0.5]]
+
+def test_ttl_cache_lru_eviction():
+    """The least recently used entry goes first when the cache is full"""
+    c = TTLCache(max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert (c.get("a"), c.get("c")) == (1, 3)
+    assert c.stats()["evictions"] == 1
+
+def test_ttl_cache_memory_budget():
+    """Entries are evicted to stay under max_bytes"""
+    c = TTLCache(max_entries=1000, max_bytes=2000)
+    for i in range(20):
+        c.set(f"k{i}", "x" * 200)
+    stats = c.stats()
+    assert stats["bytes"] <= 2000
+    assert stats["entries"] < 20
+    assert c.get("k19") == "x" * 200
+
+def test_ttl_cache_evicts_expired_entries(monkeypatch):
+    """Expired entries are removed from memory, not only skipped"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    c = TTLCache(ttl_seconds=10)
+    c.set("old", "v")
+    now[0] += 5
+    c.set("new", "v")
+    now[0] += 6
+    stats = c.stats()
+    assert (stats["entries"], stats["expirations"]) == (1, 1)
+    assert c.get("old") is None
+    assert c.get("new") == "v"
+
+def test_ttl_cache_expires_entries_read_from_the_store(monkeypatch, tmp_path):
+    """Entries read through with an older expiry than local ones still expire on time"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    store = SQLiteStore(str(tmp_path / "cache.db"), "translations")
+    c = TTLCache(ttl_seconds=100, store=store)
+    store.set("shared", "v", now[0] + 10)
+    c.set("local", "v")
+    assert c.get("shared") == "v"
+    now[0] += 20
+    store.delete("shared")
+    stats = c.stats()
+    assert (stats["entries"], stats["expired_entries"], stats["expirations"]) == (1, 1, 1)
+    assert "shared" not in c
+    assert c.stats()["expired_entries"] == 0
+
+def test_ttl_cache_write_through_survives_restart(tmp_path):
+    """A new cache on the same store starts with the entries written before"""
+    path = str(tmp_path / "cache.db")
+    c = TTLCache(store=SQLiteStore(path, "translations"))
+    c.set("greeting", {"translation": "salaam"})
+    c.set("gone", {"translation": "x"})
+    c.delete("gone")
+    restarted = TTLCache(store=SQLiteStore(path, "translations"))
+    assert restarted.get("greeting") == {"translation": "salaam"}
+    assert restarted.get("gone") is None
+
+def test_ttl_cache_workers_share_l2(tmp_path):
+    """A translation cached by one worker is an L2 hit for another worker"""
+    path = str(tmp_path / "cache.db")
+    worker_a = TTLCache(store=SQLiteStore(path, "translations"))
+    worker_b = TTLCache(store=SQLiteStore(path, "translations"))
+    worker_a.set("para-1:ur", {"translation": "..."})
+    assert worker_b.get("para-1:ur") == {"translation": "..."}
+    assert worker_b.get("para-1:ur") == {"translation": "..."}
+    stats = worker_b.stats()
+    assert (stats["l2_hits"], stats["hits"], stats["misses"]) == (1, 1, 0)
+
+def test_ttl_cache_async_store_io_runs_off_the_loop(tmp_path):
+    """get_async/set_async go to the store from a worker thread, not the event loop's"""
+    store = SQLiteStore(str(tmp_path / "cache.db"), "translations")
+    threads = []
+    original_get, original_set = store.get, store.set
+    store.get = lambda *args: threads.append(threading.current_thread()) or original_get(*args)
+    store.set = lambda *args: threads.append(threading.current_thread()) or original_set(*args)
+    worker_a, worker_b = TTLCache(store=store), TTLCache(store=store)
+
+    async def main():
+        await worker_a.set_async("para-1:ur", {"translation": "..."})
+        return await worker_b.get_async("para-1:ur"), await worker_b.get_async("missing"), threading.current_thread()
+
+    found, missing, loop_thread = asyncio.run(main())
+    assert (found, missing) == ({"translation": "..."}, None)
+    assert len(threads) == 3 and loop_thread not in threads
+    assert (worker_b.stats()["l2_hits"], worker_b.stats()["misses"]) == (1, 1)
+
+def test_make_store_falls_back_to_memory():
+    """An unavailable backend degrades to the in-process cache instead of failing"""
+    assert cache.make_store("memory", "t") is None
+    assert cache.make_store("redis", "t", redis_url="redis://127.0.0.1:1/0") is None
+
+def test_personalize_cache_hits_and_skips_errors(monkeypatch):
+    """Results are cached per (model, level, text); failed calls are not cached"""
+    import asyncio
+    import rag
+    calls = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        calls.append(messages[-1]["content"])
+        if "fail" in messages[-1]["content"]:
+            raise RuntimeError("upstream down")
+        return f"rewritten {len(calls)}"
+
+    monkeypatch.setattr(rag, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(rag.openrouter, "chat_completion", fake_completion)
+    monkeypatch.setattr(rag, "PERSONALIZE_CACHE", TTLCache(max_entries=10))
+
+    assert asyncio.run(rag.personalize_text("Nodes talk over topics", "beginner")) == "rewritten 1"
+    assert asyncio.run(rag.personalize_text("Nodes talk over topics", "Beginner ")) == "rewritten 1"
+    assert asyncio.run(rag.personalize_text("Nodes talk over topics", "expert")) == "rewritten 2"
+    assert asyncio.run(rag.personalize_text("please fail", "expert")).startswith("Error calling OpenRouter")
+    assert asyncio.run(rag.personalize_text("please fail", "expert")).startswith("Error calling OpenRouter")
+    assert len(calls) == 4
+    stats = rag.get_personalize_cache_stats()
+    assert (stats["hits"], stats["entries"]) == (1, 2)
+
+def test_prewarmed_personalizations_match_the_doc_body(monkeypatch, tmp_path):
+    """Pre-warming rewrites the doc without its frontmatter, as /rag/personalize/doc reads it"""
+    import asyncio
+    import rag
+    import prewarm_personalize
+    sent = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        sent.append(messages[-1]["content"])
+        return "rewritten"
+
+    monkeypatch.setattr(rag, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(rag.openrouter, "chat_completion", fake_completion)
+    monkeypatch.setattr(rag, "PERSONALIZE_CACHE", TTLCache(max_entries=10))
+    (tmp_path / "intro.md").write_text("---\nsidebar_position: 1\n---\n\n# Intro\n\nNodes talk over topics.\n")
+
+    counts = asyncio.run(prewarm_personalize.prewarm(["beginner"], docs_dir=str(tmp_path)))
+    assert counts == {"generated": 1, "cached": 0, "failed": 0}
+    assert "sidebar_position" not in sent[0]
+    assert asyncio.run(rag.personalize_text("# Intro\n\nNodes talk over topics.", "beginner")) == "rewritten"
+    # What /rag/personalize/doc sends for the page's doc path
+    body = prewarm_personalize.load_doc_body("intro", str(tmp_path))
+    assert asyncio.run(rag.personalize_text(body, "Beginner")) == "rewritten"
+    assert prewarm_personalize.load_doc_body("../intro", str(tmp_path)) is None
+    assert len(sent) == 1
+
+def test_semantic_answer_cache_matches_similar_queries_per_scope():
+    """Close query vectors hit within the same scope only, above the threshold"""
+    from answer_cache import SemanticAnswerCache, answer_scope
+    answers = SemanticAnswerCache(threshold=0.9)
+    software = answer_scope("Software")
+    answers.add([1.0, 0.0, 0.0], software, "what is ROS 2?", "ROS 2 is middleware", [{"text": "ctx"}])
+    hit = answers.lookup([0.95, 0.1, 0.0], answer_scope(" software "))
+    assert hit["answer"] == "ROS 2 is middleware" and hit["similarity"] > 0.99
+    assert answers.lookup([0.95, 0.1, 0.0], answer_scope("Hardware")) is None
+    assert answers.lookup([0.95, 0.1, 0.0], answer_scope("Software", chapter="module-02")) is None
+    assert answers.lookup([0.5, 0.5, 0.5], software) is None
+    assert answers.lookup([0.0, 0.0, 0.0], software) is None
+    stats = answers.stats()
+    assert (stats["hits"], stats["misses"], stats["skipped"]) == (1, 3, 1)
+
+def test_semantic_answer_cache_invalidated_by_other_process(tmp_path, monkeypatch):
+    """Bumping the shared generation (as ingest does) empties the workers' caches"""
+    import answer_cache
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_GENERATION_CHECK_SECONDS", 0)
+    worker = answer_cache.SemanticAnswerCache(generation_store=SQLiteStore(str(tmp_path / "c.db"), "meta"))
+    ingest = answer_cache.SemanticAnswerCache(generation_store=SQLiteStore(str(tmp_path / "c.db"), "meta"))
+    assert worker.lookup([1.0, 0.0], "s") is None
+    epoch = worker.epoch
+    worker.add([1.0, 0.0], "s", "q", "old answer", [], epoch=epoch)
+    assert worker.lookup([1.0, 0.0], "s")["answer"] == "old answer"
+
+    ingest.invalidate()
+    assert worker.lookup([1.0, 0.0], "s") is None
+    # An answer generated before the invalidation is not cached after it
+    worker.add([1.0, 0.0], "s", "q", "stale answer", [], epoch=epoch)
+    assert len(worker) == 0 and worker.stats()["invalidations"] == 1
+
+def test_semantic_answer_cache_requires_a_shared_store(tmp_path):
+    """Without a store ingest can reach from another process, the answer cache is not enabled"""
+    from answer_cache import shared_generation_available
+    assert not shared_generation_available(None)
+    assert shared_generation_available(SQLiteStore(str(tmp_path / "c.db"), "meta"))
+
+def test_ask_reuses_answer_for_similar_question(monkeypatch):
+    """A near-identical question skips retrieval and generation"""
+    import asyncio
+    import rag
+    from answer_cache import SemanticAnswerCache
+    vectors = {"What is ROS 2?": [1.0, 0.0], "what is ros2": [0.99, 0.05], "How do I tune PID?": [0.0, 1.0]}
+    calls = []
+
+    async def fake_embedding(text):
+        return vectors[text]
+
+    async def fake_search(query, **kwargs):
+        calls.append(("search", query))
+        return [{"text": "ROS 2 is a robotics middleware."}]
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        calls.append(("llm", messages[-1]["content"]))
+        return "answer"
+
+    monkeypatch.setattr(rag, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(rag, "get_embedding", fake_embedding)
+    monkeypatch.setattr(rag, "search_context", fake_search)
+    monkeypatch.setattr(rag.openrouter, "chat_completion", fake_completion)
+    monkeypatch.setattr(rag, "ANSWER_CACHE", SemanticAnswerCache(threshold=0.95))
+    monkeypatch.setattr(rag, "ANSWER_CACHE_ENABLED", True)
+
+    first = asyncio.run(rag.answer_query("What is ROS 2?", "Software"))
+    second = asyncio.run(rag.answer_query("what is ros2", "Software"))
+    asyncio.run(rag.answer_query("How do I tune PID?", "Software"))
+    assert not first["cached"] and second["cached"] and second["answer"] == "answer"
+    assert [kind for kind, _ in calls] == ["search", "llm", "search", "llm"]
+    assert rag.get_answer_cache_stats()["saved_seconds"] >= 0
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the Postgres connection pool, with stand-in connections (no database required)
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from db import ConnectionPool, PoolTimeout
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql):
+        if self.conn.broken:
+            raise RuntimeError("server closed the connection unexpectedly")
+        self.conn.queries.append(sql)
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.broken = False
+        self.queries = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+def make_pool(**kwargs):
+    made = []
+    def connect():
+        made.append(FakeConnection(len(made)))
+        return made[-1]
+    return ConnectionPool(connect, **kwargs), made
+
+def test_connections_are_reused_up_to_max_size():
+    """Released connections are handed out again; callers over max_size time out"""
+    pool, made = make_pool(min_size=1, max_size=2, acquire_timeout=0.05)
+    with pool.connection() as first:
+        with pool.connection() as second:
+            assert (first.number, second.number) == (0, 1)
+            with pytest.raises(PoolTimeout):
+                pool.acquire()
+    with pool.connection() as again:
+        assert again in (first, second)
+    stats = pool.stats()
+    assert (stats["created"], stats["acquired"], stats["timeouts"], stats["in_use"], stats["idle"]) == (2, 3, 1, 0, 2)
+
+def test_waiters_get_released_connections():
+    """A caller waiting on a full pool gets the next connection released"""
+    pool, made = make_pool(min_size=0, max_size=1, acquire_timeout=5)
+    conn = pool.acquire()
+    threading.Timer(0.05, pool.release, [conn]).start()
+    assert pool.acquire() is conn
+    assert pool.stats()["max_wait_ms"] >= 40
+
+def test_broken_connections_are_replaced():
+    """Closed connections and ones failing the health check are not handed out"""
+    pool, made = make_pool(min_size=2, max_size=2, health_check_seconds=0)
+    made[0].broken = True
+    made[1].closed = True
+    with pool.connection() as conn:
+        assert conn.number == 2
+    assert pool.stats()["health_check_failures"] == 2
+    assert pool.stats()["size"] == 1
+
+def test_async_connections_do_not_block_the_loop():
+    """Handlers waiting for a connection leave the event loop free"""
+    pool, made = make_pool(min_size=0, max_size=1)
+
+    async def main():
+        ticks = []
+        async def hold():
+            async with pool.connection_async() as conn:
+                await asyncio.sleep(0.05)
+                return conn.number
+        async def tick():
+            for _ in range(3):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+        results = await asyncio.gather(hold(), hold(), tick(), pool.run(lambda conn: conn.number))
+        return results, ticks
+
+    results, ticks = asyncio.run(main())
+    assert results[:2] == [0, 0] and results[3] == 0
+    assert len(ticks) == 3 and len(made) == 1
+
+def test_cancelled_async_acquire_returns_its_connection():
+    """A handler cancelled while waiting for a connection doesn't leak the one its thread gets"""
+    pool, made = make_pool(min_size=0, max_size=1, acquire_timeout=5)
+
+    async def main():
+        held = pool.acquire()
+        async def wait():
+            async with pool.connection_async():
+                pass
+        waiter = asyncio.ensure_future(wait())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        pool.release(held)
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        for _ in range(100):
+            if pool.stats()["in_use"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        async with pool.connection_async(timeout=0.5) as conn:
+            return conn
+
+    assert asyncio.run(main()) is made[0]
+    assert pool.stats()["in_use"] == 0 and pool.stats()["timeouts"] == 0
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Tests for ingestion helpers (no network access required)
+"""
+
+import sys
+import os
+import time
+import threading
+import contextlib
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import ingest
+import ingest_jobs
+from markdown_chunks import chunk_markdown, strip_mdx
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+        self.text = ""
+
+    def json(self):
+        return {"data": self._data}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ingest.requests.HTTPError(str(self.status_code))
+
+class FakeSession:
+    """Answers embedding requests with [index-of-text] vectors, in reversed order"""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        self.calls.append(json["input"])
+        if self.failures:
+            self.failures -= 1
+            return FakeResponse(429, headers={"Retry-After": "0"})
+        data = [{"index": i, "embedding": [float(text.split()[-1])]} for i, text in enumerate(json["input"])]
+        return FakeResponse(200, list(reversed(data)))
+
+def with_fake_session(monkeypatch, session):
+    monkeypatch.setattr(ingest, "http_session", session)
+    monkeypatch.setattr(ingest, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(ingest, "get_cache", lambda: None)
+
+def test_make_batches_respects_size_and_tokens():
+    """Batches never exceed the count limit or the token budget"""
+    texts = ["word " * 40] * 10  # ~51 estimated tokens each
+    batches = ingest.make_batches(texts, batch_size=4, max_tokens=120)
+    assert [len(b) for b in batches] == [2, 2, 2, 2, 2]
+    assert [i for b in batches for i in b] == list(range(10))
+
+    batches = ingest.make_batches(texts, batch_size=3, max_tokens=10_000)
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+
+def test_oversized_text_gets_its_own_batch():
+    """A text above the token budget is still sent, alone"""
+    batches = ingest.make_batches(["short", "x" * 10_000, "short"], batch_size=10, max_tokens=100)
+    assert batches == [[0], [1], [2]]
+
+def test_embeddings_batch_preserves_order(monkeypatch):
+    """Results map back to inputs by index even when the API reorders them"""
+    session = FakeSession()
+    with_fake_session(monkeypatch, session)
+    texts = [f"chunk {i}" for i in range(7)]
+    embeddings = ingest.get_embeddings_batch(texts, batch_size=3, max_tokens=10_000)
+    assert embeddings == [[float(i)] for i in range(7)]
+    assert len(session.calls) == 3
+
+def test_embeddings_retry_on_rate_limit(monkeypatch):
+    """429 responses are retried instead of failing the ingest"""
+    session = FakeSession(failures=2)
+    with_fake_session(monkeypatch, session)
+    assert ingest.get_embeddings_batch(["chunk 5"]) == [[5.0]]
+    assert len(session.calls) == 3
+
+def test_plan_incremental_classifies_chunks():
+    """Only changed text is re-embedded; metadata-only changes and deletions are detected"""
+    def doc(doc_id, text, **metadata):
+        return {'id': doc_id, 'text': text, 'metadata': {'section': 'S', **metadata}}
+
+    before = [doc('a', 'alpha'), doc('b', 'beta'), doc('c', 'gamma'), doc('d', 'delta')]
+    manifest_chunks = {d['id']: ingest.manifest_entry(d) for d in before}
+    after = [doc('a', 'alpha'), doc('b', 'beta v2'), doc('c', 'gamma', section='New'), doc('e', 'epsilon')]
+
+    to_embed, to_update_payload, stale_ids = ingest.plan_incremental(manifest_chunks, after)
+    assert [d['id'] for d in to_embed] == ['b', 'e']
+    assert [d['id'] for d in to_update_payload] == ['c']
+    assert stale_ids == ['d']
+
+def run_fake_job(monkeypatch, fake_ingest, recorded=None):
+    """Start an ingest job with fake_ingest as ingest_documents and wait for it"""
+    monkeypatch.setattr(ingest_jobs, "_jobs", {})
+    monkeypatch.setattr(ingest_jobs, "_running", None)
+    monkeypatch.setattr(ingest_jobs, "INGEST_JOB_PROGRESS_SECONDS", 0)
+    monkeypatch.setattr(ingest_jobs.ingest, "ingest_documents", fake_ingest)
+    if recorded is not None:
+        def fake_execute(sql, params=(), fetch=False, before=()):
+            recorded.extend(before)
+            recorded.append((sql, params))
+            return [{"id": 7}] if sql.startswith("INSERT") else []
+        monkeypatch.setattr(ingest_jobs, "_execute", fake_execute)
+    job = ingest_jobs.start_job({"incremental": True})
+    deadline = time.monotonic() + 5
+    while ingest_jobs.get_job(job["id"])["status"] == "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+def test_ingest_job_records_progress(monkeypatch):
+    """Progress snapshots and the final throughput are written to ingest_jobs"""
+    def fake_ingest(on_progress=None, incremental=False):
+        assert incremental
+        on_progress({"chunks_indexed": 10, "chunks_per_second": 5.0, "embeddings_per_second": 4.0, "queue": 1})
+        return {"chunks_indexed": 20, "chunks_embedded": 20, "chunks_per_second": 6.5, "embeddings_per_second": 6.5}
+
+    recorded = []
+    job = run_fake_job(monkeypatch, fake_ingest, recorded)
+    assert job["id"] == 7 and job["status"] == "running"
+    final = ingest_jobs.get_job(7)
+    assert (final["status"], final["chunks_indexed"], final["chunks_per_second"]) == ("completed", 20, 6.5)
+    updates = [(sql, params) for sql, params in recorded if sql.startswith("UPDATE") and "WHERE id" in sql]
+    assert updates[0][1] == (10, 5.0, 4.0, 7)
+    assert "finished_at = NOW()" in updates[-1][0] and updates[-1][1][0] == "completed"
+
+def test_ingest_job_failures_are_reported(monkeypatch):
+    """Errors end the job as failed, with the message; a new job can start afterwards"""
+    monkeypatch.setattr(ingest_jobs.db, "DATABASE_URL", None)
+    def fake_ingest(on_progress=None, incremental=False):
+        raise RuntimeError("Qdrant unavailable")
+
+    job = run_fake_job(monkeypatch, fake_ingest)
+    assert job["id"] < 0 and not job["persisted"]
+    final = ingest_jobs.get_job(job["id"])
+    assert final["status"] == "failed" and final["error_message"] == "RuntimeError: Qdrant unavailable"
+    assert ingest_jobs._running is None
+
+def test_only_one_ingest_job_runs_at_a_time(monkeypatch):
+    """Starting a job while one is running, here or in another worker, is refused"""
+    monkeypatch.setattr(ingest_jobs, "_running", 3)
+    assert ingest_jobs.start_job({}) is None
+
+    claims = []
+    def fake_execute(sql, params=(), fetch=False, before=()):
+        claims.append([statement[0] for statement in before] + [sql])
+        # The unique index on running rows turned the insert into a no-op
+        return []
+    monkeypatch.setattr(ingest_jobs, "_running", None)
+    monkeypatch.setattr(ingest_jobs, "_execute", fake_execute)
+    assert ingest_jobs.start_job({}) is None
+    assert ingest_jobs._running is None
+    assert claims[0][0].startswith("UPDATE ingest_jobs SET status = 'failed'")
+    assert "ON CONFLICT DO NOTHING" in claims[0][1]
+
+def test_schema_setup_is_retried_until_it_succeeds(monkeypatch):
+    """A failed db.init_db (it reports errors instead of raising) is tried again on the next statement"""
+    results = [False, True]
+    monkeypatch.setattr(ingest_jobs.db, "DATABASE_URL", "postgresql://test")
+    monkeypatch.setattr(ingest_jobs.db, "init_db", lambda: results.pop(0))
+    monkeypatch.setattr(ingest_jobs.db, "db_connection", lambda: contextlib.nullcontext(None))
+    monkeypatch.setattr(ingest_jobs, "_schema_ready", False)
+    ingest_jobs._execute("SELECT 1")
+    assert not ingest_jobs._schema_ready
+    ingest_jobs._execute("SELECT 1")
+    assert ingest_jobs._schema_ready and results == []
+
+def test_list_jobs_sorts_recorded_and_local_jobs_by_start_time(monkeypatch):
+    """Rows from the database and jobs kept in memory are ordered by one timestamp"""
+    now = time.time()
+    rows = [{"id": 2, "status": "completed", "started_at": "2026-01-01 00:00:00", "started_epoch": Decimal(now - 60)},
+            {"id": 1, "status": "failed", "started_at": "2026-01-01 00:00:00", "started_epoch": Decimal(now - 7200)}]
+    monkeypatch.setattr(ingest_jobs, "_execute", lambda sql, params=(), fetch=False, before=(): rows)
+    monkeypatch.setattr(ingest_jobs, "_jobs", {-1: {"id": -1, "status": "running", "started_at": "x", "started_epoch": now - 600}})
+    assert [job["id"] for job in ingest_jobs.list_jobs()] == [2, -1, 1]
+
+CHAPTER = """---
+title: Isaac
+---
+# Isaac Sim
+
+Intro to the simulator.
+
+## Setup
+
+""" + "Install the simulator and its extensions before the first run. " * 12 + """
+
+```python
+import omni
+""" + "app.update()\n" * 40 + """```
+
+## Sensors
+
+| Sensor | Rate |
+|--------|------|
+""" + "| Camera | 30 Hz |\n" * 60
+
+def test_chunks_follow_headings_and_keep_blocks_whole():
+    """Chunks stay under their headings, fit the budget, and never cut a code block or table row"""
+    chunks = chunk_markdown(CHAPTER, max_tokens=120, min_tokens=30, block_max_tokens=200)
+    assert chunks[0]["heading_path"] == ["Isaac Sim", "Setup"]
+    assert chunks[0]["text"].startswith("# Isaac Sim\n\nIntro to the simulator.\n\n## Setup")
+    assert all(chunk["tokens"] <= 200 for chunk in chunks)
+    code = [chunk["text"] for chunk in chunks if "import omni" in chunk["text"]]
+    assert len(code) == 1 and code[0].startswith("```python") and code[0].endswith("```")
+    tables = [chunk for chunk in chunks if chunk["section"] == "Sensors"]
+    assert len(tables) > 1
+    for chunk in tables:
+        assert chunk["heading_path"] == ["Isaac Sim", "Sensors"]
+        assert "| Sensor | Rate |\n|--------|------|" in chunk["text"]
+        assert all(line.endswith("|") for line in chunk["text"].splitlines()[-3:])
+
+def test_chunk_ids_survive_inserted_sections(tmp_path):
+    """Adding a section keeps the other chunks' ids, so only the new chunk is embedded"""
+    path = tmp_path / "doc.md"
+    body = "Sensors publish on their own topics. " * 15
+    sections = [f"# Doc\n\n## Alpha\n\n{body}", f"## Gamma\n\n{body}", f"## Delta\n\n{body}"]
+    path.write_text("\n\n".join(sections), encoding="utf-8")
+    before = {doc["text"]: doc["id"] for doc in ingest.process_markdown_file(str(path))}
+    path.write_text("\n\n".join(sections[:1] + [f"## Beta\n\n{body}"] + sections[1:]), encoding="utf-8")
+    after = {doc["text"]: doc["id"] for doc in ingest.process_markdown_file(str(path))}
+    assert len(before) == 3 and len(set(before.values())) == 3
+    assert all(after[text] == doc_id for text, doc_id in before.items())
+
+def test_discover_docs_recurses_with_include_and_exclude(tmp_path):
+    """.md and .mdx docs are found at any depth; partials, hidden and excluded paths are not"""
+    for rel in ["intro.md", "module-01-ros2/index.md", "tutorial-basics/features.mdx", "tutorial-basics/_partial.mdx",
+                ".cache/page.md", "module-01-ros2/img/diagram.png", "drafts/wip.md"]:
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_text("# Doc\n", encoding="utf-8")
+    found = ingest.discover_docs(str(tmp_path), exclude=ingest.INGEST_EXCLUDE + ["drafts/*"])
+    assert [os.path.relpath(path, tmp_path).replace(os.sep, "/") for path in found] == [
+        "intro.md", "module-01-ros2/index.md", "tutorial-basics/features.mdx"
+    ]
+
+def test_strip_mdx_keeps_text_and_code():
+    """Imports, JSX tags, comments and admonition fences go; their text and code blocks stay"""
+    mdx = ("import Tabs from '@theme/Tabs';\n\n# Title {/* note */}\n\n<Tabs>\n<TabItem value=\"py\">\n"
+           "Run `<Node>` with <b>care</b>.\n</TabItem>\n</Tabs>\n\n:::tip Remember\nSave often.\n:::\n\n"
+           "```jsx\n<Tabs />\n```\n")
+    stripped = strip_mdx(mdx)
+    assert "import" not in stripped and "<b>" not in stripped and "note" not in stripped
+    assert "Run `<Node>` with care." in stripped and "Remember\nSave often." in stripped
+    assert "```jsx\n<Tabs />\n```" in stripped
+
+def test_plan_files_skips_unchanged_docs(tmp_path):
+    """Docs with the same size and mtime, or only a new mtime, are not parsed again"""
+    paths = [str(tmp_path / name) for name in ("same.md", "touched.md", "edited.md", "new.md")]
+    for path in paths:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("# Doc\n\nBody text.\n")
+    previous = {filepath: entry for filepath, entry, _ in ingest.parse_files(paths[:3], workers=1)}
+    os.utime(paths[1], ns=(1, 1))
+    with open(paths[2], "w", encoding="utf-8") as f:
+        f.write("# Doc\n\nBody text!\n")
+    os.utime(paths[2], ns=(2, 2))
+
+    to_parse, unchanged = ingest.plan_files(paths, previous)
+    assert to_parse == [paths[2], paths[3]]
+    assert sorted(unchanged) == [paths[0], paths[1]]
+    assert unchanged[paths[1]]["mtime_ns"] == 1 and unchanged[paths[1]]["chunks"] == previous[paths[1]]["chunks"]
+
+def test_parse_workers_are_spawned_from_job_threads(tmp_path):
+    """The process pool works from a background thread (as in API jobs) and keeps file order"""
+    paths = [str(tmp_path / f"doc{i}.md") for i in range(4)]
+    for i, path in enumerate(paths):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# Doc {i}\n\n" + "Body text about robots. " * 20 + "\n")
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(ingest.parse_files(paths, workers=2)))
+    worker.start()
+    worker.join(60)
+    assert [filepath for filepath, _, _ in results] == paths
+    assert results == list(ingest.parse_files(paths, workers=1))
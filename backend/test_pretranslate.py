@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for markdown segmentation and the pre-translation job (no network access required)
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pretranslate
+from markdown_segments import segment_markdown, translatable_texts, join_segments, protect_markdown, restore_markdown
+
+DOC = """---
+title: ROS 2
+---
+# Module 1
+
+## Overview
+This module covers **ROS 2**
+across two lines.
+
+- Nodes and topics
+- Services
+
+```python
+import rclpy  # not prose
+```
+
+| Term | Meaning |
+|------|---------|
+| Node | A process |
+"""
+
+def test_segments_round_trip_and_skip_code():
+    """Joining the segments gives the document back; only prose is translatable"""
+    segments = segment_markdown(DOC)
+    assert "".join(text for _, text in segments) == DOC
+    assert translatable_texts(segments) == [
+        "Module 1", "Overview", "This module covers **ROS 2**\nacross two lines.",
+        "Nodes and topics", "Services", "Term", "Meaning", "Node", "A process"
+    ]
+    upper = {text: text.upper() for text in translatable_texts(segments)}
+    joined = join_segments(segments, upper)
+    assert "title: ROS 2" in joined and "import rclpy  # not prose" in joined
+    assert "## OVERVIEW" in joined and "| NODE | A PROCESS |" in joined
+
+def test_protect_markdown_round_trip():
+    """Protected spans come back verbatim, in any order, but only if none is lost"""
+    text = "Use `ros2 launch` ([guide](https://docs.ros.org)) ![arm](arm.png) {{0}}\n~~~xml\n<robot/>\n~~~\n"
+    protected, placeholders = protect_markdown(text)
+    assert protected == "Use {{0}} ([guide]{{1}}) {{2}} {{3}}\n{{4}}\n"
+    assert restore_markdown(protected, placeholders) == text
+    assert restore_markdown("{{1}} {{0}} {{2}} {{3}} {{4}}", placeholders).startswith("(https://docs.ros.org) `ros2 launch`")
+    assert restore_markdown("{{0}} {{1}} {{2}} {{3}}", placeholders) is None
+    assert restore_markdown("{{0}} {{0}} {{1}} {{2}} {{3}} {{4}}", placeholders) is None
+
+def test_pretranslate_writes_artifacts_and_resumes(tmp_path, monkeypatch):
+    """Failed docs are retried on the next run, finished ones are skipped"""
+    docs_dir, output_dir = tmp_path / "docs", tmp_path / "translated"
+    (docs_dir / "module-01").mkdir(parents=True)
+    (docs_dir / "module-01" / "index.md").write_text("# Hello\n\nWorld\n", encoding="utf-8")
+    (docs_dir / "intro.md").write_text("# Broken\n", encoding="utf-8")
+    calls = []
+
+    async def fake_translate(texts, target_lang, source_lang="en"):
+        calls.extend(texts)
+        return [{"success": text != "Broken", "translation": f"[{target_lang}] {text}"} for text in texts]
+
+    monkeypatch.setattr(pretranslate, "translate_multiple_texts", fake_translate)
+    run = lambda: asyncio.run(pretranslate.pretranslate(["ur"], docs_dir=str(docs_dir), output_dir=str(output_dir)))
+
+    assert run() == {"translated": 1, "skipped": 0, "failed": 1}
+    artifact = pretranslate.find_translated_doc("module-01", "ur", str(output_dir))
+    with open(artifact, encoding="utf-8") as f:
+        assert f.read() == "# [ur] Hello\n\n[ur] World\n"
+    assert pretranslate.find_translated_doc("intro", "ur", str(output_dir)) is None
+    assert pretranslate.find_translated_doc("../docs/intro", "ur", str(output_dir)) is None
+
+    calls.clear()
+    assert run() == {"translated": 0, "skipped": 1, "failed": 1}
+    assert calls == ["Broken"]
+
+def test_translated_doc_is_served_without_frontmatter_or_mdx(tmp_path):
+    """The API gets plain markdown: frontmatter, imports and JSX tags go, code blocks stay"""
+    (tmp_path / "ur").mkdir()
+    (tmp_path / "ur" / "intro.mdx").write_text(
+        "---\ntitle: تعارف\n---\nimport Tabs from '@theme/Tabs';\n\n# تعارف\n\n<Tabs>\n**اہم** متن\n</Tabs>\n\n```python\n<Tabs />\n```\n",
+        encoding="utf-8"
+    )
+    content = pretranslate.load_translated_doc("intro", "ur", str(tmp_path))
+    assert content.startswith("# تعارف")
+    assert "title:" not in content and "import" not in content and "<Tabs>" not in content
+    assert "**اہم** متن" in content and "```python\n<Tabs />\n```" in content
+    assert pretranslate.load_translated_doc("missing", "ur", str(tmp_path)) is None
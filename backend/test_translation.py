@@ -5,19 +5,30 @@ Test script for translation functionality
 
 import sys
 import os
+import re
+import asyncio
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from translation import translate_text_enhanced, get_supported_languages, get_cache_stats
 
+def with_fake_openrouter(monkeypatch, completion):
+    """Route translations to a fake chat completion, with an empty cache and translation memory"""
+    import translation
+    from translation_memory import TranslationMemory
+    monkeypatch.setattr(translation, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(translation.openrouter, "chat_completion", completion)
+    monkeypatch.setattr(translation, "TRANSLATION_MEMORY", TranslationMemory())
+    translation.TRANSLATION_CACHE.clear()
+
 def test_basic_translation():
     """Test basic English to Urdu translation"""
     print("Testing basic translation...")
     
-    result = translate_text_enhanced(
+    result = asyncio.run(translate_text_enhanced(
         "Hello, how are you today?", 
         "ur", 
         "en"
-    )
+    ))
     
     print(f"Success: {result['success']}")
     print(f"Translation: {result['translation']}")
@@ -30,11 +41,11 @@ def test_technical_translation():
     """Test technical content translation"""
     print("Testing technical translation...")
     
-    result = translate_text_enhanced(
+    result = asyncio.run(translate_text_enhanced(
         "ROS is a middleware for robotics development", 
         "ur", 
         "en"
-    )
+    ))
     
     print(f"Success: {result['success']}")
     print(f"Translation: {result['translation']}")
@@ -66,15 +77,368 @@ def test_caching():
     text = "This is a test message for caching"
     
     # First translation
-    result1 = translate_text_enhanced(text, "ur", "en")
+    result1 = asyncio.run(translate_text_enhanced(text, "ur", "en"))
     print(f"First translation - Cached: {result1['cached']}")
     
     # Second translation (should be cached)
-    result2 = translate_text_enhanced(text, "ur", "en")
+    result2 = asyncio.run(translate_text_enhanced(text, "ur", "en"))
     print(f"Second translation - Cached: {result2['cached']}")
     
     print("-" * 50)
 
+def test_batch_translation_is_concurrent_deduplicated_and_ordered(monkeypatch):
+    """Duplicates are translated once, calls overlap up to the cap, order is kept"""
+    import translation
+    calls = []
+    in_flight = [0, 0]
+
+    async def fake_translate(text, target_lang, source_lang="en"):
+        calls.append(text)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return {"success": True, "translation": text.upper()}
+
+    monkeypatch.setattr(translation, "translate_text_enhanced", fake_translate)
+    texts = ["a", "b", "a", "c", "d", "b", "e"]
+    results = asyncio.run(translation.translate_multiple_texts(texts, "ur", concurrency=3, pack=False))
+    assert [r["translation"] for r in results] == ["A", "B", "A", "C", "D", "B", "E"]
+    assert sorted(calls) == ["a", "b", "c", "d", "e"]
+    assert in_flight[1] == 3
+
+def test_packed_batch_translation(monkeypatch):
+    """Short texts share one request; a response with the wrong segment count is retried per text"""
+    import translation
+    requests = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        body = messages[-1]["content"].split("\n\n", 1)[1]
+        requests.append(body)
+        if "<<<" not in body:
+            return f"single {body}"
+        segments = re.findall(r"<<<(\d+)>>>\n(.*)", body)
+        if any(text == "drop me" for _, text in segments):
+            segments = segments[:-1]
+        return "\n".join(f"<<<{n}>>>\nT({text})" for n, text in segments)
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+
+    texts = ["Heading", "A list item", "Heading", "Another item"]
+    results = asyncio.run(translation.translate_multiple_texts(texts, "ur", pack=True))
+    assert [r["translation"] for r in results] == ["T(Heading)", "T(A list item)", "T(Heading)", "T(Another item)"]
+    assert len(requests) == 1
+
+    requests.clear()
+    results = asyncio.run(translation.translate_multiple_texts(["keep me", "drop me"], "hi", pack=True))
+    assert [r["translation"] for r in results] == ["single keep me", "single drop me"]
+    assert len(requests) == 3
+    translation.TRANSLATION_CACHE.clear()
+
+def test_packing_skips_segments_cached_by_other_workers(monkeypatch, tmp_path):
+    """A segment another worker cached in the shared L2 is not packed and translated again"""
+    import translation
+    from cache import TTLCache, SQLiteStore
+    sent = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        body = messages[-1]["content"].split("\n\n", 1)[1]
+        sent.append(body)
+        return "\n".join(f"<<<{n}>>>\nT({text})" for n, text in re.findall(r"<<<(\d+)>>>\n(.*)", body))
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+    path = str(tmp_path / "cache.db")
+    monkeypatch.setattr(translation, "TRANSLATION_CACHE", TTLCache(store=SQLiteStore(path, "translations")))
+    other_worker = TTLCache(store=SQLiteStore(path, "translations"))
+    other_worker.set(translation.get_cache_key("Heading", "ur"), {"translation": "cached heading"})
+
+    translations = asyncio.run(translation.translate_segments(["Heading", "A list item", "Another item"], "ur", pack=True))
+    assert translations == {"Heading": "cached heading", "A list item": "T(A list item)", "Another item": "T(Another item)"}
+    assert sent == ["<<<1>>>\nA list item\n<<<2>>>\nAnother item"]
+
+def test_parse_packed_translation_validates_markers():
+    """Missing, reordered or empty segments are rejected"""
+    from translation import parse_packed_translation
+    assert parse_packed_translation("<<<1>>>\nuno\n<<<2>>>\ndos", 2) == ["uno", "dos"]
+    assert parse_packed_translation("<<<1>>>\nuno", 2) is None
+    assert parse_packed_translation("<<<2>>>\ndos\n<<<1>>>\nuno", 2) is None
+    assert parse_packed_translation("<<<1>>>\n\n<<<2>>>\ndos", 2) is None
+    assert parse_packed_translation("Sure!\n<<<1>>>\nuno\n<<<2>>>\ndos", 2) is None
+
+def test_code_and_links_are_not_sent_for_translation(monkeypatch):
+    """Code, URLs and images travel as placeholders; a lost placeholder falls back to the full text"""
+    import translation
+    sent = []
+    drop_placeholders = [False]
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        body = messages[-1]["content"].split("\n\n", 1)[1]
+        sent.append(body)
+        if drop_placeholders[0]:
+            return re.sub(r"\{\{\d+\}\}", "", body).upper()
+        return re.sub(r"[a-z]+(?![^{]*\}\})", lambda m: m.group(0).upper(), body)
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+
+    text = "Call `rclpy.init()` first, see https://docs.ros.org.\n\n```python\nimport rclpy\n```\n"
+    result = asyncio.run(translation.translate_text_enhanced(text, "ur"))
+    assert result["translation"] == "CALL `rclpy.init()` FIRST, SEE https://docs.ros.org.\n\n```python\nimport rclpy\n```\n"
+    assert "rclpy" not in sent[0] and "docs.ros.org" not in sent[0]
+
+    sent.clear()
+    drop_placeholders[0] = True
+    result = asyncio.run(translation.translate_technical_content("Run `ros2 run` now", "ur", "robotics"))
+    assert result["translation"] == "RUN `ROS2 RUN` NOW"
+    assert sent == ["Run {{0}} now", "Run `ros2 run` now"]
+    translation.TRANSLATION_CACHE.clear()
+
+def test_translation_memory_reuses_unchanged_segments(monkeypatch):
+    """Editing one paragraph of a page only sends that paragraph for translation"""
+    import translation
+    sent = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        body = messages[-1]["content"].split("\n\n", 1)[1]
+        sent.append(body)
+        return body.upper()
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+    page = "# Nodes\n\nA node is a process that performs computation.\n\nTopics carry messages between nodes.\n"
+    asyncio.run(translation.translate_text_enhanced(page, "hi"))
+
+    sent.clear()
+    edited = page.replace("Topics carry", "Topics  carry") + "\nServices answer requests.\n"
+    result = asyncio.run(translation.translate_text_enhanced(edited, "hi"))
+    assert sent == ["Services answer requests."]
+    assert result["translation"] == "# NODES\n\nA NODE IS A PROCESS THAT PERFORMS COMPUTATION.\n\nTOPICS CARRY MESSAGES BETWEEN NODES.\n\nSERVICES ANSWER REQUESTS.\n"
+    translation.TRANSLATION_CACHE.clear()
+
+def test_translation_memory_only_reuses_unchanged_segments():
+    """Whitespace changes reuse a translation; edits, however small, only get a near-duplicate as reference"""
+    from translation_memory import TranslationMemory
+    memory = TranslationMemory(threshold=0.9)
+    source = "The robot can transfer the payload without stopping, using `ros2_control` for actuation."
+    memory.add(source, "T1", "ur")
+    assert memory.lookup("The robot  can transfer the payload without stopping,\nusing `ros2_control` for actuation.", "ur") == "T1"
+    assert memory.lookup(source.replace("can transfer", "cannot transfer"), "ur") is None
+    assert memory.lookup(source.replace("without", "with"), "ur") is None
+    assert memory.lookup(source.lower(), "ur") is None
+    assert memory.reference(source.replace("can transfer", "cannot transfer"), "ur") == (source, "T1")
+    assert memory.reference(source.lower(), "ur") == (source, "T1")
+    assert memory.reference(source, "hi") is None
+    assert memory.reference("An entirely different sentence about simulation.", "ur") is None
+    stats = memory.stats()
+    assert (stats["exact_hits"], stats["misses"], stats["references"]) == (1, 3, 2)
+
+def test_edited_segments_are_translated_with_a_reference(monkeypatch):
+    """A near-duplicate's translation is sent as a reference, not returned as the edited segment's translation"""
+    import translation
+    sent = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        sent.append(messages[-1]["content"])
+        return messages[-1]["content"].rsplit("\n\n", 1)[1].upper()
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+    original = "Each joint controller can transfer commands to the motors without delay."
+    asyncio.run(translation.translate_text_enhanced(original, "ur"))
+
+    sent.clear()
+    edited = original.replace("can transfer", "cannot transfer")
+    result = asyncio.run(translation.translate_text_enhanced(edited, "ur"))
+    assert result["translation"] == edited.upper()
+    assert len(sent) == 1
+    assert f"Earlier version:\n\n{original}\n\nIts translation:\n\n{original.upper()}" in sent[0]
+    translation.TRANSLATION_CACHE.clear()
+
+def test_technical_and_context_translations_are_cached_and_coalesced(monkeypatch):
+    """50 identical concurrent requests make one upstream call; domain and context are part of the key"""
+    import translation
+    calls = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        calls.append(messages[0]["content"])
+        await asyncio.sleep(0.01)
+        return "translated"
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+
+    async def burst():
+        return await asyncio.gather(*(
+            translation.translate_technical_content("Publish on a topic", "ur", "robotics") for _ in range(50)
+        ))
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1 and all(r["translation"] == "translated" for r in results)
+    again = asyncio.run(translation.translate_technical_content("Publish on a topic", "ur", "robotics"))
+    assert again["cached"] and len(calls) == 1
+
+    asyncio.run(translation.translate_technical_content("Publish on a topic", "ur", "ai"))
+    asyncio.run(translation.translate_with_context("Publish on a topic", "ur", "ROS 2 chapter"))
+    asyncio.run(translation.translate_with_context("Publish on a topic", "ur", "ROS 2 chapter"))
+    asyncio.run(translation.translate_with_context("Publish on a topic", "ur", "Gazebo chapter"))
+    assert len(calls) == 4
+    translation.TRANSLATION_CACHE.clear()
+
+def test_concurrent_identical_prompts_share_one_call(monkeypatch):
+    """Duplicate translate and personalize calls in flight await the first; metrics count both kinds"""
+    import translation
+    import rag
+    calls = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        calls.append(messages[-1]["content"])
+        await asyncio.sleep(0.01)
+        return "done"
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+    monkeypatch.setattr(rag, "OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(translation, "TRANSLATION_FLIGHTS", translation.SingleFlight("translation"))
+    monkeypatch.setattr(rag, "PERSONALIZE_FLIGHTS", rag.SingleFlight("personalize"))
+    monkeypatch.setattr(rag, "PERSONALIZE_CACHE", rag.TTLCache())
+
+    async def burst():
+        return await asyncio.gather(
+            *(translation.translate_with_openrouter("Nodes  talk over topics", "ur") for _ in range(10)),
+            *(translation.translate_with_openrouter("Nodes talk over topics", "ur") for _ in range(10)),
+            *(rag.personalize_text("Nodes talk over topics", "Beginner") for _ in range(20))
+        )
+
+    assert set(asyncio.run(burst())) == {"done"}
+    # Texts differing in whitespace are separate prompts
+    assert len(calls) == 3
+    assert translation.TRANSLATION_FLIGHTS.stats()["originated"] == 2
+    assert translation.TRANSLATION_FLIGHTS.stats()["coalesced"] == 18
+    assert rag.PERSONALIZE_FLIGHTS.stats()["coalesced"] == 19
+    assert len(translation.TRANSLATION_FLIGHTS) == 0
+    translation.TRANSLATION_CACHE.clear()
+
+def test_concurrent_multi_paragraph_translations_share_one_call(monkeypatch):
+    """50 identical page translations in flight, or batches of the same pages, make one packed call"""
+    import re
+    import translation
+    calls = []
+
+    async def fake_completion(messages, model, timeout=60, title=None):
+        calls.append(messages[-1]["content"])
+        await asyncio.sleep(0.01)
+        return re.sub(r"(<<<\d+>>>\n)", r"\1[ur] ", messages[-1]["content"].split("\n\n", 1)[1])
+
+    with_fake_openrouter(monkeypatch, fake_completion)
+    monkeypatch.setattr(translation, "TRANSLATION_FLIGHTS", translation.SingleFlight("translation"))
+    page = "# Nodes\n\nNodes publish messages.\n\nServices answer requests."
+
+    async def burst():
+        return await asyncio.gather(*(translate_text_enhanced(page, "ur") for _ in range(50)))
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert {r["translation"] for r in results} == {"# [ur] Nodes\n\n[ur] Nodes publish messages.\n\n[ur] Services answer requests."}
+    assert translation.TRANSLATION_FLIGHTS.stats()["coalesced"] == 49
+
+    calls.clear()
+    with_fake_openrouter(monkeypatch, fake_completion)
+    other = "# Topics\n\nTopics carry data.\n\nSubscribers read them."
+
+    async def batches():
+        return await asyncio.gather(*(
+            translation.translate_multiple_texts([page, other], "ur", concurrency=2) for _ in range(10)
+        ))
+
+    results = asyncio.run(batches())
+    assert len(calls) == 1
+    assert all(r["success"] for batch in results for r in batch)
+    translation.TRANSLATION_CACHE.clear()
+
+def test_prompt_key_keeps_line_breaks_and_indentation():
+    """Prompts that differ only in list breaks or code indentation are not coalesced"""
+    from singleflight import prompt_key
+
+    def key(text):
+        return prompt_key("model", [{"role": "user", "content": text}])
+
+    assert key("- one\n- two") != key("- one - two")
+    assert key("if ok:\n    run()\nstop()") != key("if ok:\n    run()\n    stop()")
+    assert key("Nodes talk") == key("Nodes talk")
+    assert key("Nodes talk") != prompt_key("other-model", [{"role": "user", "content": "Nodes talk"}])
+
+def test_token_bucket_limits_rate():
+    """After the burst is spent, requests are spaced at the configured rate"""
+    from openrouter import TokenBucket
+
+    async def run():
+        bucket = TokenBucket(rate=50, burst=2)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(7):
+            await bucket.acquire()
+        return loop.time() - start
+
+    elapsed = asyncio.run(run())
+    assert 0.08 <= elapsed < 0.5  # 5 requests beyond the burst at 50/s
+
+def test_rate_limit_only_applies_to_fan_out(monkeypatch):
+    """Interactive requests skip the token bucket; tasks started in rate_limited() wait for it"""
+    import openrouter
+    bucket = openrouter.TokenBucket(rate=50, burst=1)
+    monkeypatch.setattr(openrouter, "_limiter", bucket)
+
+    async def run():
+        for _ in range(5):
+            await openrouter.wait_for_rate_limit()
+        assert bucket.waits == 0
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        with openrouter.rate_limited():
+            await asyncio.gather(*(openrouter.wait_for_rate_limit() for _ in range(5)))
+        return loop.time() - start
+
+    elapsed = asyncio.run(run())
+    assert bucket.waits == 4 and 0.06 <= elapsed < 0.5
+
+def test_stream_translation_protects_code_and_uses_memory(monkeypatch):
+    """Streamed translations keep code and URLs verbatim, reuse remembered segments and are cached"""
+    import translation
+    with_fake_openrouter(monkeypatch, None)
+    translation.TRANSLATION_MEMORY.add("Intro", "[ur] Intro", "ur")
+    prompts = []
+
+    async def fake_stream(messages, model, timeout=60, title=None):
+        content = messages[-1]["content"].rsplit("\n\n", 1)[-1]
+        prompts.append(content)
+        for word in f"  [ur] {content} \n".split(" "):
+            yield word + " "
+
+    monkeypatch.setattr(translation.openrouter, "stream_chat_completion", fake_stream)
+    text = "# Intro\n\nRun `ros2 run demo talker` from https://docs.ros.org now.\n\n```bash\nros2 topic list\n```\n"
+
+    async def run():
+        return [piece async for piece in translation.stream_translation(text, "ur")]
+
+    pieces = asyncio.run(run())
+    streamed = "".join(pieces)
+    assert streamed == ("# [ur] Intro\n\n[ur] Run `ros2 run demo talker` from https://docs.ros.org now.\n\n"
+                        "```bash\nros2 topic list\n```\n")
+    assert len(prompts) == 1 and "ros2" not in prompts[0] and "{{0}}" in prompts[0]
+    assert translation.TRANSLATION_MEMORY.lookup("Run `ros2 run demo talker` from https://docs.ros.org now.", "ur")
+    assert translation.TRANSLATION_CACHE.get(translation.get_cache_key(text, "ur"))["translation"] == streamed
+
+def test_stream_translation_streams_plain_segments(monkeypatch):
+    """A segment without code is yielded delta by delta, trimmed of surrounding whitespace"""
+    import translation
+    with_fake_openrouter(monkeypatch, None)
+
+    async def fake_stream(messages, model, timeout=60, title=None):
+        for delta in ["\n", "Nodes ", "talk", "  ", "\n"]:
+            yield delta
+
+    monkeypatch.setattr(translation.openrouter, "stream_chat_completion", fake_stream)
+
+    async def run():
+        return [piece async for piece in translation.stream_translation("Nodes talk", "ur")]
+
+    assert asyncio.run(run()) == ["Nodes", " talk"]
+
 if __name__ == "__main__":
     print("=" * 60)
     print("TRANSLATION FUNCTIONALITY TESTS")
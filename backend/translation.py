@@ -1,16 +1,47 @@
 import os
+import re
 import json
+import asyncio
 import hashlib
 from typing import Dict, Optional, List
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
 from dotenv import load_dotenv
+import openrouter
+from openrouter import OPENROUTER_API_KEY
+from cache import TTLCache, make_store
+from markdown_segments import protect_markdown, restore_markdown, has_prose, segment_markdown, translatable_texts, join_segments
+from translation_memory import TranslationMemory, TRANSLATION_MEMORY_PATH
+from singleflight import SingleFlight, prompt_key
 
 load_dotenv()
 
-# Translation cache
-TRANSLATION_CACHE = {}
-CACHE_EXPIRY_HOURS = 24
+# Translation cache: bounded in-process LRU with TTL eviction (L1), optionally
+# in front of a store shared by all workers (L2):
+#   CACHE_BACKEND=sqlite  WAL file at CACHE_PATH, shared by workers on one host
+#   CACHE_BACKEND=redis   Redis-compatible server at CACHE_REDIS_URL
+#   CACHE_BACKEND=memory  no shared tier
+# Setting only TRANSLATION_CACHE_PATH implies the sqlite backend.
+CACHE_EXPIRY_HOURS = float(os.getenv("TRANSLATION_CACHE_EXPIRY_HOURS", "24"))
+CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "20000"))
+CACHE_MAX_MB = float(os.getenv("TRANSLATION_CACHE_MAX_MB", "128"))
+CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", os.getenv("CACHE_PATH", "cache.db"))
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite" if os.getenv("TRANSLATION_CACHE_PATH") else "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+TRANSLATION_CACHE = TTLCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=CACHE_EXPIRY_HOURS * 3600,
+    store=make_store(CACHE_BACKEND, "translations", CACHE_PATH, CACHE_REDIS_URL)
+)
+
+# Segment-level translation memory (see translation_memory.py): texts are
+# translated paragraph by paragraph and only segments it has not seen are sent
+# to OpenRouter; an edited segment is sent with its old translation as a guide
+TRANSLATION_MEMORY = TranslationMemory(TRANSLATION_MEMORY_PATH or None)
+
+# Identical translation requests in flight at the same time share one upstream call
+TRANSLATION_FLIGHTS = SingleFlight("translation")
 
 # Supported languages
 SUPPORTED_LANGUAGES = {
@@ -26,9 +57,19 @@ SUPPORTED_LANGUAGES = {
     "pa": "Punjabi"
 }
 
+# Max translations in flight for one /rag/translate/batch request
+BATCH_CONCURRENCY = int(os.getenv("TRANSLATION_BATCH_CONCURRENCY", "8"))
+
+# Packing: short uncached texts in a batch are sent several per request, one
+# system prompt for all of them, each segment behind a numbered marker line.
+# A pack is capped by count and by estimated tokens; longer texts go alone.
+PACKING_ENABLED = os.getenv("TRANSLATION_PACKING", "true").lower() in ("1", "true", "yes")
+PACK_MAX_TOKENS = int(os.getenv("TRANSLATION_PACK_MAX_TOKENS", "1500"))
+PACK_MAX_SEGMENTS = int(os.getenv("TRANSLATION_PACK_MAX_SEGMENTS", "40"))
+PACK_SEGMENT_MAX_TOKENS = int(os.getenv("TRANSLATION_PACK_SEGMENT_MAX_TOKENS", "300"))
+PACK_MARKER = re.compile(r"^[ \t]*<<<(\d+)>>>[ \t]*$", re.MULTILINE)
+
 # OpenRouter API
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 DEFAULT_MODEL = os.getenv("OPENROUTER_MODEL", "meta-llama/llama-3.2-3b-instruct:free")
 
 def get_cache_key(text: str, target_lang: str) -> str:
@@ -36,21 +77,13 @@ def get_cache_key(text: str, target_lang: str) -> str:
     content = f"{text}_{target_lang}"
     return hashlib.md5(content.encode()).hexdigest()
 
-def is_cache_valid(cache_entry: Dict) -> bool:
-    """Check if cache entry is still valid"""
-    cached_time = datetime.fromisoformat(cache_entry.get("timestamp", "1970-01-01"))
-    return datetime.now() - cached_time < timedelta(hours=CACHE_EXPIRY_HOURS)
+def get_composite_cache_key(kind: str, text: str, target_lang: str, **params) -> str:
+    """Cache key for a translation variant whose prompt also depends on params (domain, context, ...)"""
+    content = json.dumps([kind, text, target_lang, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(content.encode()).hexdigest()
 
-def translate_with_openrouter(text: str, target_lang: str, source_lang: str = "en") -> Optional[str]:
-    """Translate text using OpenRouter API"""
-    if not OPENROUTER_API_KEY:
-        return None
-    
-    # Check cache first
-    cache_key = get_cache_key(text, target_lang)
-    if cache_key in TRANSLATION_CACHE and is_cache_valid(TRANSLATION_CACHE[cache_key]):
-        return TRANSLATION_CACHE[cache_key]["translation"]
-    
+def build_translation_messages(text: str, target_lang: str) -> list:
+    """Build the chat messages for a plain translation request"""
     # Language-specific prompts
     language_prompts = {
         "ur": "Translate the following English text to Urdu. Use proper Urdu script ( nastaliq style ). Maintain technical terms where appropriate. Keep the meaning and context intact.",
@@ -66,53 +99,219 @@ def translate_with_openrouter(text: str, target_lang: str, source_lang: str = "e
     
     system_prompt = language_prompts.get(target_lang, f"Translate the following text to {SUPPORTED_LANGUAGES.get(target_lang, target_lang)}.")
     
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://physical-ai-textbook.com",
-        "X-Title": "Physical AI Textbook Translator"
-    }
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": f"Text to translate:\n\n{text}"
+        }
+    ]
+
+PLACEHOLDER_INSTRUCTION = (
+    " Placeholders such as {{0}} stand for code, links and images: copy every placeholder "
+    "into the translation exactly once and unchanged."
+)
+
+async def complete_protected(text: str, build_messages, title: str, timeout: float = 30) -> str:
+    """
+    Run a translation completion with code blocks, inline code, URLs and images
+    swapped for placeholders, and restore them in the result. Text with no prose
+    outside those is returned as is. If the model drops or duplicates a
+    placeholder, the text is translated again unprotected.
+    build_messages(text) -> chat messages; raises like openrouter.chat_completion.
+    """
+    protected, placeholders = protect_markdown(text)
+    if placeholders:
+        if not has_prose(protected):
+            return text
+        messages = build_messages(protected)
+        messages[0]["content"] += PLACEHOLDER_INSTRUCTION
+        translation = await openrouter.chat_completion(messages, DEFAULT_MODEL, timeout=timeout, title=title)
+        restored = restore_markdown(translation.strip(), placeholders)
+        if restored is not None:
+            return restored
+        print(f"{title}: placeholders lost in translation, retrying unprotected")
+    translation = await openrouter.chat_completion(build_messages(text), DEFAULT_MODEL, timeout=timeout, title=title)
+    return translation.strip()
+
+async def cache_translation(cache_key: str, translation: str, source_lang: str, target_lang: str):
+    """Store a finished translation in the cache"""
+    await TRANSLATION_CACHE.set_async(cache_key, {
+        "translation": translation,
+        "timestamp": datetime.now().isoformat(),
+        "source_lang": source_lang,
+        "target_lang": target_lang
+    })
+
+REFERENCE_INSTRUCTION = (
+    " An earlier version of the text and its translation are given for reference: keep their "
+    "wording and terminology where the text is unchanged, and translate every difference faithfully."
+)
+
+def build_reference_messages(text: str, target_lang: str, reference_source: str, reference_translation: str) -> list:
+    """Build the chat messages for translating text given the translation of a near-duplicate"""
+    messages = build_translation_messages(text, target_lang)
+    messages[0]["content"] += REFERENCE_INSTRUCTION
+    messages[1]["content"] = (
+        f"Earlier version:\n\n{reference_source}\n\n"
+        f"Its translation:\n\n{reference_translation}\n\n"
+        + messages[1]["content"]
+    )
+    return messages
+
+async def translate_with_reference(text: str, target_lang: str, reference: tuple, source_lang: str = "en") -> Optional[str]:
+    """
+    Translate text like translate_with_openrouter, with reference = (source,
+    translation) of a near-duplicate from the translation memory in the prompt
+    """
+    if not OPENROUTER_API_KEY:
+        return None
     
-    payload = {
-        "model": DEFAULT_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": system_prompt
-            },
-            {
-                "role": "user",
-                "content": f"Text to translate:\n\n{text}"
-            }
-        ]
-    }
+    cache_key = get_cache_key(text, target_lang)
+    cached_entry = await TRANSLATION_CACHE.get_async(cache_key)
+    if cached_entry:
+        return cached_entry["translation"]
+    
+    async def translate_and_cache() -> str:
+        translation = await complete_protected(
+            text,
+            lambda content: build_reference_messages(content, target_lang, *reference),
+            title="Physical AI Textbook Translator"
+        )
+        await cache_translation(cache_key, translation, source_lang, target_lang)
+        return translation
     
     try:
-        response = requests.post(
-            f"{OPENROUTER_BASE_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
+        flight_key = prompt_key(DEFAULT_MODEL, build_reference_messages(text, target_lang, *reference))
+        return await TRANSLATION_FLIGHTS.do(flight_key, translate_and_cache)
+    except Exception as e:
+        print(f"Translation error: {e}")
+        return None
+
+async def translate_with_openrouter(text: str, target_lang: str, source_lang: str = "en") -> Optional[str]:
+    """Translate text using OpenRouter API"""
+    if not OPENROUTER_API_KEY:
+        return None
+    
+    # Check cache first
+    cache_key = get_cache_key(text, target_lang)
+    cached_entry = await TRANSLATION_CACHE.get_async(cache_key)
+    if cached_entry:
+        return cached_entry["translation"]
+    
+    async def translate_and_cache() -> str:
+        translation = await complete_protected(
+            text,
+            lambda content: build_translation_messages(content, target_lang),
+            title="Physical AI Textbook Translator"
         )
-        response.raise_for_status()
-        data = response.json()
-        translation = data["choices"][0]["message"]["content"].strip()
         
         # Cache the translation
-        TRANSLATION_CACHE[cache_key] = {
-            "translation": translation,
-            "timestamp": datetime.now().isoformat(),
-            "source_lang": source_lang,
-            "target_lang": target_lang
-        }
+        await cache_translation(cache_key, translation, source_lang, target_lang)
         
         return translation
+    
+    try:
+        # Concurrent requests for the same prompt share one upstream call
+        flight_key = prompt_key(DEFAULT_MODEL, build_translation_messages(text, target_lang))
+        return await TRANSLATION_FLIGHTS.do(flight_key, translate_and_cache)
         
     except Exception as e:
         print(f"Translation error: {e}")
         return None
 
-def translate_text_enhanced(text: str, target_lang: str, source_lang: str = "en") -> Dict:
+async def stream_segment(segment: str, target_lang: str, reference: tuple = None):
+    """
+    Yield the translation of one prose segment as the model produces it,
+    without leading or trailing whitespace. With code, links or URLs in it the
+    segment is translated protected like complete_protected, and buffered until
+    its placeholders are restored (retried unprotected if they are lost).
+    Raises like openrouter.stream_chat_completion.
+    """
+    def build_messages(content: str) -> list:
+        if reference is not None:
+            return build_reference_messages(content, target_lang, *reference)
+        return build_translation_messages(content, target_lang)
+    
+    def stream(messages: list):
+        return openrouter.stream_chat_completion(messages, DEFAULT_MODEL, timeout=30, title="Physical AI Textbook Translator")
+    
+    protected, placeholders = protect_markdown(segment)
+    if placeholders:
+        if not has_prose(protected):
+            yield segment
+            return
+        messages = build_messages(protected)
+        messages[0]["content"] += PLACEHOLDER_INSTRUCTION
+        translation = "".join([delta async for delta in stream(messages)])
+        restored = restore_markdown(translation.strip(), placeholders)
+        if restored is not None:
+            yield restored
+            return
+        print("Streamed translation: placeholders lost in translation, retrying unprotected")
+    
+    # Trailing whitespace is held back until more text follows it
+    started, held = False, ""
+    async for delta in stream(build_messages(segment)):
+        if not started:
+            delta = delta.lstrip()
+            started = bool(delta)
+        body = delta.rstrip()
+        if body:
+            yield held + body
+            held = delta[len(body):]
+        else:
+            held += delta
+
+async def stream_translation(text: str, target_lang: str, source_lang: str = "en"):
+    """
+    Yield the translation of text in pieces as the model produces them,
+    segment by segment like translate_text_enhanced: markup and code are
+    yielded as they are, segments the translation memory has seen are reused,
+    and each other segment is streamed from its own request (stream_segment).
+    A cached translation is yielded whole. Raises ValueError for an unsupported language.
+    """
+    if target_lang not in SUPPORTED_LANGUAGES:
+        raise ValueError(f"Unsupported target language: {target_lang}. Supported: {list(SUPPORTED_LANGUAGES.keys())}")
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError("API key not configured")
+    
+    cache_key = get_cache_key(text, target_lang)
+    cached_entry = await TRANSLATION_CACHE.get_async(cache_key)
+    if cached_entry:
+        yield cached_entry["translation"]
+        return
+    
+    segments = segment_markdown(text)
+    translations = {}
+    fresh = []
+    for translatable, segment in segments:
+        if not translatable:
+            yield segment
+            continue
+        if segment not in translations:
+            remembered = TRANSLATION_MEMORY.lookup(segment, target_lang)
+            if remembered is not None:
+                translations[segment] = remembered
+            else:
+                parts = []
+                async for delta in stream_segment(segment, target_lang, TRANSLATION_MEMORY.reference(segment, target_lang)):
+                    parts.append(delta)
+                    yield delta
+                translations[segment] = "".join(parts)
+                fresh.append((segment, translations[segment]))
+                continue
+        yield translations[segment]
+    
+    # Only remember and cache translations that finished streaming
+    await asyncio.to_thread(TRANSLATION_MEMORY.add_many, [pair for pair in fresh if pair[1]], target_lang)
+    if all(translations.values()):
+        await cache_translation(cache_key, join_segments(segments, translations), source_lang, target_lang)
+
+async def translate_text_enhanced(text: str, target_lang: str, source_lang: str = "en") -> Dict:
     """
     Enhanced translation function with multiple fallbacks and better error handling
     """
@@ -133,8 +332,8 @@ def translate_text_enhanced(text: str, target_lang: str, source_lang: str = "en"
     
     # Check cache first
     cache_key = get_cache_key(text, target_lang)
-    if cache_key in TRANSLATION_CACHE and is_cache_valid(TRANSLATION_CACHE[cache_key]):
-        cached_entry = TRANSLATION_CACHE[cache_key]
+    cached_entry = await TRANSLATION_CACHE.get_async(cache_key)
+    if cached_entry:
         result.update({
             "success": True,
             "translation": cached_entry["translation"],
@@ -142,10 +341,11 @@ def translate_text_enhanced(text: str, target_lang: str, source_lang: str = "en"
         })
         return result
     
-    # Try translation
-    translation = translate_with_openrouter(text, target_lang, source_lang)
+    # Translate segment by segment, reusing the translation memory
+    translation = (await translate_documents([text], target_lang, source_lang))[text]
     
     if translation:
+        await cache_translation(cache_key, translation, source_lang, target_lang)
         result.update({
             "success": True,
             "translation": translation,
@@ -156,35 +356,284 @@ def translate_text_enhanced(text: str, target_lang: str, source_lang: str = "en"
     
     return result
 
-def translate_multiple_texts(texts: List[str], target_lang: str, source_lang: str = "en") -> List[Dict]:
-    """Translate multiple texts in batch"""
-    results = []
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def make_packs(texts: List[str], max_tokens: int = None, max_segments: int = None) -> List[List[str]]:
+    """
+    Group texts into packs for a single translation request each.
+    A pack holds at most `max_segments` texts and `max_tokens` estimated tokens;
+    texts too long to share a request are returned as packs of one.
+    """
+    max_tokens = max_tokens or PACK_MAX_TOKENS
+    max_segments = max_segments or PACK_MAX_SEGMENTS
+    packs, current, current_tokens = [], [], 0
     for text in texts:
-        result = translate_text_enhanced(text, target_lang, source_lang)
-        results.append(result)
-    return results
+        tokens = estimate_tokens(text)
+        if tokens > PACK_SEGMENT_MAX_TOKENS:
+            packs.append([text])
+            continue
+        if current and (len(current) >= max_segments or current_tokens + tokens > max_tokens):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def build_packed_messages(texts: List[str], target_lang: str) -> list:
+    """Build the chat messages for translating several segments in one request"""
+    messages = build_translation_messages("", target_lang)
+    messages[0]["content"] += (
+        f"\n\nThe input contains {len(texts)} separate segments. Each segment starts with a marker line "
+        "such as <<<1>>>. Translate every segment on its own and copy each marker line unchanged "
+        "before its translation. Do not merge, split, reorder or skip segments, and add nothing else."
+    )
+    body = "\n".join(f"<<<{i}>>>\n{text}" for i, text in enumerate(texts, 1))
+    messages[1]["content"] = f"Segments to translate:\n\n{body}"
+    return messages
+
+def parse_packed_translation(output: str, count: int) -> Optional[List[str]]:
+    """
+    Split a packed response back into `count` translations, or None if the
+    markers are missing, duplicated, out of order or a segment came back empty.
+    """
+    parts = PACK_MARKER.split(output)
+    # parts = [preamble, "1", text1, "2", text2, ...]
+    if parts[0].strip() or len(parts) != 2 * count + 1:
+        return None
+    if [int(n) for n in parts[1::2]] != list(range(1, count + 1)):
+        return None
+    translations = [text.strip() for text in parts[2::2]]
+    return translations if all(translations) else None
+
+async def translate_packed(texts: List[str], target_lang: str, source_lang: str = "en") -> Optional[List[str]]:
+    """
+    Translate several short texts with one chat completion and cache each one.
+    Code, URLs and images are sent as placeholders, as in complete_protected.
+    Returns the translations in input order, or None if the request failed or
+    the response could not be split back into exactly one segment per text.
+    """
+    protected = [protect_markdown(text) for text in texts]
+    translations = [text if not has_prose(content) else None for text, (content, _) in zip(texts, protected)]
+    pending = [i for i, translation in enumerate(translations) if translation is None]
+    
+    if pending:
+        messages = build_packed_messages([protected[i][0] for i in pending], target_lang)
+        if any(protected[i][1] for i in pending):
+            messages[0]["content"] += PLACEHOLDER_INSTRUCTION
+        async def complete() -> str:
+            return await openrouter.chat_completion(
+                messages,
+                DEFAULT_MODEL,
+                timeout=60,
+                title="Physical AI Textbook Translator"
+            )
+        
+        try:
+            # Identical packs in flight (the same document translated by
+            # concurrent requests) share one upstream call
+            output = await TRANSLATION_FLIGHTS.do(prompt_key(DEFAULT_MODEL, messages), complete)
+        except Exception as e:
+            print(f"Packed translation error: {e}")
+            return None
+        
+        parsed = parse_packed_translation(output, len(pending))
+        if parsed is not None:
+            for i, translation in zip(pending, parsed):
+                translations[i] = restore_markdown(translation, protected[i][1])
+        if parsed is None or any(translations[i] is None for i in pending):
+            print(f"Packed translation of {len(pending)} segments did not split cleanly, retrying per segment")
+            return None
+    
+    for text, translation in zip(texts, translations):
+        await cache_translation(get_cache_key(text, target_lang), translation, source_lang, target_lang)
+    return translations
+
+async def translate_segments(texts: List[str], target_lang: str, source_lang: str = "en",
+                             concurrency: int = None, pack: bool = None,
+                             references: Dict[str, tuple] = None) -> Dict[str, Optional[str]]:
+    """
+    Translate unique segments with up to `concurrency` requests in flight (the
+    shared OpenRouter rate limiter still applies); None where one failed.
+    With packing (TRANSLATION_PACKING, on by default) uncached short segments
+    share requests, several per chat completion; a pack whose response does not
+    split back into one segment per text is retried segment by segment.
+    Segments in `references` ({text: (source, translation)}) are translated on
+    their own with the reference in the prompt (translate_with_reference).
+    """
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+    pack = PACKING_ENABLED if pack is None else pack
+    references = references or {}
+    
+    async def translate_one(text: str) -> Optional[str]:
+        async with semaphore:
+            if text in references:
+                return await translate_with_reference(text, target_lang, references[text], source_lang)
+            return await translate_with_openrouter(text, target_lang, source_lang)
+    
+    async def translate_group(group: List[str]) -> List[Optional[str]]:
+        if len(group) == 1:
+            return [await translate_one(group[0])]
+        async with semaphore:
+            translations = await translate_packed(group, target_lang, source_lang)
+        if translations is None:
+            # Outside the semaphore: the per-segment calls need it too
+            return await asyncio.gather(*(translate_one(text) for text in group))
+        return translations
+    
+    if pack and OPENROUTER_API_KEY:
+        # Cached segments are answered individually without a request
+        # (read through to the shared L2, not only this worker's L1)
+        cached = {text for text in texts if await TRANSLATION_CACHE.get_async(get_cache_key(text, target_lang)) is not None}
+        cached.update(references)
+        groups = [[text] for text in texts if text in cached]
+        groups += make_packs([text for text in texts if text not in cached])
+    else:
+        groups = [[text] for text in texts]
+    
+    with openrouter.rate_limited():
+        translated = await asyncio.gather(*(translate_group(group) for group in groups))
+    return {text: translation for group, results in zip(groups, translated) for text, translation in zip(group, results)}
+
+async def translate_documents(texts: List[str], target_lang: str, source_lang: str = "en",
+                              concurrency: int = None, pack: bool = None) -> Dict[str, Optional[str]]:
+    """
+    Translate markdown texts segment by segment (markdown_segments.segment_markdown).
+    Segments the translation memory has seen are reused; the rest of all texts'
+    segments are translated together, those it has a near-duplicate of with the
+    near-duplicate's translation as a reference.
+    Returns {text: translation}, None for a text with a failed segment.
+    """
+    segmented = {text: segment_markdown(text) for text in texts}
+    segments = list(dict.fromkeys(
+        segment for parts in segmented.values() for segment in translatable_texts(parts)
+    ))
+    
+    translations = {}
+    for segment in segments:
+        remembered = TRANSLATION_MEMORY.lookup(segment, target_lang)
+        if remembered is not None:
+            translations[segment] = remembered
+    
+    unseen = [segment for segment in segments if segment not in translations]
+    if unseen:
+        references = {}
+        for segment in unseen:
+            reference = TRANSLATION_MEMORY.reference(segment, target_lang)
+            if reference is not None:
+                references[segment] = reference
+        fresh = await translate_segments(unseen, target_lang, source_lang, concurrency, pack, references)
+        # SQLite writes, off the event loop
+        await asyncio.to_thread(
+            TRANSLATION_MEMORY.add_many,
+            [(segment, translation) for segment, translation in fresh.items() if translation],
+            target_lang
+        )
+        translations.update(fresh)
+    
+    return {
+        text: join_segments(parts, translations) if all(translations.get(segment) for segment in translatable_texts(parts)) else None
+        for text, parts in segmented.items()
+    }
+
+async def translate_multiple_texts(texts: List[str], target_lang: str, source_lang: str = "en",
+                                   concurrency: int = None, pack: bool = None) -> List[Dict]:
+    """
+    Translate multiple texts in batch.
+    Identical texts are translated once and results are returned in input order.
+    Segments of all uncached texts are translated together (translate_documents),
+    so they share the translation memory and, with packing, requests.
+    With pack=False each text is translated on its own instead, up to
+    `concurrency` at a time.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    pack = PACKING_ENABLED if pack is None else pack
+    
+    if not (pack and OPENROUTER_API_KEY and target_lang in SUPPORTED_LANGUAGES):
+        semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+        
+        async def translate_one(text: str) -> Dict:
+            async with semaphore:
+                return await translate_text_enhanced(text, target_lang, source_lang)
+        
+        with openrouter.rate_limited():
+            translated = await asyncio.gather(*(translate_one(text) for text in unique_texts))
+        by_text = dict(zip(unique_texts, translated))
+        return [dict(by_text[text]) for text in texts]
+    
+    by_text = {}
+    pending = []
+    for text in unique_texts:
+        cached_entry = await TRANSLATION_CACHE.get_async(get_cache_key(text, target_lang))
+        if cached_entry:
+            by_text[text] = translation_result(text, source_lang, target_lang, cached_entry["translation"], cached=True)
+        else:
+            pending.append(text)
+    
+    translations = await translate_documents(pending, target_lang, source_lang, concurrency, pack)
+    for text in pending:
+        translation = translations[text]
+        if translation:
+            await cache_translation(get_cache_key(text, target_lang), translation, source_lang, target_lang)
+        by_text[text] = translation_result(text, source_lang, target_lang, translation)
+    return [dict(by_text[text]) for text in texts]
+
+def translation_result(text: str, source_lang: str, target_lang: str, translation: Optional[str],
+                       cached: bool = False) -> Dict:
+    """Result dict in the shape returned by translate_text_enhanced"""
+    return {
+        "success": bool(translation),
+        "translation": translation,
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "original_text": text,
+        "cached": cached,
+        "error": None if translation else "Translation failed. Please try again later."
+    }
 
 def get_supported_languages() -> Dict[str, str]:
     """Get list of supported languages"""
     return SUPPORTED_LANGUAGES.copy()
 
 def clear_translation_cache():
-    """Clear translation cache"""
-    global TRANSLATION_CACHE
+    """Clear translation cache and translation memory"""
     TRANSLATION_CACHE.clear()
+    TRANSLATION_MEMORY.clear()
 
 def get_cache_stats() -> Dict:
     """Get translation cache statistics"""
-    valid_entries = sum(1 for entry in TRANSLATION_CACHE.values() if is_cache_valid(entry))
+    stats = TRANSLATION_CACHE.stats()
     return {
-        "total_entries": len(TRANSLATION_CACHE),
-        "valid_entries": valid_entries,
-        "expired_entries": len(TRANSLATION_CACHE) - valid_entries,
-        "expiry_hours": CACHE_EXPIRY_HOURS
+        "total_entries": stats["entries"] + stats["expired_entries"],
+        "valid_entries": stats["entries"],
+        "expiry_hours": CACHE_EXPIRY_HOURS,
+        **stats,
+        "translation_memory": TRANSLATION_MEMORY.stats(),
+        "single_flight": TRANSLATION_FLIGHTS.stats()
     }
 
 # Specialized translation functions for different content types
-def translate_technical_content(text: str, target_lang: str, domain: str = "general") -> Dict:
+async def translate_cached(cache_key: str, translate, source_lang: str, target_lang: str):
+    """
+    (translation, cached) for a translation variant: from the cache, or from
+    translate(), shared with identical requests already in flight and cached.
+    Raises what translate() raises.
+    """
+    cached_entry = await TRANSLATION_CACHE.get_async(cache_key)
+    if cached_entry:
+        return cached_entry["translation"], True
+    
+    async def translate_and_cache() -> str:
+        translation = await translate()
+        await cache_translation(cache_key, translation, source_lang, target_lang)
+        return translation
+    
+    return await TRANSLATION_FLIGHTS.do(cache_key, translate_and_cache), False
+
+async def translate_technical_content(text: str, target_lang: str, domain: str = "general") -> Dict:
     """Translate technical content with domain-specific terminology"""
     domain_prompts = {
         "robotics": "Translate this robotics/technical content. Keep technical terms like 'ROS', 'URDF', 'SLAM' in English if they don't have common Urdu equivalents. Use proper Urdu technical terminology where available.",
@@ -196,46 +645,37 @@ def translate_technical_content(text: str, target_lang: str, domain: str = "gene
     if not OPENROUTER_API_KEY:
         return {"success": False, "error": "API key not configured"}
     
-    system_prompt = domain_prompts.get(domain, domain_prompts["general"])
-    
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://physical-ai-textbook.com",
-        "X-Title": "Physical AI Technical Translator"
-    }
+    # Unknown domains use the general prompt, so they share its cache entries
+    domain_key = domain if domain in domain_prompts else "general"
+    system_prompt = domain_prompts[domain_key]
     
-    payload = {
-        "model": DEFAULT_MODEL,
-        "messages": [
+    def build_messages(content: str) -> list:
+        return [
             {
                 "role": "system",
                 "content": system_prompt
             },
             {
                 "role": "user",
-                "content": f"Text to translate:\n\n{text}"
+                "content": f"Text to translate:\n\n{content}"
             }
         ]
-    }
     
     try:
-        response = requests.post(
-            f"{OPENROUTER_BASE_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
+        translation, cached = await translate_cached(
+            get_composite_cache_key("technical", text, target_lang, domain=domain_key),
+            lambda: complete_protected(text, build_messages, title="Physical AI Technical Translator"),
+            "en",
+            target_lang
         )
-        response.raise_for_status()
-        data = response.json()
-        translation = data["choices"][0]["message"]["content"].strip()
         
         return {
             "success": True,
             "translation": translation,
             "domain": domain,
             "source_lang": "en",
-            "target_lang": target_lang
+            "target_lang": target_lang,
+            "cached": cached
         }
         
     except Exception as e:
@@ -244,7 +684,7 @@ def translate_technical_content(text: str, target_lang: str, domain: str = "gene
             "error": f"Translation failed: {str(e)}"
         }
 
-def translate_with_context(text: str, target_lang: str, context: str = "") -> Dict:
+async def translate_with_context(text: str, target_lang: str, context: str = "") -> Dict:
     """Translate text with additional context for better accuracy"""
     if not OPENROUTER_API_KEY:
         return {"success": False, "error": "API key not configured"}
@@ -257,44 +697,41 @@ def translate_with_context(text: str, target_lang: str, context: str = "") -> Di
     Maintain the original formatting and structure.
     """
     
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://physical-ai-textbook.com",
-        "X-Title": "Physical AI Context-Aware Translator"
-    }
+    messages = [
+        {
+            "role": "system",
+            "content": "You are an expert translator specializing in technical and educational content. Always consider the provided context for accurate translation."
+        },
+        {
+            "role": "user",
+            "content": context_prompt + f"\n\nText to translate:\n\n{text}"
+        }
+    ]
     
-    payload = {
-        "model": DEFAULT_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are an expert translator specializing in technical and educational content. Always consider the provided context for accurate translation."
-            },
-            {
-                "role": "user",
-                "content": context_prompt + f"\n\nText to translate:\n\n{text}"
-            }
-        ]
-    }
+    async def translate() -> str:
+        translation = await openrouter.chat_completion(
+            messages,
+            DEFAULT_MODEL,
+            timeout=30,
+            title="Physical AI Context-Aware Translator"
+        )
+        return translation.strip()
     
     try:
-        response = requests.post(
-            f"{OPENROUTER_BASE_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
+        translation, cached = await translate_cached(
+            get_composite_cache_key("context", text, target_lang, context=context),
+            translate,
+            "en",
+            target_lang
         )
-        response.raise_for_status()
-        data = response.json()
-        translation = data["choices"][0]["message"]["content"].strip()
         
         return {
             "success": True,
             "translation": translation,
             "context_used": bool(context),
             "source_lang": "en",
-            "target_lang": target_lang
+            "target_lang": target_lang,
+            "cached": cached
         }
         
     except Exception as e:
@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Segment-level translation memory: translations of single paragraphs, headings,
+# list items and table cells per target language, so editing one sentence of a
+# page only re-translates that sentence. Translations are reused verbatim only
+# for the same segment up to whitespace: a one-word edit ("can" -> "cannot")
+# can change the meaning. A near-duplicate - the same apart from case and
+# punctuation, or with character-trigram Dice similarity of at least
+# TRANSLATION_MEMORY_FUZZY_THRESHOLD - is returned by reference() instead, so
+# the edited segment is translated with the old translation as a guide.
+# Entries persist in SQLite at TRANSLATION_MEMORY_PATH, by default next to this
+# file whatever the working directory; set it to an empty string to keep them
+# in memory only.
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "translation_memory.db"))
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "100000"))
+TRANSLATION_MEMORY_FUZZY_THRESHOLD = float(os.getenv("TRANSLATION_MEMORY_FUZZY_THRESHOLD", "0.85"))
+# Trigram similarity is unreliable on short strings, which only match exactly
+FUZZY_MIN_CHARS = 20
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+def loose_key(text: str) -> str:
+    """Lowercased, without punctuation"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {loose_key(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TranslationMemory:
+    """
+    Per-language segment translations with exact lookup and near-duplicate
+    references, bounded to max_entries (oldest first out). Thread-safe;
+    optionally persisted to SQLite.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES,
+                 threshold: float = TRANSLATION_MEMORY_FUZZY_THRESHOLD):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.stats_counters = {"exact_hits": 0, "misses": 0, "references": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        # (lang, normalized source) -> (source, translation), oldest first
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+        self._loose: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self._grams: Dict[Tuple[str, str], Set[str]] = {}
+        # (lang, trigram) -> keys of entries containing it
+        self._index: Dict[Tuple[str, str], Set[Tuple[str, str]]] = {}
+        self._conn = None
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS translation_memory (
+                        target_lang TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        translation TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (target_lang, source)
+                    )
+                """)
+                self._conn.commit()
+                rows = self._conn.execute(
+                    "SELECT target_lang, source, translation FROM translation_memory ORDER BY updated_at DESC LIMIT ?",
+                    (max_entries,)
+                ).fetchall()
+                with self._lock:
+                    for target_lang, source, translation in reversed(rows):
+                        self._insert(target_lang, source, translation)
+            except sqlite3.Error as e:
+                print(f"Translation memory store unavailable ({path}), keeping it in memory only: {e}")
+                self._conn = None
+
+    def _insert(self, target_lang: str, source: str, translation: str):
+        key = (target_lang, normalize(source))
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (source, translation)
+        self._loose[(target_lang, loose_key(source))] = key
+        if len(key[1]) >= FUZZY_MIN_CHARS:
+            grams = trigrams(source)
+            self._grams[key] = grams
+            for gram in grams:
+                self._index.setdefault((target_lang, gram), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats_counters["evictions"] += 1
+
+    def _remove(self, key: Tuple[str, str]):
+        source, _ = self._entries.pop(key)
+        loose = (key[0], loose_key(source))
+        if self._loose.get(loose) == key:
+            del self._loose[loose]
+        for gram in self._grams.pop(key, ()):
+            postings = self._index[(key[0], gram)]
+            postings.discard(key)
+            if not postings:
+                del self._index[(key[0], gram)]
+
+    def _fuzzy(self, text: str, target_lang: str) -> Optional[Tuple[str, str]]:
+        grams = trigrams(text)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._index.get((target_lang, gram), ()))
+        best, best_score = None, self.threshold
+        for key, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._grams[key]))
+            if score >= best_score:
+                best, best_score = key, score
+        return self._entries[best] if best is not None else None
+
+    def lookup(self, text: str, target_lang: str) -> Optional[str]:
+        """Remembered translation of text (ignoring whitespace differences), else None"""
+        with self._lock:
+            entry = self._entries.get((target_lang, normalize(text)))
+            self.stats_counters["exact_hits" if entry is not None else "misses"] += 1
+            return entry[1] if entry is not None else None
+
+    def reference(self, text: str, target_lang: str) -> Optional[Tuple[str, str]]:
+        """
+        (source, translation) of a remembered near-duplicate of text, to guide
+        its translation; never a translation of text itself
+        """
+        with self._lock:
+            key = self._loose.get((target_lang, loose_key(text)))
+            found = self._entries[key] if key is not None else None
+            if found is None and len(normalize(text)) >= FUZZY_MIN_CHARS:
+                found = self._fuzzy(text, target_lang)
+            if found is not None:
+                self.stats_counters["references"] += 1
+            return found
+
+    def add(self, text: str, translation: str, target_lang: str):
+        self.add_many([(text, translation)], target_lang)
+
+    def add_many(self, pairs: List[Tuple[str, str]], target_lang: str):
+        with self._lock:
+            for text, translation in pairs:
+                self._insert(target_lang, text, translation)
+            self.stats_counters["writes"] += len(pairs)
+            if self._conn is not None and pairs:
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO translation_memory (target_lang, source, translation, updated_at) VALUES (?, ?, ?, ?)",
+                        [(target_lang, text, translation, time.time()) for text, translation in pairs]
+                    )
+                    self._trim_store()
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"Translation memory write failed: {e}")
+
+    def _trim_store(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM translation_memory WHERE rowid IN "
+                "(SELECT rowid FROM translation_memory ORDER BY updated_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loose.clear()
+            self._grams.clear()
+            self._index.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM translation_memory")
+                self._conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.stats_counters["exact_hits"]
+            lookups = hits + self.stats_counters["misses"]
+            return {
+                **self.stats_counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "fuzzy_threshold": self.threshold,
+                "path": self.path
+            }
@@ -1,9 +1,29 @@
-import React from 'react';
+import React, { useState } from 'react';
+import axios from 'axios';
+import ReactMarkdown from 'react-markdown';
+
+const API_BASE_URL = 'http://localhost:8000';
+
+const LEVELS = ['beginner', 'intermediate', 'expert'];
 
 const ChapterControls = () => {
-    const handlePersonalize = () => {
-        alert("Personalizing content based on your profile... (Implementation Pending)");
-        // Logic: Call API to rewrite/fetch personalized content
+    const [level, setLevel] = useState('beginner');
+    const [personalized, setPersonalized] = useState('');
+    const [isPersonalizing, setIsPersonalizing] = useState(false);
+
+    const handlePersonalize = async () => {
+        // The server reads the doc itself, so pre-warmed personalizations are hit
+        const docPath = window.location.pathname.replace(/^\/docs\/?/, '').replace(/\/$/, '') || 'intro';
+        setIsPersonalizing(true);
+        try {
+            const response = await axios.post(`${API_BASE_URL}/rag/personalize/doc`, { doc_path: docPath, level });
+            setPersonalized(response.data.personalized_markdown);
+        } catch (error) {
+            console.error('Personalization failed:', error);
+            alert('Could not personalize this chapter. Please try again later.');
+        } finally {
+            setIsPersonalizing(false);
+        }
     };
 
     const handleTranslate = () => {
@@ -12,13 +32,25 @@ const ChapterControls = () => {
     };
 
     return (
-        <div style={{ marginBottom: '20px', padding: '10px', background: '#f0f0f0', borderRadius: '8px', display: 'flex', gap: '10px' }}>
-            <button onClick={handlePersonalize} style={{ padding: '8px 12px', cursor: 'pointer', background: '#007bff', color: 'white', border: 'none', borderRadius: '4px' }}>
-                🔄 Personalize for Me
-            </button>
-            <button onClick={handleTranslate} style={{ padding: '8px 12px', cursor: 'pointer', background: '#28a745', color: 'white', border: 'none', borderRadius: '4px' }}>
-                🌐 Translate to Urdu
-            </button>
+        <div style={{ marginBottom: '20px' }}>
+            <div style={{ padding: '10px', background: '#f0f0f0', borderRadius: '8px', display: 'flex', gap: '10px' }}>
+                <select value={level} onChange={(e) => setLevel(e.target.value)} style={{ padding: '8px', borderRadius: '4px' }}>
+                    {LEVELS.map((l) => (
+                        <option key={l} value={l}>{l.charAt(0).toUpperCase() + l.slice(1)}</option>
+                    ))}
+                </select>
+                <button onClick={handlePersonalize} disabled={isPersonalizing} style={{ padding: '8px 12px', cursor: 'pointer', background: '#007bff', color: 'white', border: 'none', borderRadius: '4px' }}>
+                    {isPersonalizing ? '⏳ Personalizing...' : '🔄 Personalize for Me'}
+                </button>
+                <button onClick={handleTranslate} style={{ padding: '8px 12px', cursor: 'pointer', background: '#28a745', color: 'white', border: 'none', borderRadius: '4px' }}>
+                    🌐 Translate to Urdu
+                </button>
+            </div>
+            {personalized && (
+                <div className="markdown" style={{ marginTop: '10px', padding: '10px', border: '1px solid #ddd', borderRadius: '8px' }}>
+                    <ReactMarkdown>{personalized}</ReactMarkdown>
+                </div>
+            )}
         </div>
     );
 };
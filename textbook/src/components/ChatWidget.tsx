@@ -1,5 +1,4 @@
 import React, { useState, useEffect } from 'react';
-import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
 import { useAuth } from '../theme/AuthContext';
 
@@ -32,15 +31,50 @@ const ChatWidget = () => {
 
         try {
             // TODO: Replace with env variable
-            const response = await axios.post('http://localhost:8000/rag/ask', {
-                query: userMsg,
-                background: user?.background || "Software Engineer" // Default to Software Engineer if not set
+            const response = await fetch('http://localhost:8000/rag/ask/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    query: userMsg,
+                    background: user?.background || "Software Engineer" // Default to Software Engineer if not set
+                })
             });
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP ${response.status}`);
+            }
 
-            setMessages(prev => [...prev, { sender: 'bot', text: response.data.answer }]);
+            // Add an empty bot message and grow it as NDJSON delta events arrive
+            setMessages(prev => [...prev, { sender: 'bot', text: '' }]);
+            const appendToBot = (text: string) => setMessages(prev => {
+                const next = [...prev];
+                const last = next[next.length - 1];
+                next[next.length - 1] = { ...last, text: last.text + text };
+                return next;
+            });
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop() || '';
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.type === 'delta') {
+                        setIsLoading(false);
+                        appendToBot(event.content);
+                    } else if (event.type === 'error') {
+                        appendToBot(`\n\nError connnecting to brain: ${event.error}`);
+                    }
+                }
+            }
         } catch (error: any) {
             console.error("Chat Error:", error);
-            const errMsg = error.response?.data?.detail || error.message || "Unknown error";
+            const errMsg = error.message || "Unknown error";
             setMessages(prev => [...prev, { sender: 'bot', text: `Error connnecting to brain: ${errMsg}` }]);
         } finally {
             setIsLoading(false);
@@ -1,4 +1,6 @@
 import React, { useState, useEffect } from 'react';
+import { createRoot } from 'react-dom/client';
+import ReactMarkdown from 'react-markdown';
 import { useTranslation } from './TranslationProvider';
 import { FaLanguage, FaTimes, FaSpinner, FaCheck } from 'react-icons/fa';
 
@@ -11,7 +13,7 @@ export const PageTranslator: React.FC<PageTranslatorProps> = ({
   className = '',
   onTranslationComplete 
 }) => {
-  const { translateText, isLoading } = useTranslation();
+  const { translateText, getTranslatedDoc, isLoading } = useTranslation();
   const [isOpen, setIsOpen] = useState(false);
   const [targetLanguage, setTargetLanguage] = useState('ur');
   const [isTranslating, setIsTranslating] = useState(false);
@@ -42,6 +44,17 @@ export const PageTranslator: React.FC<PageTranslatorProps> = ({
     setTranslatedContent('');
 
     try {
+      // Use the pre-translated doc when there is one (markdown, rendered below)
+      const docPath = window.location.pathname.replace(/^\/docs\/?/, '').replace(/\/$/, '') || 'intro';
+      const pretranslated = await getTranslatedDoc(docPath, targetLanguage);
+      if (pretranslated) {
+        setTranslatedContent(pretranslated);
+        if (onTranslationComplete) {
+          onTranslationComplete(pretranslated);
+        }
+        return;
+      }
+
       // Split content into manageable chunks (paragraphs)
       const paragraphs = originalContent.split('\n\n').filter(p => p.trim().length > 0);
       const translatedParagraphs: string[] = [];
@@ -82,7 +95,18 @@ export const PageTranslator: React.FC<PageTranslatorProps> = ({
                           document.querySelector('article');
       
       if (mainContent) {
-        mainContent.innerHTML = `<div class="translated-content" style="direction: ${targetLanguage === 'ur' ? 'rtl' : 'ltr'}; text-align: ${targetLanguage === 'ur' ? 'right' : 'left'};">${translatedContent.replace(/\n\n/g, '</p><p>').replace(/^/, '<p>').replace(/$/, '</p>')}</div>`;
+        // Render the markdown with React rather than splicing it into innerHTML
+        const container = document.createElement('div');
+        mainContent.replaceChildren(container);
+        createRoot(container).render(
+          <div
+            className="translated-content markdown"
+            dir={targetLanguage === 'ur' ? 'rtl' : 'ltr'}
+            style={{ textAlign: targetLanguage === 'ur' ? 'right' : 'left' }}
+          >
+            <ReactMarkdown>{translatedContent}</ReactMarkdown>
+          </div>
+        );
       }
       handleClose();
     }
@@ -206,11 +230,11 @@ export const PageTranslator: React.FC<PageTranslatorProps> = ({
                   </div>
                   <div className="bg-gray-50 rounded-lg p-4 max-h-64 overflow-y-auto">
                     <div 
-                      className="text-gray-800 leading-relaxed"
+                      className="text-gray-800 leading-relaxed markdown"
                       dir={targetLanguage === 'ur' ? 'rtl' : 'ltr'}
                       style={{ textAlign: targetLanguage === 'ur' ? 'right' : 'left' }}
                     >
-                      {translatedContent}
+                      <ReactMarkdown>{translatedContent}</ReactMarkdown>
                     </div>
                   </div>
                   <p className="text-sm text-gray-500 mt-2">
@@ -16,6 +16,7 @@ interface TranslationContextType {
   translateBatch: (texts: string[], targetLang: string, sourceLang?: string) => Promise<TranslationResult[]>;
   translateTechnical: (text: string, targetLang: string, domain?: string) => Promise<TranslationResult>;
   translateWithContext: (text: string, targetLang: string, context: string) => Promise<TranslationResult>;
+  getTranslatedDoc: (docPath: string, targetLang: string) => Promise<string | null>;
   getSupportedLanguages: () => Promise<Record<string, string>>;
   getCacheStats: () => Promise<any>;
   clearCache: () => Promise<void>;
@@ -163,6 +164,20 @@ export const TranslationProvider: React.FC<{ children: React.ReactNode }> = ({ c
     }
   }, []);
 
+  const getTranslatedDoc = useCallback(async (
+    docPath: string,
+    targetLang: string
+  ): Promise<string | null> => {
+    // Pre-translated by backend/pretranslate.py, as markdown without frontmatter or MDX;
+    // a 404 means live translation is needed
+    try {
+      const response = await axios.get(`${API_BASE_URL}/rag/translate/doc/${targetLang}/${docPath}`);
+      return response.data.content;
+    } catch (err) {
+      return null;
+    }
+  }, []);
+
   const getSupportedLanguages = useCallback(async (): Promise<Record<string, string>> => {
     try {
       const response = await axios.get(`${API_BASE_URL}/rag/translate/languages`);
@@ -199,6 +214,7 @@ export const TranslationProvider: React.FC<{ children: React.ReactNode }> = ({ c
     translateBatch,
     translateTechnical,
     translateWithContext,
+    getTranslatedDoc,
     getSupportedLanguages,
     getCacheStats,
     clearCache,